@@ -0,0 +1,72 @@
+import time
+import logging
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AIMDLimiter:
+    """ Адаптивный лимит одновременных поисков (AIMD по p95 задержки)
+
+    Каждые window завершённых поисков считается p95: если он ниже цели и лимит
+    был выбран полностью - лимит +1, если выше цели - лимит * backoff.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, target_p95: float,
+                 window: int = 20, backoff: float = 0.75):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_p95 = target_p95
+        self.window = window
+        self.backoff = backoff
+        self._samples = deque(maxlen=window)
+        self._pending = 0
+        self._saturated = False
+        self.last_p95: Optional[float] = None
+        self.changed_at = time.monotonic()
+
+    def on_start(self, in_flight: int):
+        """ Запуск поиска: отмечаем, что лимит выбирался полностью """
+        if in_flight >= self.limit:
+            self._saturated = True
+
+    def on_finish(self, latency: float, failed: bool = False):
+        """ Завершение поиска (задержка в секундах) """
+        self._samples.append(latency)
+        self._pending += 1
+        if failed:
+            self._decrease("ошибка поиска")
+            return
+        if self._pending < self.window:
+            return
+
+        self._pending = 0
+        ordered = sorted(self._samples)
+        self.last_p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        if self.last_p95 > self.target_p95:
+            self._decrease(f"p95 {self.last_p95:.2f}с > {self.target_p95:.2f}с")
+        elif self._saturated and self.limit < self.maximum:
+            self.limit += 1
+            self.changed_at = time.monotonic()
+            logger.info(f"📈 Лимит поиска увеличен до {self.limit} (p95 {self.last_p95:.2f}с)")
+        self._saturated = False
+
+    def _decrease(self, reason: str):
+        new_limit = max(self.minimum, int(self.limit * self.backoff))
+        if new_limit != self.limit:
+            self.limit = new_limit
+            self.changed_at = time.monotonic()
+            logger.warning(f"📉 Лимит поиска снижен до {self.limit}: {reason}")
+        self._pending = 0
+        self._saturated = False
+
+    def get_stats(self) -> dict:
+        recent = sorted(self._samples)
+        return {
+            'limit': self.limit,
+            'p95': self.last_p95,
+            'p50': recent[len(recent) // 2] if recent else None,
+            'target_p95': self.target_p95
+        }
@@ -1,4 +1,5 @@
 import os
+import asyncio
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 from auth import user_manager
@@ -6,7 +7,14 @@ import logging
 from datetime import datetime
 from decorators import require_admin
 from pdf_indexer import pdf_indexer
-from keyboards import get_main_keyboard, get_admin_keyboard, get_limits_keyboard, get_users_keyboard, get_database_keyboard, get_settings_keyboard, get_confirm_keyboard, get_logging_keyboard
+from search_scheduler import search_scheduler
+from pdf_optimizer import pdf_optimizer
+from analytics import analytics
+from broadcast import broadcaster, describe_target, TARGET_ACTIVE, TARGET_EXPIRING, JOB_RUNNING
+from user_csv import parse_users_csv, export_users_csv
+from send_queue import outbound, PRIORITY_ADMIN
+from keyboards import get_main_keyboard, get_admin_keyboard, get_limits_keyboard, get_users_keyboard, get_database_keyboard, get_settings_keyboard, get_confirm_keyboard, get_logging_keyboard, get_users_page_keyboard, get_broadcast_target_keyboard, get_broadcast_confirm_keyboard, get_broadcast_jobs_keyboard
+from config import ADMIN_USERS_PAGE_SIZE, USER_IMPORT_MAX_BYTES
 
 logger = logging.getLogger(__name__)
 
@@ -21,13 +29,20 @@ AWAITING_RESUME_UPLOAD = 15
 AWAITING_NEW_ADMIN = 20
 AWAITING_NEW_ADMIN_CONFIRM = 21
 AWAITING_RESUMES_LIMIT = 22
+AWAITING_BROADCAST_TARGET = 23
+AWAITING_BROADCAST_TEXT = 24
+AWAITING_BROADCAST_CONFIRM = 25
+AWAITING_USERS_IMPORT = 26
+
+# Сколько ошибок разбора CSV показывать в отчете об импорте
+IMPORT_REPORT_ERRORS = 15
 
 
 @require_admin
 async def change_admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """ Панель смены администратора """
     current_user_id = update.effective_user.id
-    current_user = user_manager.get_user(current_user_id)
+    current_user = await user_manager.get_user_async(current_user_id)
 
     if not current_user or current_user['role'] != 'admin':
         await update.message.reply_text(
@@ -36,12 +51,11 @@ async def change_admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return ConversationHandler.END
 
-    users = user_manager.get_all_users()
-    admin_users = [u for u in users if u['role'] == 'admin']
+    stats = await user_manager.get_user_stats_async()
 
     message = (
         "👑 Смена администратора\n\n"
-        f"📊 Текущие администраторы: {len(admin_users)}\n"
+        f"📊 Текущие администраторы: {stats['admins']}\n"
         f"🆔 Ваш ID: {current_user_id}\n\n"
         "⚠️ Внимание:\n"
         "• Вы потеряете права администратора после смены\n"
@@ -82,7 +96,7 @@ async def handle_new_admin_input(update: Update, context: ContextTypes.DEFAULT_T
             )
             return AWAITING_NEW_ADMIN
 
-        current_user = user_manager.get_user(current_user_id)
+        current_user = await user_manager.get_user_async(current_user_id)
         if not current_user or current_user['role'] != 'admin':
             await update.message.reply_text(
                 "❌ Ошибка прав доступа!\n\n"
@@ -90,7 +104,7 @@ async def handle_new_admin_input(update: Update, context: ContextTypes.DEFAULT_T
             )
             return ConversationHandler.END
 
-        new_user = user_manager.get_user(new_admin_id)
+        new_user = await user_manager.get_user_async(new_admin_id)
 
         if not new_user:
             await update.message.reply_text(
@@ -160,7 +174,7 @@ async def handle_admin_change_confirmation(update: Update, context: ContextTypes
 
     if text == '✅ Подтвердить смену админа':
         try:
-            current_user = user_manager.get_user(current_admin_id)
+            current_user = await user_manager.get_user_async(current_admin_id)
             if not current_user or current_user['role'] != 'admin':
                 await update.message.reply_text(
                     "❌ Ошибка! Вы больше не являетесь администратором.",
@@ -168,7 +182,7 @@ async def handle_admin_change_confirmation(update: Update, context: ContextTypes
                 )
                 return ConversationHandler.END
 
-            new_user = user_manager.get_user(new_admin_id)
+            new_user = await user_manager.get_user_async(new_admin_id)
             if not new_user:
                 await update.message.reply_text(
                     f"❌ Ошибка! Пользователь с ID {new_admin_id} не найден.",
@@ -176,8 +190,8 @@ async def handle_admin_change_confirmation(update: Update, context: ContextTypes
                 )
                 return ConversationHandler.END
 
-            user_manager.update_user_role(current_admin_id, 'recruiter')
-            user_manager.update_user_role(new_admin_id, 'admin')
+            await user_manager.update_user_role_async(current_admin_id, 'recruiter')
+            await user_manager.update_user_role_async(new_admin_id, 'admin')
 
             logger.info(
                 f"Администратор изменен: {current_admin_id} -> {new_admin_id} "
@@ -241,8 +255,10 @@ async def handle_resume_upload(update: Update, context: ContextTypes.DEFAULT_TYP
             await file.download_to_drive(file_path)
 
             try:
-                success = pdf_indexer._index_single_pdf(document.file_name)
+                success = await asyncio.to_thread(pdf_indexer._index_single_pdf, document.file_name)
                 if success:
+                    pdf_indexer.schedule_derived_refresh()
+                    pdf_optimizer.schedule()
                     await update.message.reply_text(
                         f"✅ Резюме {document.file_name} загружено и проиндексировано!\n"
                         f"💡 Файл доступен для поиска сразу"
@@ -276,13 +292,11 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message is None:
         return
 
-    users = user_manager.get_all_users()
-    active_users = [u for u in users if u['is_active']]
-    total_requests_today = sum(u['requests_today'] for u in active_users)
+    stats = await user_manager.get_user_stats_async()
 
     stats_text = (
-        f"👥 Активных пользователей: {len(active_users)}\n"
-        f"📊 Запросов сегодня: {total_requests_today}\n"
+        f"👥 Активных пользователей: {stats['active']}\n"
+        f"📊 Запросов сегодня: {stats['requests_today']}\n"
         f"🕒 Время сервера: {datetime.now().strftime('%H:%M %d.%m.%Y')}"
     )
 
@@ -292,46 +306,81 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+USERS_LIST_STATUSES = {
+    '✅ Активные': 'active',
+    '⏰ Истек срок': 'expired',
+    '❌ Деактивированные': 'deactivated',
+}
+
+USERS_PAGE_TITLES = {
+    'active': ("✅ Активные пользователи:\n\n", "✅ Активные пользователи\n\nНет активных пользователей."),
+    'expired': ("⏰ Пользователи с истекшим сроком доступа:\n\n"
+                "💡 Эти пользователи могут запросить продление доступа\n\n",
+                "⏰ Пользователи с истекшим сроком\n\nНет пользователей с истекшим сроком доступа."),
+    'deactivated': ("❌ Деактивированные пользователи:\n\n"
+                    "💡 Заблокированы администратором. Требуется ручная активация.\n\n",
+                    "❌ Деактивированные пользователи\n\nНет деактивированных пользователей."),
+}
+
+
 @require_admin
 async def show_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """ Показать расширенный список пользователей """
     if update.message is None:
         return
 
-    users = user_manager.get_all_users()
-
-    if not users:
-        await update.message.reply_text("📭 Список пользователей пуст.")
+    status = USERS_LIST_STATUSES.get(update.message.text.strip())
+    if status is None:
+        await _show_users_overview(update, get_users_keyboard())
         return
 
-    active_users = [u for u in users if u.get('status') == 'active']
-    expired_users = [u for u in users if u.get('status') == 'expired']
-    deactivated_users = [u for u in users if u.get('status') == 'deactivated']
+    users, has_prev, has_next = await user_manager.get_users_page_async(status, limit=ADMIN_USERS_PAGE_SIZE)
+    text, keyboard = _render_users_page(status, users, has_prev, has_next)
+    await update.message.reply_text(text, reply_markup=keyboard)
 
-    categories_keyboard = get_users_keyboard()
-    text = update.message.text.strip()
 
-    if text == '✅ Активные':
-        await _show_active_users(update, active_users)
-    elif text == '⏰ Истек срок':
-        await _show_expired_users(update, expired_users)
-    elif text == '❌ Деактивированные':
-        await _show_deactivated_users(update, deactivated_users)
+@require_admin
+async def show_users_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Листание списка пользователей (callback users_page:<статус>:<prev|next>:<id>) """
+    query = update.callback_query
+    await query.answer()
+
+    _, status, direction, cursor_id = query.data.split(':')
+    if status not in USERS_PAGE_TITLES:
+        return
+    cursor_id = int(cursor_id)
+    if direction == 'prev':
+        page = await user_manager.get_users_page_async(status, before_id=cursor_id, limit=ADMIN_USERS_PAGE_SIZE)
     else:
-        await _show_users_overview(update, active_users, expired_users, deactivated_users, categories_keyboard)
+        page = await user_manager.get_users_page_async(status, after_id=cursor_id, limit=ADMIN_USERS_PAGE_SIZE)
+
+    text, keyboard = _render_users_page(status, *page)
+    await query.edit_message_text(text, reply_markup=keyboard)
+
+
+def _render_users_page(status: str, users: list, has_prev: bool, has_next: bool):
+    """ Текст страницы списка и кнопки листания """
+    header, empty_text = USERS_PAGE_TITLES[status]
+    if not users:
+        return empty_text, None
 
+    format_user = _format_active_user if status == 'active' else _format_inactive_user
+    text = header + "".join(format_user(user) for user in users)
+    keyboard = get_users_page_keyboard(status, users[0]['telegram_id'], users[-1]['telegram_id'], has_prev, has_next)
+    return text, keyboard
 
-async def _show_users_overview(update: Update, active_users: list, expired_users: list, deactivated_users: list, keyboard):
+
+async def _show_users_overview(update: Update, keyboard):
     """ Общий обзор пользователей """
-    total_users = len(active_users) + len(expired_users) + len(deactivated_users)
+    stats = await user_manager.get_user_stats_async()
 
     message = (
         "👥 Обзор пользователей\n\n"
         f"📊 Статистика по статусам:\n"
-        f"• ✅ Активные: {len(active_users)}\n"
-        f"• ⏰ Истек срок: {len(expired_users)}\n"
-        f"• ❌ Деактивированные: {len(deactivated_users)}\n"
-        f"• 📈 Всего в базе: {total_users}\n\n"
+        f"• ✅ Активные: {stats['active']}\n"
+        f"• ⏰ Истек срок: {stats['expired']}\n"
+        f"• ❌ Деактивированные: {stats['deactivated']}\n"
+        f"• 📈 Всего в базе: {stats['total']}\n\n"
 
         "💡 Выберите категорию для просмотра:\n"
         "• Активные - текущие пользователи с доступом\n"
@@ -347,87 +396,38 @@ async def _show_users_overview(update: Update, active_users: list, expired_users
     await update.message.reply_text(message, reply_markup=keyboard)
 
 
-async def _show_active_users(update: Update, active_users: list):
-    """ Показать активных пользователей """
-    if not active_users:
-        await update.message.reply_text("✅ Активные пользователи\n\nНет активных пользователей.")
-        return
-
-    message = "✅ Активные пользователи:\n\n"
-
-    for i, user in enumerate(active_users, 1):
-        role = "👑 Админ" if user['role'] == 'admin' else "👤 Рекрутер"
-        days_left = f" ({user['days_remaining']}д.)" if user['days_remaining'] is not None else " (∞)"
-        requests = f"{user['requests_today']}/{user['daily_requests_limit'] if user['daily_requests_limit'] > 0 else '∞'}"
-        resumes = f"{user['resumes_today']}/{user['resumes_limit'] if user['resumes_limit'] > 0 else '∞'}"
+def _format_last_login(user: dict) -> str:
+    return "никогда" if not user['last_login'] else datetime.fromisoformat(user['last_login']).strftime('%d.%m.%Y')
 
-        last_login = "никогда" if not user['last_login'] else datetime.fromisoformat(user['last_login']).strftime('%d.%m.%Y')
 
-        message += (
-            f"{i}. {user['display_name'] or 'Без имени'}\n"
-            f"   🆔 ID: {user['telegram_id']} • @{user['username'] if user['username'] and user['username'].strip() else "нет"}\n"
-            f"   {role} • 📊 Запросы: {requests} • 📄 Резюме: {resumes}{days_left}\n"
-            f"   📅 Последний вход: {last_login}\n\n"
-        )
-
-    await update.message.reply_text(message)
-
-
-async def _show_expired_users(update: Update, expired_users: list):
-    """ Показать пользователей с истекшим сроком """
-    if not expired_users:
-        await update.message.reply_text(
-            "⏰ Пользователи с истекшим сроком\n\nНет пользователей с истекшим сроком доступа.")
-        return
-
-    message = "⏰ Пользователи с истекшим сроком доступа:\n\n"
-    message += "💡 Эти пользователи могут запросить продление доступа\n\n"
-
-    for i, user in enumerate(expired_users, 1):
-        role = "👑 Админ" if user['role'] == 'admin' else "👤 Рекрутер"
-        requests_total = user['requests_today']
-        resumes_total = user['resumes_total']
-        last_login = "никогда" if not user['last_login'] else datetime.fromisoformat(user['last_login']).strftime(
-            '%d.%m.%Y')
-        created_date = datetime.fromisoformat(user['created_at']).strftime('%d.%m.%Y')
-
-        message += (
-            f"{i}. {user['display_name'] or 'Без имени'}\n"
-            f"   🆔 ID: {user['telegram_id']} • @{user['username'] or 'нет'}\n"
-            f"   {role} • 📅 Регистрация: {created_date}\n"
-            f"   📊 Всего запросов: {requests_total} • 📄 Всего резюме: {resumes_total}\n"
-            f"   📅 Последний вход: {last_login}\n\n"
-        )
-
-    await update.message.reply_text(message)
-
-
-async def _show_deactivated_users(update: Update, deactivated_users: list):
-    """ Показать деактивированных пользователей """
-    if not deactivated_users:
-        await update.message.reply_text("❌ Деактивированные пользователи\n\nНет деактивированных пользователей.")
-        return
+def _format_active_user(user: dict) -> str:
+    """ Строка активного пользователя """
+    role = "👑 Админ" if user['role'] == 'admin' else "👤 Рекрутер"
+    days_left = f" ({user['days_remaining']}д.)" if user['days_remaining'] is not None else " (∞)"
+    requests = f"{user['requests_today']}/{user['daily_requests_limit'] if user['daily_requests_limit'] > 0 else '∞'}"
+    resumes = f"{user['resumes_today']}/{user['resumes_limit'] if user['resumes_limit'] > 0 else '∞'}"
+    username = user['username'] if user['username'] and user['username'].strip() else 'нет'
 
-    message = "❌ Деактивированные пользователи:\n\n"
-    message += "💡 Заблокированы администратором. Требуется ручная активация.\n\n"
+    return (
+        f"• {user['display_name'] or 'Без имени'}\n"
+        f"   🆔 ID: {user['telegram_id']} • @{username}\n"
+        f"   {role} • 📊 Запросы: {requests} • 📄 Резюме: {resumes}{days_left}\n"
+        f"   📅 Последний вход: {_format_last_login(user)}\n\n"
+    )
 
-    for i, user in enumerate(deactivated_users, 1):
-        role = "👑 Админ" if user['role'] == 'admin' else "👤 Рекрутер"
-        requests_total = user['requests_today']
-        resumes_total = user['resumes_total']
-        last_login = "никогда" if not user['last_login'] else datetime.fromisoformat(user['last_login']).strftime(
-            '%d.%m.%Y')
-        created_date = datetime.fromisoformat(user['created_at']).strftime('%d.%m.%Y')
 
-        message += (
-            f"{i}. {user['display_name'] or 'Без имени'}\n"
-            f"   🆔 ID: {user['telegram_id']} • @{user['username'] or 'нет'}\n"
-            f"   {role} • 📅 Регистрация: {created_date}\n"
-            f"   📊 Всего запросов: {requests_total} • 📄 Всего резюме: {resumes_total}\n"
-            f"   📅 Последний вход: {last_login}\n\n"
-        )
+def _format_inactive_user(user: dict) -> str:
+    """ Строка пользователя с истекшим сроком или деактивированного """
+    role = "👑 Админ" if user['role'] == 'admin' else "👤 Рекрутер"
+    created_date = datetime.fromisoformat(user['created_at']).strftime('%d.%m.%Y')
 
-    await update.message.reply_text(message)
+    return (
+        f"• {user['display_name'] or 'Без имени'}\n"
+        f"   🆔 ID: {user['telegram_id']} • @{user['username'] or 'нет'}\n"
+        f"   {role} • 📅 Регистрация: {created_date}\n"
+        f"   📊 Запросов сегодня: {user['requests_today']} • 📄 Всего резюме: {user['resumes_total']}\n"
+        f"   📅 Последний вход: {_format_last_login(user)}\n\n"
+    )
 
 
 @require_admin
@@ -532,12 +532,12 @@ async def handle_resumes_limit_input(update: Update, context: ContextTypes.DEFAU
             await update.message.reply_text("❌ Лимит резюме не может быть отрицательным.")
             return AWAITING_RESUMES_LIMIT
 
-        user = user_manager.get_user(user_id)
+        user = await user_manager.get_user_async(user_id)
         if not user:
             await update.message.reply_text("❌ Пользователь не найден.")
             return AWAITING_RESUMES_LIMIT
 
-        if user_manager.update_resumes_limit(user_id, resumes_limit):
+        if await user_manager.update_resumes_limit_async(user_id, resumes_limit):
             if resumes_limit == 0:
                 message = f"✅ Лимит резюме для пользователя {user_id} установлен: безлимит"
             else:
@@ -590,7 +590,7 @@ async def handle_limits_input(update: Update, context: ContextTypes.DEFAULT_TYPE
         user_id = int(parts[0])
         value = int(parts[1])
 
-        user = user_manager.get_user(user_id)
+        user = await user_manager.get_user_async(user_id)
         if not user:
             await update.message.reply_text("❌ Пользователь не найден.")
             return AWAITING_LIMITS_INPUT
@@ -602,7 +602,7 @@ async def handle_limits_input(update: Update, context: ContextTypes.DEFAULT_TYPE
                 await update.message.reply_text("❌ Лимит запросов не может быть отрицательным.")
                 return AWAITING_LIMITS_INPUT
 
-            user_manager.update_user_limits(user_id, daily_requests_limit=value)
+            await user_manager.update_user_limits_async(user_id, daily_requests_limit=value)
             if value == 0:
                 message = f"✅ Лимит запросов для пользователя {user_id} установлен: безлимит"
             else:
@@ -613,7 +613,7 @@ async def handle_limits_input(update: Update, context: ContextTypes.DEFAULT_TYPE
                 await update.message.reply_text("❌ Срок доступа не может быть отрицательным.")
                 return AWAITING_LIMITS_INPUT
 
-            user_manager.update_user_limits(user_id, access_days=value)
+            await user_manager.update_user_limits_async(user_id, access_days=value)
             if value == 0:
                 message = f"✅ Срок доступа для пользователя {user_id} установлен: бессрочный"
             else:
@@ -633,12 +633,7 @@ async def handle_limits_input(update: Update, context: ContextTypes.DEFAULT_TYPE
 @require_admin
 async def reset_counters(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """ Сброс счетчиков запросов """
-    users = user_manager.get_all_users()
-    reset_count = 0
-
-    for user in users:
-        if user_manager.reset_daily_requests(user['telegram_id']):
-            reset_count += 1
+    reset_count = await user_manager.reset_all_daily_requests_async()
 
     await update.message.reply_text(
         f"🔄 Сброшены счетчики запросов для {reset_count} пользователей",
@@ -664,71 +659,90 @@ async def clear_search_cache(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
 
 
-@require_admin
-async def show_system_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """ Расширенная статистика системы """
-    users = user_manager.get_all_users()
+def _format_latency(seconds) -> str:
+    """ Задержка для статистики ('—', если замеров еще нет) """
+    return f"{seconds:.2f}с" if seconds is not None else "—"
 
-    active_users = [u for u in users if u.get('status') == 'active']
-    expired_users = [u for u in users if u.get('status') == 'expired']
-    deactivated_users = [u for u in users if u.get('status') == 'deactivated']
 
-    total_requests_today = sum(u.get('requests_today', 0) for u in users)
-    total_resumes_today = sum(u.get('resumes_today', 0) for u in users)
-    total_resumes_month = sum(u.get('resumes_this_month', 0) for u in users)
-    total_resumes_all = sum(u.get('resumes_total', 0) for u in users)
+def _format_ms(milliseconds) -> str:
+    return _format_latency(milliseconds / 1000 if milliseconds is not None else None)
 
-    limited_users = [u for u in active_users if u.get('daily_requests_limit', 0) > 0]
-    unlimited_users = [u for u in active_users if u.get('daily_requests_limit', 0) == 0]
+
+@require_admin
+async def show_system_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Расширенная статистика системы """
+    stats = await user_manager.get_user_stats_async()
+    top_users = await user_manager.get_top_users_today_async(limit=10)
+    detailed_users, _, _ = await user_manager.get_users_page_async('active', limit=8)
+    search_stats = search_scheduler.get_stats()
+    optimized_stats = await pdf_optimizer.get_stats_async()
+    usage = await analytics.get_summary_async()
 
     message = (
         "📈 Расширенная статистика системы\n\n"
         f"👥 Пользователи:\n"
-        f"• ✅ Активные: {len(active_users)}\n"
-        f"• ⏰ Истек срок: {len(expired_users)}\n"
-        f"• ❌ Деактивированные: {len(deactivated_users)}\n"
-        f"• 📊 Всего в базе: {len(users)}\n\n"
+        f"• ✅ Активные: {stats['active']}\n"
+        f"• ⏰ Истек срок: {stats['expired']}\n"
+        f"• ❌ Деактивированные: {stats['deactivated']}\n"
+        f"• 📊 Всего в базе: {stats['total']}\n\n"
 
         f"📊 Активность за сегодня:\n"
-        f"• Запросы: {total_requests_today}\n"
-        f"• Резюме: {total_resumes_today}\n\n"
+        f"• Запросы: {stats['requests_today']}\n"
+        f"• Резюме: {stats['resumes_today']}\n\n"
 
         f"📈 Резюме за все время:\n"
-        f"• За месяц: {total_resumes_month}\n"
-        f"• Всего: {total_resumes_all}\n\n"
+        f"• За месяц: {stats['resumes_this_month']}\n"
+        f"• Всего: {stats['resumes_total']}\n\n"
+
+        f"🎯 Лимиты: {stats['limited']} с лимитом, {stats['unlimited']} безлимитных\n\n"
 
-        f"🎯 Лимиты: {len(limited_users)} с лимитом, {len(unlimited_users)} безлимитных\n\n"
+        f"🔍 Поиск: лимит {search_stats['limit']} одновременных, "
+        f"выполняется {search_stats['running']}, в очереди {search_stats['queued']}\n"
+        f"⏱ Задержка: p50 {_format_latency(search_stats['p50'])}, p95 {_format_latency(search_stats['p95'])} "
+        f"(цель {search_stats['target_p95']:.1f}с)\n\n"
+
+        f"🗜 Сжатые PDF: {optimized_stats['files']}, "
+        f"сэкономлено {optimized_stats['saved_bytes'] / 1024 / 1024:.1f}MB\n\n"
+
+        f"📊 За 24 часа: поисков {usage['searches_24h']} (без результата {usage['empty_24h']}), "
+        f"средняя задержка {_format_ms(usage['avg_latency_ms'])}, максимум {_format_ms(usage['max_latency_ms'])}\n"
+        f"📤 Отправлено резюме: {usage['downloads_24h']} ({usage['bytes_24h'] / 1024 / 1024:.1f}MB), "
+        f"ошибок {usage['failed_24h']}, среднее время отправки {_format_ms(usage['avg_send_ms'])}\n"
+        f"⏰ Пиковый час за неделю: {usage['peak_hour'] or '—'} ({usage['peak_hour_load']} событий), "
+        f"пользователей сегодня: {usage['active_users_today']}\n\n"
 
         f"🕒 Время сервера: {datetime.now().strftime('%H:%M %d.%m.%Y')}\n\n"
     )
 
-    if active_users:
+    if top_users:
         message += "🏆 Топ активных пользователей сегодня:\n"
-        active_users_sorted = sorted(active_users, key=lambda x: x.get('resumes_today', 0), reverse=True)
 
-        for i, user in enumerate(active_users_sorted, 1):
-            resumes = user.get('resumes_today', 0)
-            requests = user.get('requests_today', 0)
-            user_name = user.get('username', 'Без имени')
-            message += f"{i}. @{user_name} - {requests} запросов, {resumes} резюме\n"
+        for i, user in enumerate(top_users, 1):
+            message += (f"{i}. @{user['username'] or 'Без имени'} - "
+                        f"{user['requests_today']} запросов, {user['resumes_today']} резюме\n")
 
         message += "\n"
-    else:
+    elif not stats['active']:
         message += "ℹ️ Нет активных пользователей\n\n"
 
-    if active_users:
+    if usage['top_files']:
+        message += "📄 Популярные резюме за неделю:\n"
+        for filename, downloads in usage['top_files']:
+            message += f"• {filename} - {downloads}\n"
+        message += "\n"
+
+    if detailed_users:
         message += "📋 Детальная статистика пользователей:\n"
 
-        for user in active_users[:8]:
-            days_left = f" ({user.get('days_remaining', 0)}д.)" if user.get('days_remaining') is not None else ""
-            limit_display = user.get('daily_requests_limit', 0) if user.get('daily_requests_limit', 0) > 0 else '∞'
-            resumes_limit_display = user.get('resumes_limit', 0) if user.get('resumes_limit', 0) > 0 else '∞'
-            user_name = user.get('username', 'Без имени')
+        for user in detailed_users:
+            days_left = f" ({user['days_remaining']}д.)" if user['days_remaining'] is not None else ""
+            limit_display = user['daily_requests_limit'] if user['daily_requests_limit'] > 0 else '∞'
+            resumes_limit_display = user['resumes_limit'] if user['resumes_limit'] > 0 else '∞'
 
             message += (
-                f"• @{user_name} - "
-                f"Запросы: {user.get('requests_today', 0)}/{limit_display} | "
-                f"Резюме: {user.get('resumes_today', 0)}/{resumes_limit_display}{days_left}\n"
+                f"• @{user['username'] or 'Без имени'} - "
+                f"Запросы: {user['requests_today']}/{limit_display} | "
+                f"Резюме: {user['resumes_today']}/{resumes_limit_display}{days_left}\n"
             )
 
     if len(message) > 4000:
@@ -781,11 +795,11 @@ async def handle_new_user_with_limits(update: Update, context: ContextTypes.DEFA
             await update.message.reply_text("❌ Лимиты не могут быть отрицательными.")
             return AWAITING_NEW_USER_DATA
 
-        existing_user = user_manager.get_user(telegram_id)
+        existing_user = await user_manager.get_user_async(telegram_id)
         if existing_user:
-            user_manager.activate_user(telegram_id, access_days)
-            user_manager.update_user_limits(telegram_id, daily_requests_limit=daily_limit)
-            user_manager.update_resumes_limit(telegram_id, resumes_limit)
+            await user_manager.activate_user_async(telegram_id, access_days)
+            await user_manager.update_user_limits_async(telegram_id, daily_requests_limit=daily_limit)
+            await user_manager.update_resumes_limit_async(telegram_id, resumes_limit)
 
             limit_text = "безлимит" if daily_limit == 0 else f"{daily_limit} в день"
             access_text = "бессрочно" if access_days == 0 else f"{access_days} дней"
@@ -801,7 +815,7 @@ async def handle_new_user_with_limits(update: Update, context: ContextTypes.DEFA
                 reply_markup=get_admin_keyboard()
             )
         else:
-            if user_manager.add_user_by_admin(
+            if await user_manager.add_user_by_admin_async(
                 telegram_id=telegram_id,
                 daily_requests_limit=daily_limit,
                 access_days=access_days,
@@ -855,7 +869,7 @@ async def handle_deactivate_id_input(update: Update, context: ContextTypes.DEFAU
     try:
         user_id = int(text)
 
-        if user_manager.deactivate_user(user_id):
+        if await user_manager.deactivate_user_async(user_id):
             await update.message.reply_text(
                 f"✅ Пользователь {user_id} деактивирован!\n\n"
                 f"Доступ к боту заблокирован.",
@@ -897,7 +911,7 @@ async def handle_activate_id_input(update: Update, context: ContextTypes.DEFAULT
     try:
         user_id = int(text)
 
-        if user_manager.activate_user(user_id):
+        if await user_manager.activate_user_async(user_id):
             await update.message.reply_text(
                 f"✅ Пользователь {user_id} активирован!\n\n"
                 f"Доступ к боту восстановлен.",
@@ -939,13 +953,13 @@ async def handle_delete_id_input(update: Update, context: ContextTypes.DEFAULT_T
 
     try:
         user_id = int(text)
-        user = user_manager.get_user(user_id)
+        user = await user_manager.get_user_async(user_id)
 
         if not user:
             await update.message.reply_text("❌ Пользователь не найден.")
             return AWAITING_DELETE_ID
 
-        success = user_manager.delete_user(user_id)
+        success = await user_manager.delete_user_async(user_id)
 
         if success:
             await update.message.reply_text(
@@ -963,6 +977,119 @@ async def handle_delete_id_input(update: Update, context: ContextTypes.DEFAULT_T
         return AWAITING_DELETE_ID
 
 
+@require_admin
+async def import_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Импорт пользователей из CSV файла """
+    await update.message.reply_text(
+        "📥 Импорт пользователей из CSV\n\n"
+        "Отправьте CSV файл с колонками:\n"
+        "`telegram_id,daily_requests_limit,access_days,resumes_limit,username,first_name,last_name`\n\n"
+        "💡 Пояснения:\n"
+        "• Обязателен только telegram_id, порядок колонок задается заголовком\n"
+        "• Без заголовка колонки идут в этом же порядке: ID ЛимитЗапросов ДниДоступа ЛимитРезюме ...\n"
+        "• Пустые лимиты: 10 запросов в день, 30 дней, резюме без лимита (0 = безлимит/бессрочно)\n"
+        "• Существующим пользователям обновляются лимиты и срок, они активируются\n"
+        "• Строки с ошибками пропускаются, остальные применяются одной транзакцией\n\n"
+        "❌ 'отмена' - отменить импорт"
+    )
+    return AWAITING_USERS_IMPORT
+
+
+@require_admin
+async def handle_users_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Обработка CSV файла импорта: проверка, одна транзакция, отчет """
+    if update.message is None:
+        return ConversationHandler.END
+
+    document = update.message.document
+    if document is None:
+        text = (update.message.text or "").strip()
+        if text.lower() in ['отмена', 'cancel']:
+            await update.message.reply_text("❌ Импорт отменен.", reply_markup=get_users_keyboard())
+            return ConversationHandler.END
+        await update.message.reply_text("📥 Отправьте CSV файл или введите 'отмена' для выхода.")
+        return AWAITING_USERS_IMPORT
+
+    if not (document.file_name or "").lower().endswith('.csv'):
+        await update.message.reply_text("❌ Пожалуйста, отправьте файл с расширением .csv")
+        return AWAITING_USERS_IMPORT
+    if document.file_size and document.file_size > USER_IMPORT_MAX_BYTES:
+        await update.message.reply_text(
+            f"❌ Файл слишком большой (максимум {USER_IMPORT_MAX_BYTES // 1024} КБ)."
+        )
+        return AWAITING_USERS_IMPORT
+
+    file = await document.get_file()
+    data = bytes(await file.download_as_bytearray())
+    records, errors = parse_users_csv(data)
+
+    added = updated = 0
+    if records:
+        try:
+            added, updated = await user_manager.import_users_async(records)
+        except Exception as e:
+            logger.error(f"❌ Ошибка импорта пользователей: {e}")
+            await update.message.reply_text(
+                f"❌ Ошибка записи в базу, изменения не применены: {e}",
+                reply_markup=get_users_keyboard()
+            )
+            return ConversationHandler.END
+
+    logger.info(f"Админ {update.effective_user.id} импортировал пользователей из {document.file_name}: "
+                f"добавлено {added}, обновлено {updated}, пропущено {len(errors)}")
+
+    message = (
+        f"📥 Импорт из {document.file_name} завершен\n\n"
+        f"• ➕ Добавлено: {added}\n"
+        f"• 🔄 Обновлено: {updated}\n"
+        f"• ⚠️ Пропущено строк: {len(errors)}\n"
+    )
+    if errors:
+        message += "\n❌ Ошибки:\n" + "\n".join(f"• {error}" for error in errors[:IMPORT_REPORT_ERRORS])
+        if len(errors) > IMPORT_REPORT_ERRORS:
+            message += f"\n... и еще {len(errors) - IMPORT_REPORT_ERRORS}"
+
+    await update.message.reply_text(message, reply_markup=get_users_keyboard())
+    return ConversationHandler.END
+
+
+@require_admin
+async def export_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Выгрузка пользователей и использования в CSV файл """
+    if update.message is None:
+        return
+
+    message = update.message
+    await message.reply_text("📤 Формирую выгрузку пользователей...")
+    try:
+        path, count = await export_users_csv()
+    except Exception as e:
+        logger.error(f"❌ Ошибка выгрузки пользователей: {e}")
+        await message.reply_text("❌ Не удалось сформировать выгрузку.")
+        return
+
+    filename = f"users_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
+
+    async def send_export():
+        with open(path, 'rb') as export_file:
+            return await message.reply_document(
+                document=export_file,
+                filename=filename,
+                caption=f"👥 Пользователей: {count}",
+                read_timeout=30,
+                write_timeout=60,
+                connect_timeout=30
+            )
+
+    try:
+        await outbound.submit(message.chat_id, send_export, priority=PRIORITY_ADMIN)
+    except Exception as e:
+        logger.error(f"❌ Ошибка отправки выгрузки пользователей: {e}")
+        await message.reply_text("❌ Не удалось отправить файл выгрузки.")
+    finally:
+        os.remove(path)
+
+
 @require_admin
 async def cancel_operation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """ Отмена текущей операции """
@@ -1052,7 +1179,7 @@ async def handle_update_interval_input(update: Update, context: ContextTypes.DEF
 
         seconds = hours * 3600
 
-        if user_manager.save_system_setting('db_refresh_interval', str(seconds)):
+        if await user_manager.save_system_setting_async('db_refresh_interval', str(seconds)):
             await update.message.reply_text(
                 f"✅ Интервал обновления изменен!\n\n"
                 f"🕐 Новый интервал: {hours} часов\n"
@@ -1092,7 +1219,7 @@ async def handle_logging_level_input(update: Update, context: ContextTypes.DEFAU
     if text in level_map:
         level = level_map[text]
 
-        if user_manager.save_system_setting('logging_level', level):
+        if await user_manager.save_system_setting_async('logging_level', level):
             numeric_level = getattr(logging, level.upper(), None)
             if isinstance(numeric_level, int):
                 logging.getLogger().setLevel(numeric_level)
@@ -1110,4 +1237,128 @@ async def handle_logging_level_input(update: Update, context: ContextTypes.DEFAU
         await update.message.reply_text("❌ Неверный выбор уровня.")
         return AWAITING_LOGGING_LEVEL
 
-    return ConversationHandler.END
\ No newline at end of file
+    return ConversationHandler.END
+
+
+BROADCAST_TARGETS = {
+    '👥 Всем активным': TARGET_ACTIVE,
+    '⏰ Истекает за 7 дней': f"{TARGET_EXPIRING}:7",
+}
+
+BROADCAST_STATUS_NAMES = {'running': '⏳ идет', 'done': '✅ завершена', 'cancelled': '❌ отменена'}
+
+
+@require_admin
+async def broadcast_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Рассылка: последние задания (идущие можно остановить) и выбор получателей """
+    jobs = await broadcaster.get_recent_jobs_async()
+    if jobs:
+        await update.message.reply_text(*_render_broadcast_jobs(jobs))
+
+    await update.message.reply_text("📢 Рассылка сообщений\n\nВыберите получателей:",
+                                    reply_markup=get_broadcast_target_keyboard())
+    return AWAITING_BROADCAST_TARGET
+
+
+def _render_broadcast_jobs(jobs: list):
+    """ Список последних заданий и кнопки остановки идущих """
+    message = "📋 Последние задания:\n"
+    for job in jobs:
+        kind = "напоминание" if job['kind'] == 'expiry_reminder' else "рассылка"
+        message += (
+            f"• #{job['id']} {kind} ({describe_target(job['target'])}) - "
+            f"{BROADCAST_STATUS_NAMES.get(job['status'], job['status'])}: "
+            f"{job['sent']}/{job['total']} доставлено, ошибок {job['failed']}\n"
+        )
+    running = [job['id'] for job in jobs if job['status'] == JOB_RUNNING]
+    return message, get_broadcast_jobs_keyboard(running)
+
+
+@require_admin
+async def stop_broadcast_job(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Остановка идущей рассылки (callback broadcast_stop:<id>) """
+    query = update.callback_query
+    job_id = int(query.data.split(':')[1])
+    if await broadcaster.cancel_job_async(job_id):
+        logger.info(f"📢 Задание рассылки {job_id} остановлено администратором {update.effective_user.id}")
+        # уже взятая пачка получателей досылается, следующие не отправляются
+        await query.answer(f"⛔ Рассылка #{job_id} остановлена")
+    else:
+        await query.answer(f"Рассылка #{job_id} уже завершена")
+
+    text, keyboard = _render_broadcast_jobs(await broadcaster.get_recent_jobs_async())
+    if query.message is None or query.message.text != text.strip():
+        await query.edit_message_text(text, reply_markup=keyboard)
+
+
+@require_admin
+async def handle_broadcast_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Выбор получателей рассылки """
+    target = BROADCAST_TARGETS.get(update.message.text.strip())
+    if target is None:
+        await update.message.reply_text("❌ Выберите получателей кнопкой или '⬅️ Назад в админку'.",
+                                        reply_markup=get_broadcast_target_keyboard())
+        return AWAITING_BROADCAST_TARGET
+
+    count = await broadcaster.count_targets_async(target)
+    if not count:
+        await update.message.reply_text("📭 Нет пользователей для этой рассылки.",
+                                        reply_markup=get_admin_keyboard())
+        return ConversationHandler.END
+
+    context.user_data['pending_broadcast'] = {'target': target}
+    await update.message.reply_text(
+        f"👥 Получатели: {describe_target(target)} ({count})\n\n"
+        "Введите текст сообщения или 'отмена':"
+    )
+    return AWAITING_BROADCAST_TEXT
+
+
+@require_admin
+async def handle_broadcast_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Текст рассылки """
+    text = update.message.text.strip()
+    pending = context.user_data.get('pending_broadcast')
+    if text.lower() in ['отмена', 'cancel'] or not pending:
+        context.user_data.pop('pending_broadcast', None)
+        await update.message.reply_text("❌ Рассылка отменена.", reply_markup=get_admin_keyboard())
+        return ConversationHandler.END
+
+    pending['text'] = text
+    count = await broadcaster.count_targets_async(pending['target'])
+    await update.message.reply_text(
+        f"📢 Проверьте рассылку\n\n"
+        f"👥 Получатели: {describe_target(pending['target'])} ({count})\n\n"
+        f"{text}",
+        reply_markup=get_broadcast_confirm_keyboard()
+    )
+    return AWAITING_BROADCAST_CONFIRM
+
+
+@require_admin
+async def handle_broadcast_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Подтверждение рассылки: задание ставится в фон """
+    pending = context.user_data.pop('pending_broadcast', None)
+    if update.message.text.strip() != '✅ Отправить рассылку' or not pending or 'text' not in pending:
+        await update.message.reply_text("❌ Рассылка отменена.", reply_markup=get_admin_keyboard())
+        return ConversationHandler.END
+
+    job_id, total = await broadcaster.create_job_async(pending['text'], pending['target'],
+                                                       created_by=update.effective_user.id)
+    if job_id is None:
+        await update.message.reply_text("📭 Нет пользователей для этой рассылки.", reply_markup=get_admin_keyboard())
+    else:
+        logger.info(f"Админ {update.effective_user.id} запустил рассылку #{job_id} на {total} получателей")
+        await update.message.reply_text(
+            f"✅ Рассылка #{job_id} запущена: {total} получателей.\n"
+            f"Ход выполнения - в разделе '📢 Рассылка'.",
+            reply_markup=get_admin_keyboard()
+        )
+    return ConversationHandler.END
+
+
+async def cancel_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ Выход из рассылки в админ-панель """
+    context.user_data.pop('pending_broadcast', None)
+    await admin_panel(update, context)
+    return ConversationHandler.END
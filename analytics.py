@@ -0,0 +1,303 @@
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+from typing import List, Optional
+import aiosqlite
+from config import (ANALYTICS_DB_PATH, ANALYTICS_FLUSH_INTERVAL, ANALYTICS_BATCH_SIZE, ANALYTICS_MAX_BUFFER,
+                    ANALYTICS_ROLLUP_INTERVAL, ANALYTICS_RETENTION_DAYS)
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS search_events (
+        id INTEGER PRIMARY KEY,
+        ts REAL NOT NULL,
+        user_id INTEGER,
+        latency_ms REAL NOT NULL,
+        hits INTEGER NOT NULL,
+        tier TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_search_events_ts ON search_events (ts);
+
+    CREATE TABLE IF NOT EXISTS download_events (
+        id INTEGER PRIMARY KEY,
+        ts REAL NOT NULL,
+        user_id INTEGER,
+        filename TEXT NOT NULL,
+        bytes INTEGER NOT NULL,
+        send_ms REAL NOT NULL,
+        ok INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_download_events_ts ON download_events (ts);
+
+    CREATE TABLE IF NOT EXISTS rollup_hourly (
+        hour TEXT PRIMARY KEY,
+        searches INTEGER NOT NULL DEFAULT 0,
+        empty_searches INTEGER NOT NULL DEFAULT 0,
+        shared_searches INTEGER NOT NULL DEFAULT 0,
+        latency_total_ms REAL NOT NULL DEFAULT 0,
+        latency_max_ms REAL NOT NULL DEFAULT 0,
+        downloads INTEGER NOT NULL DEFAULT 0,
+        failed_downloads INTEGER NOT NULL DEFAULT 0,
+        bytes_sent INTEGER NOT NULL DEFAULT 0,
+        send_total_ms REAL NOT NULL DEFAULT 0
+    );
+
+    CREATE TABLE IF NOT EXISTS rollup_daily (
+        day TEXT PRIMARY KEY,
+        searches INTEGER NOT NULL DEFAULT 0,
+        empty_searches INTEGER NOT NULL DEFAULT 0,
+        shared_searches INTEGER NOT NULL DEFAULT 0,
+        latency_total_ms REAL NOT NULL DEFAULT 0,
+        latency_max_ms REAL NOT NULL DEFAULT 0,
+        downloads INTEGER NOT NULL DEFAULT 0,
+        failed_downloads INTEGER NOT NULL DEFAULT 0,
+        bytes_sent INTEGER NOT NULL DEFAULT 0,
+        send_total_ms REAL NOT NULL DEFAULT 0,
+        active_users INTEGER NOT NULL DEFAULT 0,
+        peak_hour TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS rollup_files_daily (
+        day TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        downloads INTEGER NOT NULL,
+        bytes_sent INTEGER NOT NULL,
+        PRIMARY KEY (day, filename)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        name TEXT PRIMARY KEY,
+        value REAL NOT NULL
+    );
+'''
+
+# Пересчет сверток идет с последней отметки минус запас: события приходят пачками с задержкой до
+# ANALYTICS_FLUSH_INTERVAL, поэтому уже свернутый час/день может получить запоздавшие строки
+ROLLUP_GRACE_SECONDS = 3600
+
+HOUR_EXPR = "strftime('%Y-%m-%d %H:00', ts, 'unixepoch', 'localtime')"
+DAY_EXPR = "date(ts, 'unixepoch', 'localtime')"
+
+ROLLUP_PERIOD_SQL = '''
+    INSERT OR REPLACE INTO {table} ({key}, searches, empty_searches, shared_searches, latency_total_ms,
+                                    latency_max_ms, downloads, failed_downloads, bytes_sent, send_total_ms)
+    SELECT period, SUM(searches), SUM(empty_searches), SUM(shared_searches), SUM(latency_total_ms),
+           MAX(latency_max_ms), SUM(downloads), SUM(failed_downloads), SUM(bytes_sent), SUM(send_total_ms)
+    FROM (
+        SELECT {expr} AS period, COUNT(*) AS searches, SUM(hits = 0) AS empty_searches,
+               SUM(tier = 'shared') AS shared_searches, SUM(latency_ms) AS latency_total_ms,
+               MAX(latency_ms) AS latency_max_ms, 0 AS downloads, 0 AS failed_downloads,
+               0 AS bytes_sent, 0 AS send_total_ms
+        FROM search_events WHERE ts >= :since GROUP BY period
+        UNION ALL
+        SELECT {expr}, 0, 0, 0, 0, 0, COUNT(*), SUM(ok = 0), SUM(CASE WHEN ok THEN bytes ELSE 0 END),
+               SUM(send_ms)
+        FROM download_events WHERE ts >= :since GROUP BY 1
+    )
+    GROUP BY period
+'''
+
+ROLLUP_DAILY_EXTRA_SQL = f'''
+    UPDATE rollup_daily SET
+        active_users = (
+            SELECT COUNT(DISTINCT user_id) FROM (
+                SELECT user_id, ts FROM search_events WHERE ts >= :since
+                UNION ALL
+                SELECT user_id, ts FROM download_events WHERE ts >= :since
+            ) WHERE {DAY_EXPR} = rollup_daily.day
+        ),
+        peak_hour = (
+            SELECT hour FROM rollup_hourly
+            WHERE substr(hour, 1, 10) = rollup_daily.day
+            ORDER BY searches + downloads DESC LIMIT 1
+        )
+    WHERE day >= date(:since, 'unixepoch', 'localtime')
+'''
+
+ROLLUP_FILES_SQL = f'''
+    INSERT OR REPLACE INTO rollup_files_daily (day, filename, downloads, bytes_sent)
+    SELECT {DAY_EXPR}, filename, COUNT(*), SUM(bytes)
+    FROM download_events WHERE ts >= :since AND ok = 1
+    GROUP BY 1, filename
+'''
+
+
+class UsageAnalytics:
+    """ Журнал событий поиска и отправки резюме со свертками по часам и дням
+
+    Запись - только добавление в буфер в памяти; фоновая задача сбрасывает
+    его пачками в отдельную базу (ANALYTICS_DB_PATH), другая - пересчитывает
+    свертки rollup_hourly / rollup_daily / rollup_files_daily. Статистика
+    читает только свертки, сырые события хранятся ANALYTICS_RETENTION_DAYS дней.
+    """
+
+    def __init__(self, db_path: str = ANALYTICS_DB_PATH):
+        self.db_path = db_path
+        self._searches: List[tuple] = []
+        self._downloads: List[tuple] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self.dropped = 0
+        self.init_database()
+
+    def init_database(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(ANALYTICS_SCHEMA_SQL)
+            conn.commit()
+
+    def record_search(self, user_id: int, latency: float, hits: int, tier: str):
+        """ Событие поиска (latency - секунды от получения запроса до результата) """
+        self._append(self._searches, (time.time(), user_id, latency * 1000, hits, tier))
+
+    def record_download(self, user_id: int, filename: str, size: int, send_time: float, ok: bool):
+        """ Событие отправки резюме (send_time - секунды, включая ожидание в очереди отправки) """
+        self._append(self._downloads, (time.time(), user_id, filename, size, send_time * 1000, int(ok)))
+
+    def _append(self, buffer: List[tuple], event: tuple):
+        if len(self._searches) + len(self._downloads) >= ANALYTICS_MAX_BUFFER:
+            # база недоступна дольше обычного - теряем событие, а не память
+            self.dropped += 1
+            return
+        buffer.append(event)
+        if self._wakeup is not None and len(self._searches) + len(self._downloads) >= ANALYTICS_BATCH_SIZE:
+            self._wakeup.set()
+
+    def start(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._flush_loop()), asyncio.create_task(self._rollup_loop())]
+        logger.info("📊 Журнал аналитики запущен")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.flush()
+        await self.rollup()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), ANALYTICS_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def _rollup_loop(self):
+        while True:
+            await asyncio.sleep(ANALYTICS_ROLLUP_INTERVAL)
+            await self.rollup()
+
+    async def flush(self) -> int:
+        """ Запись накопленных событий одной транзакцией """
+        searches, self._searches = self._searches, []
+        downloads, self._downloads = self._downloads, []
+        if not searches and not downloads:
+            return 0
+        try:
+            async with aiosqlite.connect(self.db_path) as conn:
+                await conn.executemany(
+                    'INSERT INTO search_events (ts, user_id, latency_ms, hits, tier) VALUES (?, ?, ?, ?, ?)',
+                    searches
+                )
+                await conn.executemany(
+                    'INSERT INTO download_events (ts, user_id, filename, bytes, send_ms, ok) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    downloads
+                )
+                await conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи событий аналитики: {e}")
+            # вернем в буфер - запишутся со следующей пачкой
+            self._searches[:0] = searches
+            self._downloads[:0] = downloads
+            return 0
+        return len(searches) + len(downloads)
+
+    async def rollup(self):
+        """ Пересчет сверток по событиям после последней отметки и удаление старых событий """
+        try:
+            async with aiosqlite.connect(self.db_path) as conn:
+                cursor = await conn.execute("SELECT value FROM rollup_state WHERE name = 'rollup_since'")
+                row = await cursor.fetchone()
+                now = time.time()
+                since = (row[0] if row else 0) - ROLLUP_GRACE_SECONDS
+                since = max(since, 0)
+
+                # часы и дни пересчитываются целиком: начало окна округляется до начала часа / полуночи
+                await conn.execute(ROLLUP_PERIOD_SQL.format(table='rollup_hourly', key='hour', expr=HOUR_EXPR),
+                                   {'since': self._period_start(since, whole_day=False)})
+                day_params = {'since': self._period_start(since, whole_day=True)}
+                await conn.execute(ROLLUP_PERIOD_SQL.format(table='rollup_daily', key='day', expr=DAY_EXPR),
+                                   day_params)
+                await conn.execute(ROLLUP_DAILY_EXTRA_SQL, day_params)
+                await conn.execute(ROLLUP_FILES_SQL, day_params)
+
+                retention_edge = now - ANALYTICS_RETENTION_DAYS * 86400
+                await conn.execute('DELETE FROM search_events WHERE ts < ?', (retention_edge,))
+                await conn.execute('DELETE FROM download_events WHERE ts < ?', (retention_edge,))
+                await conn.execute(
+                    "INSERT OR REPLACE INTO rollup_state (name, value) VALUES ('rollup_since', ?)", (now,)
+                )
+                await conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Ошибка пересчета сверток аналитики: {e}")
+
+    def _period_start(self, ts: float, whole_day: bool) -> float:
+        local = time.localtime(ts)
+        hour = 0 if whole_day else local.tm_hour
+        return time.mktime((local.tm_year, local.tm_mon, local.tm_mday, hour, 0, 0, 0, 0, -1))
+
+    async def get_summary_async(self, top_files: int = 5) -> dict:
+        """ Сводка для статистики: последние 24 часа, сегодня и популярные резюме за 7 дней (из сверток) """
+        summary = {'searches_24h': 0, 'empty_24h': 0, 'avg_latency_ms': None, 'max_latency_ms': None,
+                   'downloads_24h': 0, 'failed_24h': 0, 'bytes_24h': 0, 'avg_send_ms': None,
+                   'peak_hour': None, 'peak_hour_load': 0, 'active_users_today': 0, 'top_files': []}
+        try:
+            async with aiosqlite.connect(self.db_path) as conn:
+                cursor = await conn.execute('''
+                    SELECT COALESCE(SUM(searches), 0), COALESCE(SUM(empty_searches), 0),
+                           SUM(latency_total_ms) / NULLIF(SUM(searches), 0), MAX(latency_max_ms),
+                           COALESCE(SUM(downloads), 0), COALESCE(SUM(failed_downloads), 0),
+                           COALESCE(SUM(bytes_sent), 0), SUM(send_total_ms) / NULLIF(SUM(downloads), 0)
+                    FROM rollup_hourly
+                    WHERE hour > strftime('%Y-%m-%d %H:00', 'now', 'localtime', '-1 day')
+                ''')
+                (summary['searches_24h'], summary['empty_24h'], summary['avg_latency_ms'],
+                 summary['max_latency_ms'], summary['downloads_24h'], summary['failed_24h'],
+                 summary['bytes_24h'], summary['avg_send_ms']) = await cursor.fetchone()
+
+                cursor = await conn.execute('''
+                    SELECT hour, searches + downloads FROM rollup_hourly
+                    WHERE hour > strftime('%Y-%m-%d %H:00', 'now', 'localtime', '-7 days')
+                    ORDER BY searches + downloads DESC LIMIT 1
+                ''')
+                row = await cursor.fetchone()
+                if row:
+                    summary['peak_hour'], summary['peak_hour_load'] = row
+
+                cursor = await conn.execute(
+                    "SELECT active_users FROM rollup_daily WHERE day = date('now', 'localtime')"
+                )
+                row = await cursor.fetchone()
+                summary['active_users_today'] = row[0] if row else 0
+
+                summary['top_files'] = await conn.execute_fetchall('''
+                    SELECT filename, SUM(downloads) FROM rollup_files_daily
+                    WHERE day > date('now', 'localtime', '-7 days')
+                    GROUP BY filename ORDER BY SUM(downloads) DESC LIMIT ?
+                ''', (top_files,))
+        except Exception as e:
+            logger.error(f"❌ Ошибка чтения сверток аналитики: {e}")
+        return summary
+
+
+analytics = UsageAnalytics()
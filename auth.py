@@ -1,7 +1,9 @@
+import asyncio
+import json
 import sqlite3
 import os
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List, Tuple, Any
+from typing import Dict, Optional, List, Set, Tuple, Any
 import logging
 import threading
 from contextlib import contextmanager
@@ -11,14 +13,158 @@ from admin_config import DEFAULT_ADMIN_ID, ADMIN_CONTACT
 
 logger = logging.getLogger(__name__)
 
+# Учет использования: корзины (пользователь, день) вместо счетчиков со сбросом.
+# Месяц и "всего" - суммы по диапазону ключа; перенесенные старые счетчики лежат
+# в корзинах '<месяц>-00' (остаток месяца) и LEGACY_USAGE_DAY (остаток всего).
+LEGACY_USAGE_DAY = '0000-00-00'
+
+USAGE_SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS usage_daily (
+        telegram_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        requests INTEGER NOT NULL DEFAULT 0,
+        resumes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (telegram_id, day)
+    ) WITHOUT ROWID
+'''
+
+# requests_today, resumes_today, resumes_this_month, resumes_total (параметры - usage_params())
+USAGE_COLUMNS_SQL = '''
+    COALESCE((SELECT requests FROM usage_daily WHERE telegram_id = users.telegram_id AND day = :today), 0),
+    COALESCE((SELECT resumes FROM usage_daily WHERE telegram_id = users.telegram_id AND day = :today), 0),
+    COALESCE((SELECT SUM(resumes) FROM usage_daily
+              WHERE telegram_id = users.telegram_id AND day BETWEEN :month_start AND :month_end), 0),
+    COALESCE((SELECT SUM(resumes) FROM usage_daily WHERE telegram_id = users.telegram_id), 0)
+'''
+
+INCREMENT_REQUESTS_SQL = '''
+    INSERT INTO usage_daily (telegram_id, day, requests) VALUES (?, ?, 1)
+    ON CONFLICT(telegram_id, day) DO UPDATE SET requests = requests + 1
+'''
+
+# Резерв резюме: проверка дневного и месячного лимита и увеличение счетчика дня - одной командой
+RESERVE_RESUME_SQL = '''
+    INSERT INTO usage_daily (telegram_id, day, resumes)
+    SELECT telegram_id, :today, 1 FROM users
+    WHERE telegram_id = :telegram_id
+      AND (resumes_limit <= 0 OR (
+          COALESCE((SELECT resumes FROM usage_daily
+                    WHERE telegram_id = :telegram_id AND day = :today), 0) < resumes_limit
+          AND COALESCE((SELECT SUM(resumes) FROM usage_daily
+                        WHERE telegram_id = :telegram_id AND day BETWEEN :month_start AND :month_end), 0) < resumes_limit))
+    ON CONFLICT(telegram_id, day) DO UPDATE SET resumes = resumes + 1
+    RETURNING resumes
+'''
+
+
+# Колонки пользователя для _user_from_row (параметры - usage_params())
+USER_COLUMNS_SQL = f'''
+    telegram_id, username, first_name, last_name, role, is_active,
+    created_at, last_login, access_level, daily_requests_limit,
+    access_expires, admin_contact, resumes_limit, {USAGE_COLUMNS_SQL}, status
+'''
+
+# Снимок в памяти: системные настройки, активные администраторы, контакт администратора
+SNAPSHOT_SETTINGS_SQL = 'SELECT key, value FROM system_settings'
+SNAPSHOT_ADMINS_SQL = "SELECT telegram_id FROM users WHERE role = 'admin' AND is_active = 1"
+SNAPSHOT_CONTACT_SQL = '''
+    SELECT username, first_name, telegram_id
+    FROM users
+    WHERE role = 'admin'
+    ORDER BY last_login DESC
+    LIMIT 1
+'''
+
+# users.status - вычисленный статус доступа: 'active', 'expired' (срок истек, снят фоновой
+# проверкой expire_accounts_async) или 'deactivated' (отключен администратором)
+USER_STATUSES = ('active', 'expired', 'deactivated')
+
+STATUS_BACKFILL_SQL = '''
+    UPDATE users SET
+        status = CASE
+            WHEN access_expires IS NOT NULL AND access_expires < :now THEN 'expired'
+            WHEN is_active = 1 THEN 'active'
+            ELSE 'deactivated'
+        END,
+        is_active = CASE WHEN access_expires IS NOT NULL AND access_expires < :now THEN 0 ELSE is_active END
+'''
+
+# Снятие доступа с истекшим сроком: частичный индекс idx_users_expiring содержит только активных
+EXPIRE_ACCOUNTS_SQL = '''
+    UPDATE users INDEXED BY idx_users_expiring SET status = 'expired', is_active = 0
+    WHERE status = 'active' AND access_expires IS NOT NULL AND access_expires < :now
+    RETURNING telegram_id, role
+'''
+
+USER_INDEXES_SQL = [
+    'DROP INDEX IF EXISTS idx_users_status',
+    'CREATE INDEX IF NOT EXISTS idx_users_state ON users (status, telegram_id)',
+    "CREATE INDEX IF NOT EXISTS idx_users_expiring ON users (access_expires) WHERE status = 'active'",
+    'CREATE INDEX IF NOT EXISTS idx_users_role ON users (role)',
+    'CREATE INDEX IF NOT EXISTS idx_usage_daily_day ON usage_daily (day, requests, resumes)',
+]
+
+# Массовый импорт: существующим пользователям обновляются лимиты и срок, роль и история сохраняются
+IMPORT_USER_SQL = '''
+    INSERT INTO users
+    (telegram_id, username, first_name, last_name, role, is_active, status,
+     daily_requests_limit, access_expires, resumes_limit, admin_contact)
+    VALUES (:telegram_id, :username, :first_name, :last_name, 'recruiter', 1, 'active',
+            :daily_requests_limit, :access_expires, :resumes_limit, :admin_contact)
+    ON CONFLICT(telegram_id) DO UPDATE SET
+        username = COALESCE(NULLIF(excluded.username, ''), users.username),
+        first_name = COALESCE(NULLIF(excluded.first_name, ''), users.first_name),
+        last_name = COALESCE(NULLIF(excluded.last_name, ''), users.last_name),
+        is_active = 1,
+        status = 'active',
+        daily_requests_limit = excluded.daily_requests_limit,
+        access_expires = excluded.access_expires,
+        resumes_limit = excluded.resumes_limit
+'''
+
+USER_STATS_SQL = '''
+    SELECT COUNT(*),
+           COALESCE(SUM(status = 'active'), 0),
+           COALESCE(SUM(status = 'expired'), 0),
+           COALESCE(SUM(status = 'deactivated'), 0),
+           COALESCE(SUM(status = 'active' AND daily_requests_limit > 0), 0),
+           COALESCE(SUM(status = 'active' AND daily_requests_limit <= 0), 0),
+           COALESCE(SUM(role = 'admin'), 0)
+    FROM users
+'''
+
+USAGE_TOTALS_SQL = '''
+    SELECT COALESCE(SUM(CASE WHEN day = :today THEN requests END), 0),
+           COALESCE(SUM(CASE WHEN day = :today THEN resumes END), 0),
+           COALESCE(SUM(CASE WHEN day BETWEEN :month_start AND :month_end THEN resumes END), 0),
+           COALESCE(SUM(resumes), 0)
+    FROM usage_daily
+'''
+
+def usage_params() -> Dict[str, str]:
+    """ Границы корзин для USAGE_COLUMNS_SQL: сегодня и текущий месяц """
+    now = datetime.now()
+    month = now.strftime('%Y-%m')
+    return {'today': now.date().isoformat(), 'month_start': f"{month}-00", 'month_end': f"{month}-31"}
+
+
+def now_param() -> str:
+    """ Текущее время в формате хранения access_expires (для сравнения строк в SQL) """
+    return str(datetime.now())
+
 
 class UserManager:
     def __init__(self, db_path: str = 'data/users.db'):
         self.db_path = db_path
         self._lock = threading.Lock()
+        self._settings: Dict[str, str] = {}
+        self._admin_ids: Set[int] = set()
+        self._admin_contact = ADMIN_CONTACT
+        self._sweeper_task: Optional[asyncio.Task] = None
         self.init_database()
         self.update_database_schema()
         self.update_admin_contact_in_db()
+        self._refresh_snapshot()
 
     async def update_last_login_async(self, telegram_id: int):
         """ Асинхронное обновление времени последнего входа """
@@ -35,51 +181,50 @@ class UserManager:
 
     @asynccontextmanager
     async def _get_async_connection(self):
-        """ Асинхронное подключение к БД """
+        """ Асинхронное подключение к БД (WAL включается один раз в init_database) """
         async with aiosqlite.connect(self.db_path) as conn:
             await conn.execute("PRAGMA busy_timeout = 5000")
-            await conn.execute("PRAGMA journal_mode=WAL")
             await conn.execute("PRAGMA synchronous=NORMAL")
             yield conn
 
+    def _run_sync(self, coroutine):
+        """ Синхронная обертка для скриптов; внутри цикла событий нужно вызывать *_async """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+        coroutine.close()
+        raise RuntimeError("Синхронный метод UserManager вызван внутри цикла событий, используйте *_async")
+
     async def can_make_request_async(self, telegram_id: int) -> Tuple[bool, str]:
         """ Асинхронная проверка доступа """
         try:
             async with self._get_async_connection() as conn:
                 cursor = await conn.cursor()
 
+                # срок, истекший после последней фоновой проверки, отсекается сравнением строк в SQL
                 await cursor.execute('''
-                       SELECT is_active, access_expires, daily_requests_limit, 
-                              requests_today, last_request_date, admin_contact
-                       FROM users WHERE telegram_id = ?
-                   ''', (telegram_id,))
+                       SELECT CASE WHEN status = 'active' AND access_expires < :now THEN 'expired' ELSE status END,
+                              daily_requests_limit,
+                              COALESCE((SELECT requests FROM usage_daily
+                                        WHERE telegram_id = users.telegram_id AND day = :today), 0)
+                       FROM users WHERE telegram_id = :telegram_id
+                   ''', {'telegram_id': telegram_id, 'today': datetime.now().date().isoformat(), 'now': now_param()})
 
                 user_data = await cursor.fetchone()
 
                 if not user_data:
                     return False, "❌ Пользователь не найден"
 
-                (is_active, access_expires, daily_requests_limit,
-                 requests_today, last_request_date, admin_contact) = user_data
+                status, daily_requests_limit, requests_today = user_data
 
                 admin_contact = self.get_admin_contact()
 
-                if not is_active:
-                    return False, f"Чтобы активировать бота обратитесь к администратору {admin_contact}\nВаш ID: {telegram_id}"
+                if status == 'expired':
+                    return False, f"⏰ Срок доступа истек. Обратитесь к администратору: {admin_contact}"
 
-                if access_expires:
-                    try:
-                        expires_date = datetime.fromisoformat(access_expires)
-                        if datetime.now() > expires_date:
-                            await self.deactivate_user_async(telegram_id)
-                            return False, f"⏰ Срок доступа истек. Обратитесь к администратору: {admin_contact}"
-                    except ValueError as e:
-                        logger.error(f"Ошибка парсинга даты для пользователя {telegram_id}: {e}")
-
-                today = datetime.now().date().isoformat()
-                if last_request_date and last_request_date != today:
-                    await self.reset_daily_requests_async(telegram_id)
-                    requests_today = 0
+                if status != 'active':
+                    return False, f"Чтобы активировать бота обратитесь к администратору {admin_contact}\nВаш ID: {telegram_id}"
 
                 if daily_requests_limit > 0 and requests_today >= daily_requests_limit:
                     return False, f"📊 Лимит запросов исчерпан ({requests_today}/{daily_requests_limit}). Попробуйте завтра."
@@ -94,15 +239,7 @@ class UserManager:
         """ Асинхронное увеличение счетчика """
         try:
             async with self._get_async_connection() as conn:
-                cursor = await conn.cursor()
-                today = datetime.now().date().isoformat()
-
-                await cursor.execute('''
-                       UPDATE users 
-                       SET requests_today = requests_today + 1, last_request_date = ?
-                       WHERE telegram_id = ?
-                   ''', (today, telegram_id))
-
+                await conn.execute(INCREMENT_REQUESTS_SQL, (telegram_id, datetime.now().date().isoformat()))
                 await conn.commit()
                 return True
         except Exception as e:
@@ -110,11 +247,13 @@ class UserManager:
             return False
 
     async def reset_daily_requests_async(self, telegram_id: int) -> bool:
-        """ Асинхронный сброс счетчика запросов """
+        """ Асинхронный сброс счетчика запросов за сегодня """
         try:
             async with self._get_async_connection() as conn:
-                cursor = await conn.cursor()
-                await cursor.execute('UPDATE users SET requests_today = 0 WHERE telegram_id = ?', (telegram_id,))
+                await conn.execute(
+                    'UPDATE usage_daily SET requests = 0 WHERE telegram_id = ? AND day = ?',
+                    (telegram_id, datetime.now().date().isoformat())
+                )
                 await conn.commit()
                 return True
         except Exception as e:
@@ -125,11 +264,13 @@ class UserManager:
         """ Асинхронная деактивация пользователя """
         try:
             async with self._get_async_connection() as conn:
-                cursor = await conn.cursor()
-                await cursor.execute('UPDATE users SET is_active = 0 WHERE telegram_id = ?', (telegram_id,))
+                await conn.execute(
+                    "UPDATE users SET is_active = 0, status = 'deactivated' WHERE telegram_id = ?", (telegram_id,)
+                )
                 await conn.commit()
-                logger.info(f"Пользователь {telegram_id} деактивирован (async)")
-                return True
+            await self._refresh_snapshot_async()
+            logger.info(f"Пользователь {telegram_id} деактивирован")
+            return True
         except Exception as e:
             logger.error(f"Ошибка деактивации пользователя {telegram_id}: {e}")
             return False
@@ -138,47 +279,57 @@ class UserManager:
         """ Асинхронное получение информации о пользователе """
         try:
             async with self._get_async_connection() as conn:
-                cursor = await conn.cursor()
-
-                await cursor.execute('''
-                       SELECT telegram_id, username, first_name, last_name, role, is_active, 
-                              created_at, last_login, access_level, daily_requests_limit,
-                              requests_today, last_request_date, access_expires, admin_contact,
-                              resumes_limit, resumes_today, resumes_this_month, resumes_total,
-                              last_resume_date, monthly_reset_date
-                       FROM users WHERE telegram_id = ?
-                   ''', (telegram_id,))
-
+                cursor = await conn.execute(
+                    f'SELECT {USER_COLUMNS_SQL} FROM users WHERE telegram_id = :telegram_id',
+                    {'telegram_id': telegram_id, **usage_params()}
+                )
                 row = await cursor.fetchone()
-
-                if row:
-                    return {
-                        'telegram_id': row[0],
-                        'username': row[1],
-                        'first_name': row[2],
-                        'last_name': row[3],
-                        'role': row[4],
-                        'is_active': bool(row[5]),
-                        'created_at': row[6],
-                        'last_login': row[7],
-                        'access_level': row[8],
-                        'daily_requests_limit': row[9],
-                        'requests_today': row[10],
-                        'last_request_date': row[11],
-                        'access_expires': row[12],
-                        'admin_contact': row[13],
-                        'resumes_limit': row[14],
-                        'resumes_today': row[15],
-                        'resumes_this_month': row[16],
-                        'resumes_total': row[17],
-                        'last_resume_date': row[18],
-                        'monthly_reset_date': row[19]
-                    }
-                return None
+            return self._user_from_row(row) if row else None
         except Exception as e:
             logger.error(f"Ошибка получения пользователя {telegram_id}: {e}")
             return None
 
+    def _user_from_row(self, row) -> Dict:
+        """ Словарь пользователя из строки SELECT {USER_COLUMNS_SQL} """
+        telegram_id = row[0]
+        username = row[1] or ""
+        first_name = row[2] if row[2] and row[2].strip() and row[2] != "Без имени" else ""
+        last_name = row[3] if row[3] and row[3].strip() else ""
+
+        if first_name and last_name:
+            display_name = f"{first_name} {last_name}"
+        elif first_name:
+            display_name = first_name
+        elif last_name:
+            display_name = last_name
+        elif username:
+            display_name = f"@{username}"
+        else:
+            display_name = f"Пользователь {telegram_id}"
+
+        return {
+            'telegram_id': telegram_id,
+            'username': username,
+            'first_name': first_name,
+            'last_name': last_name,
+            'display_name': display_name,
+            'role': row[4],
+            'is_active': bool(row[5]),
+            'created_at': row[6],
+            'last_login': row[7],
+            'access_level': row[8],
+            'daily_requests_limit': row[9],
+            'access_expires': row[10],
+            'admin_contact': row[11],
+            'resumes_limit': row[12],
+            'requests_today': row[13],
+            'resumes_today': row[14],
+            'resumes_this_month': row[15],
+            'resumes_total': row[16],
+            'days_remaining': self._calculate_days_remaining(row[10]) if row[10] else None,
+            'status': row[17]
+        }
+
     def update_database_schema(self):
         """ Обновление схемы базы данных до актуальной версии """
         try:
@@ -201,12 +352,61 @@ class UserManager:
                         cursor.execute(f'ALTER TABLE users ADD COLUMN {column_name} {column_type}')
                         logger.info(f"Добавлено поле {column_name} в таблицу users")
 
+                try:
+                    cursor.execute('SELECT status FROM users LIMIT 1')
+                except sqlite3.OperationalError:
+                    cursor.execute("ALTER TABLE users ADD COLUMN status TEXT NOT NULL DEFAULT 'deactivated'")
+                    cursor.execute(STATUS_BACKFILL_SQL, {'now': now_param()})
+                    logger.info("Добавлено поле status в таблицу users")
+
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'usage_daily'")
+                if not cursor.fetchone():
+                    cursor.execute(USAGE_SCHEMA_SQL)
+                    self._migrate_legacy_usage(cursor)
+
+                for index_sql in USER_INDEXES_SQL:
+                    cursor.execute(index_sql)
+
                 conn.commit()
                 logger.info("Схема базы данных обновлена")
 
         except Exception as e:
             logger.error(f"Ошибка при обновлении схемы БД: {e}")
 
+    def _migrate_legacy_usage(self, cursor):
+        """ Однократный перенос старых счетчиков из users в корзины usage_daily """
+        cursor.execute('''
+            SELECT telegram_id, requests_today, last_request_date, resumes_today, last_resume_date,
+                   resumes_this_month, monthly_reset_date, resumes_total
+            FROM users
+        ''')
+        buckets = {}
+        for (telegram_id, requests_today, last_request_date, resumes_today, last_resume_date,
+             resumes_this_month, monthly_reset_date, resumes_total) in cursor.fetchall():
+            if requests_today and last_request_date:
+                buckets.setdefault((telegram_id, last_request_date[:10]), [0, 0])[0] += requests_today
+
+            day_part = resumes_today if resumes_today and last_resume_date else 0
+            if day_part:
+                buckets.setdefault((telegram_id, last_resume_date[:10]), [0, 0])[1] += day_part
+
+            month_part = 0
+            if resumes_this_month and monthly_reset_date:
+                counted = day_part if day_part and last_resume_date.startswith(monthly_reset_date) else 0
+                month_part = max(resumes_this_month - counted, 0)
+                if month_part:
+                    buckets.setdefault((telegram_id, f"{monthly_reset_date}-00"), [0, 0])[1] += month_part
+
+            legacy_part = max((resumes_total or 0) - day_part - month_part, 0)
+            if legacy_part:
+                buckets.setdefault((telegram_id, LEGACY_USAGE_DAY), [0, 0])[1] += legacy_part
+
+        cursor.executemany(
+            'INSERT INTO usage_daily (telegram_id, day, requests, resumes) VALUES (?, ?, ?, ?)',
+            [(telegram_id, day, requests, resumes) for (telegram_id, day), (requests, resumes) in buckets.items()]
+        )
+        logger.info(f"📦 Счетчики использования перенесены в usage_daily: {len(buckets)} записей")
+
     @contextmanager
     def _get_connection(self):
         """ Контекстный менеджер для безопасного доступа к БД """
@@ -218,70 +418,85 @@ class UserManager:
             finally:
                 conn.close()
 
-    def update_user_role(self, telegram_id: int, new_role: str) -> bool:
+    async def update_user_role_async(self, telegram_id: int, new_role: str) -> bool:
         """ Обновление роли пользователя """
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-
-                cursor.execute('SELECT role FROM users WHERE telegram_id = ?', (telegram_id,))
-                current_role = cursor.fetchone()
+            async with self._get_async_connection() as conn:
+                cursor = await conn.execute('SELECT role FROM users WHERE telegram_id = ?', (telegram_id,))
+                current_role = await cursor.fetchone()
                 current_role = current_role[0] if current_role else 'unknown'
 
-                cursor.execute(
+                await conn.execute(
                     'UPDATE users SET role = ? WHERE telegram_id = ?',
                     (new_role, telegram_id)
                 )
-                conn.commit()
+                await conn.commit()
 
-                logger.info(
-                    f"Роль пользователя {telegram_id} изменена: "
-                    f"{current_role} -> {new_role}"
-                )
-                return True
+            await self._refresh_snapshot_async()
+            logger.info(
+                f"Роль пользователя {telegram_id} изменена: "
+                f"{current_role} -> {new_role}"
+            )
+            return True
         except Exception as e:
             logger.error(f"Ошибка изменения роли пользователя {telegram_id}: {e}")
             return False
 
+    def update_user_role(self, telegram_id: int, new_role: str) -> bool:
+        return self._run_sync(self.update_user_role_async(telegram_id, new_role))
+
     def get_admin_contact(self) -> str:
-        """ Получение контакта администратора """
+        """ Контакт администратора (из снимка в памяти) """
+        return self._admin_contact
+
+    def _apply_snapshot(self, settings_rows, admin_rows, contact_row):
+        """ Замена снимка целиком (читатели видят либо старый, либо новый) """
+        if contact_row is None:
+            admin_contact = ADMIN_CONTACT
+        else:
+            username, first_name, telegram_id = contact_row
+            if ADMIN_CONTACT and ADMIN_CONTACT.strip():
+                admin_contact = ADMIN_CONTACT
+            elif username and username.strip():
+                admin_contact = f"@{username}"
+            elif first_name and first_name.strip():
+                admin_contact = f"{first_name} (ID: {telegram_id})"
+            else:
+                admin_contact = f"Администратор (ID: {telegram_id})"
+
+        self._settings = dict(settings_rows)
+        self._admin_ids = {row[0] for row in admin_rows}
+        self._admin_contact = admin_contact
+
+    def _refresh_snapshot(self):
+        """ Загрузка снимка настроек, активных администраторов и контакта администратора (при старте) """
         try:
             with self._get_connection() as conn:
-                cursor = conn.cursor()
-
-                cursor.execute('''
-                        SELECT username, first_name, telegram_id, admin_contact
-                        FROM users 
-                        WHERE role = 'admin'
-                        ORDER BY last_login DESC, last_login DESC
-                        LIMIT 1
-                    ''')
-
-                admin_data = cursor.fetchone()
-
-                if admin_data:
-                    username, first_name, telegram_id, admin_contact = admin_data
-
-                    if ADMIN_CONTACT and ADMIN_CONTACT.strip():
-                        return ADMIN_CONTACT
-                    elif username and username.strip():
-                        return f"@{username}"
-                    elif first_name and first_name.strip():
-                        return f"{first_name} (ID: {telegram_id})"
-                    else:
-                        return f"Администратор (ID: {telegram_id})"
-                else:
-                    return ADMIN_CONTACT
+                settings_rows = conn.execute(SNAPSHOT_SETTINGS_SQL).fetchall()
+                admin_rows = conn.execute(SNAPSHOT_ADMINS_SQL).fetchall()
+                contact_row = conn.execute(SNAPSHOT_CONTACT_SQL).fetchone()
+            self._apply_snapshot(settings_rows, admin_rows, contact_row)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки настроек и ролей: {e}")
 
+    async def _refresh_snapshot_async(self):
+        """ Перечитать снимок после записей, которые его меняют; обычные ответы читают только память """
+        try:
+            async with self._get_async_connection() as conn:
+                settings_rows = await conn.execute_fetchall(SNAPSHOT_SETTINGS_SQL)
+                admin_rows = await conn.execute_fetchall(SNAPSHOT_ADMINS_SQL)
+                cursor = await conn.execute(SNAPSHOT_CONTACT_SQL)
+                contact_row = await cursor.fetchone()
+            self._apply_snapshot(settings_rows, admin_rows, contact_row)
         except Exception as e:
-            logger.error(f"Ошибка получения контакта администратора: {e}")
-        return ADMIN_CONTACT
+            logger.error(f"Ошибка загрузки настроек и ролей: {e}")
 
     def init_database(self):
         """ Инициализация базы данных с расширенными полями """
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
 
         conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -311,6 +526,14 @@ class UserManager:
             )
         ''')
 
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS system_settings (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
         cursor.execute('''
                 INSERT OR IGNORE INTO users 
                 (telegram_id, username, first_name, role, is_active, access_level, daily_requests_limit) 
@@ -321,13 +544,13 @@ class UserManager:
         conn.close()
         logger.info("База данных пользователей инициализирована")
 
-    def add_user(self, telegram_id: int, username: str = "", first_name: str = "",
-                 last_name: str = "", role: str = "recruiter",
-                 daily_requests_limit: int = 10, access_days: int = 30, resumes_limit: int = 0) -> bool:
+    async def add_user_async(self, telegram_id: int, username: str = "", first_name: str = "",
+                             last_name: str = "", role: str = "recruiter",
+                             daily_requests_limit: int = 10, access_days: int = 30, resumes_limit: int = 0) -> bool:
         """ Добавление нового пользователя с настройками доступа """
         try:
             is_admin = telegram_id == DEFAULT_ADMIN_ID
-            existing_user = self.get_user(telegram_id)
+            existing_user = await self.get_user_async(telegram_id)
             if existing_user and existing_user.get('is_active'):
                 is_active = 1
                 access_expires = existing_user.get('access_expires')
@@ -344,20 +567,19 @@ class UserManager:
                 final_daily_limit = daily_requests_limit
                 final_resumes_limit = resumes_limit
                 access_expires = datetime.now() + timedelta(days=access_days) if access_days > 0 else None
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
 
-            cursor.execute('''
-                INSERT OR REPLACE INTO users 
-                (telegram_id, username, first_name, last_name, role, is_active, 
-                 daily_requests_limit, access_expires, resumes_limit, admin_contact) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (telegram_id, username, first_name, last_name, role, is_active,
-                  final_daily_limit, access_expires, final_resumes_limit, '@elenazenka'))
-
-            conn.commit()
-            conn.close()
+            async with self._get_async_connection() as conn:
+                await conn.execute('''
+                    INSERT OR REPLACE INTO users
+                    (telegram_id, username, first_name, last_name, role, is_active, status,
+                     daily_requests_limit, access_expires, resumes_limit, admin_contact)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (telegram_id, username, first_name, last_name, role, is_active,
+                      'active' if is_active else 'deactivated',
+                      final_daily_limit, access_expires, final_resumes_limit, '@elenazenka'))
+                await conn.commit()
 
+            await self._refresh_snapshot_async()
             logger.info(f"✅ Добавлен/обновлен пользователь: {telegram_id} | "
                    f"Username: @{username or 'нет'} | "
                    f"Имя: {first_name or 'нет'} | "
@@ -367,186 +589,140 @@ class UserManager:
             logger.error(f"❌ Ошибка добавления пользователя: {e}")
             return False
 
-    def add_user_by_admin(self, telegram_id: int, username: str = "", first_name: str = "",
-                          last_name: str = "", role: str = "recruiter",
-                          daily_requests_limit: int = 10, access_days: int = 30, resumes_limit: int = 0) -> bool:
+    def add_user(self, telegram_id: int, username: str = "", first_name: str = "",
+                 last_name: str = "", role: str = "recruiter",
+                 daily_requests_limit: int = 10, access_days: int = 30, resumes_limit: int = 0) -> bool:
+        return self._run_sync(self.add_user_async(telegram_id, username, first_name, last_name, role,
+                                                  daily_requests_limit, access_days, resumes_limit))
+
+    async def add_user_by_admin_async(self, telegram_id: int, username: str = "", first_name: str = "",
+                                      last_name: str = "", role: str = "recruiter",
+                                      daily_requests_limit: int = 10, access_days: int = 30,
+                                      resumes_limit: int = 0) -> bool:
         """ Добавление нового пользователя АДМИНОМ с автоматической активацией """
         try:
             access_expires = datetime.now() + timedelta(days=access_days) if access_days > 0 else None
 
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                INSERT OR REPLACE INTO users 
-                (telegram_id, username, first_name, last_name, role, is_active, 
-                 daily_requests_limit, access_expires, resumes_limit, admin_contact) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (telegram_id, username or "", first_name or "", last_name or "", role, 1,
-                  daily_requests_limit, access_expires, resumes_limit, '@elenazenka'))
-
-            conn.commit()
-            conn.close()
+            async with self._get_async_connection() as conn:
+                await conn.execute('''
+                    INSERT OR REPLACE INTO users
+                    (telegram_id, username, first_name, last_name, role, is_active, status,
+                     daily_requests_limit, access_expires, resumes_limit, admin_contact)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (telegram_id, username or "", first_name or "", last_name or "", role, 1, 'active',
+                      daily_requests_limit, access_expires, resumes_limit, '@elenazenka'))
+                await conn.commit()
 
+            await self._refresh_snapshot_async()
             logger.info(f"✅ Админ добавил и АКТИВИРОВАЛ пользователя: {telegram_id}")
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка добавления пользователя админом: {e}")
             return False
 
+    def add_user_by_admin(self, telegram_id: int, username: str = "", first_name: str = "",
+                          last_name: str = "", role: str = "recruiter",
+                          daily_requests_limit: int = 10, access_days: int = 30, resumes_limit: int = 0) -> bool:
+        return self._run_sync(self.add_user_by_admin_async(telegram_id, username, first_name, last_name, role,
+                                                           daily_requests_limit, access_days, resumes_limit))
+
+    async def import_users_async(self, records: List[Dict]) -> Tuple[int, int]:
+        """ Импорт пользователей одной транзакцией: все записи применяются или ни одна
+
+        records - словари с telegram_id, username, first_name, last_name,
+        daily_requests_limit, access_days, resumes_limit. Возвращает (добавлено, обновлено).
+        Ошибка БД пробрасывается, изменения при этом откатываются.
+        """
+        if not records:
+            return 0, 0
+
+        now = datetime.now()
+        params = [{
+            'telegram_id': record['telegram_id'],
+            'username': record.get('username', ''),
+            'first_name': record.get('first_name', ''),
+            'last_name': record.get('last_name', ''),
+            'daily_requests_limit': record['daily_requests_limit'],
+            'access_expires': now + timedelta(days=record['access_days']) if record['access_days'] > 0 else None,
+            'resumes_limit': record['resumes_limit'],
+            'admin_contact': ADMIN_CONTACT,
+        } for record in records]
+        ids = json.dumps([record['telegram_id'] for record in records])
+
+        async with self._get_async_connection() as conn:
+            try:
+                await conn.execute('BEGIN IMMEDIATE')
+                cursor = await conn.execute(
+                    'SELECT COUNT(*) FROM users WHERE telegram_id IN (SELECT value FROM json_each(?))', (ids,)
+                )
+                updated = (await cursor.fetchone())[0]
+                await conn.executemany(IMPORT_USER_SQL, params)
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+
+        await self._refresh_snapshot_async()
+        logger.info(f"📥 Импорт пользователей: добавлено {len(records) - updated}, обновлено {updated}")
+        return len(records) - updated, updated
+
+    async def iter_users_async(self, chunk_size: int = 500):
+        """ Все пользователи с учетом использования порциями по ключу telegram_id
+
+        Каждая порция - отдельный короткий запрос, таблица целиком в память не читается.
+        """
+        cursor_id = -1
+        params = usage_params()
+        while True:
+            async with self._get_async_connection() as conn:
+                rows = await conn.execute_fetchall(
+                    f"SELECT {USER_COLUMNS_SQL} FROM users WHERE telegram_id > :cursor "
+                    f"ORDER BY telegram_id LIMIT :limit",
+                    {**params, 'cursor': cursor_id, 'limit': chunk_size}
+                )
+            if not rows:
+                return
+            yield [self._user_from_row(row) for row in rows]
+            if len(rows) < chunk_size:
+                return
+            cursor_id = rows[-1][0]
+
     def get_user(self, telegram_id: int) -> Optional[Dict]:
-        """ Получение информации о пользователе """
-        try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                        SELECT telegram_id, username, first_name, last_name, role, is_active, 
-                               created_at, last_login, access_level, daily_requests_limit,
-                               requests_today, last_request_date, access_expires, admin_contact,
-                               resumes_limit, resumes_today, resumes_this_month, resumes_total,
-                               last_resume_date, monthly_reset_date
-                        FROM users WHERE telegram_id = ?
-                    ''', (telegram_id,))
-
-            row = cursor.fetchone()
-            conn.close()
-
-            if row:
-                username = row[1] or ""
-                first_name = row[2] if row[2] and row[2].strip() and row[2] != "Без имени" else ""
-                last_name = row[3] if row[3] and row[3].strip() else ""
-
-                if first_name and last_name:
-                    display_name = f"{first_name} {last_name}"
-                elif first_name:
-                    display_name = first_name
-                elif last_name:
-                    display_name = last_name
-                elif username:
-                    display_name = f"@{username}"
-                else:
-                    display_name = f"Пользователь {telegram_id}"
-
-                return {
-                    'telegram_id': row[0],
-                    'username': username,
-                    'first_name': first_name,
-                    'last_name': last_name,
-                    'display_name': display_name,
-                    'role': row[4],
-                    'is_active': bool(row[5]),
-                    'created_at': row[6],
-                    'last_login': row[7],
-                    'access_level': row[8],
-                    'daily_requests_limit': row[9],
-                    'requests_today': row[10],
-                    'last_request_date': row[11],
-                    'access_expires': row[12],
-                    'admin_contact': row[13],
-                    'resumes_limit': row[14],
-                    'resumes_today': row[15],
-                    'resumes_this_month': row[16],
-                    'resumes_total': row[17],
-                    'last_resume_date': row[18],
-                    'monthly_reset_date': row[19]
-                }
-            return None
-        except Exception as e:
-            logger.error(f"Ошибка получения пользователя: {e}")
-            return None
+        return self._run_sync(self.get_user_async(telegram_id))
 
     def update_last_login(self, telegram_id: int):
-        """ Обновление времени последнего входа """
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                UPDATE users SET last_login = CURRENT_TIMESTAMP 
-                WHERE telegram_id = ?
-            ''', (telegram_id,))
-
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            logger.error(f"Ошибка обновления времени входа: {e}")
+        return self._run_sync(self.update_last_login_async(telegram_id))
 
     def can_make_request(self, telegram_id: int) -> Tuple[bool, str]:
-        """ Проверка возможности выполнения запроса """
-        user = self.get_user(telegram_id)
-        admin_contact = self.get_admin_contact()
-        if not user or not user['is_active']:
-            return False, f"🔐 Аккаунт деактивирован. Для доступа к боту обратитесь к администратору {admin_contact}"
-
-        if user['access_expires']:
-            try:
-                expires_date = datetime.fromisoformat(user['access_expires'])
-                if datetime.now() > expires_date:
-                    self.deactivate_user(telegram_id)
-                    return False, f"⏰ Срок доступа истек. Обратитесь к администратору: {admin_contact}"
-            except ValueError as e:
-                logger.error(f"Ошибка парсинга даты для пользователя {telegram_id}: {e}")
-
-        today = datetime.now().date()
-        last_request_date = user['last_request_date']
-
-        if last_request_date:
-            try:
-                last_date = datetime.fromisoformat(last_request_date).date()
-                if last_date != today:
-                    self.reset_daily_requests(telegram_id)
-                    user['requests_today'] = 0
-            except ValueError as e:
-                logger.error(f"Ошибка парсинга даты запроса для пользователя {telegram_id}: {e}")
-                self.reset_daily_requests(telegram_id)
-
-        if user['daily_requests_limit'] > 0 and user['requests_today'] >= user['daily_requests_limit']:
-            return False, f"📊 Лимит запросов исчерпан ({user['requests_today']}/{user['daily_requests_limit']}). Попробуйте завтра."
-
-        return True, ""
+        return self._run_sync(self.can_make_request_async(telegram_id))
 
     def increment_request_count(self, telegram_id: int) -> bool:
-        """ Увеличение счетчика запросов """
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            today = datetime.now().date().isoformat()
-
-            cursor.execute('''
-                    UPDATE users 
-                    SET requests_today = requests_today + 1, last_request_date = ?
-                    WHERE telegram_id = ?
-                ''', (today, telegram_id))
-
-            conn.commit()
-            return True
+        return self._run_sync(self.increment_request_count_async(telegram_id))
 
     def reset_daily_requests(self, telegram_id: int) -> bool:
-        """ Сброс дневного счетчика запросов """
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                UPDATE users SET requests_today = 0 
-                WHERE telegram_id = ?
-            ''', (telegram_id,))
+        return self._run_sync(self.reset_daily_requests_async(telegram_id))
 
-            conn.commit()
-            conn.close()
-            return True
+    async def reset_all_daily_requests_async(self) -> int:
+        """ Сброс счетчиков запросов за сегодня у всех пользователей (одной командой) """
+        try:
+            async with self._get_async_connection() as conn:
+                cursor = await conn.execute(
+                    'UPDATE usage_daily SET requests = 0 WHERE day = ? AND requests > 0',
+                    (datetime.now().date().isoformat(),)
+                )
+                await conn.commit()
+                return cursor.rowcount
         except Exception as e:
-            logger.error(f"Ошибка сброса счетчика запросов: {e}")
-            return False
+            logger.error(f"Ошибка сброса счетчиков запросов: {e}")
+            return 0
 
-    def update_user_limits(self, telegram_id: int, daily_requests_limit: int = None,
-                           access_days: int = None) -> bool:
+    def reset_all_daily_requests(self) -> int:
+        return self._run_sync(self.reset_all_daily_requests_async())
+
+    async def update_user_limits_async(self, telegram_id: int, daily_requests_limit: int = None,
+                                       access_days: int = None) -> bool:
         """ Обновление лимитов пользователя """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
             updates = []
             params = []
 
@@ -561,127 +737,160 @@ class UserManager:
 
             if updates:
                 params.append(telegram_id)
-                query = f"UPDATE users SET {', '.join(updates)} WHERE telegram_id = ?"
-                cursor.execute(query, params)
+                async with self._get_async_connection() as conn:
+                    await conn.execute(f"UPDATE users SET {', '.join(updates)} WHERE telegram_id = ?", params)
+                    await conn.commit()
 
-            conn.commit()
-            conn.close()
             logger.info(f"Обновлены лимиты пользователя {telegram_id}")
             return True
         except Exception as e:
             logger.error(f"Ошибка обновления лимитов пользователя: {e}")
             return False
 
-    def deactivate_user(self, telegram_id: int) -> bool:
-        """ Деактивация пользователя """
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                UPDATE users SET is_active = 0 WHERE telegram_id = ?
-            ''', (telegram_id,))
+    def update_user_limits(self, telegram_id: int, daily_requests_limit: int = None,
+                           access_days: int = None) -> bool:
+        return self._run_sync(self.update_user_limits_async(telegram_id, daily_requests_limit, access_days))
 
-            conn.commit()
-            conn.close()
-            logger.info(f"Пользователь {telegram_id} деактивирован")
-            return True
-        except Exception as e:
-            logger.error(f"Ошибка деактивации пользователя: {e}")
-            return False
+    def deactivate_user(self, telegram_id: int) -> bool:
+        return self._run_sync(self.deactivate_user_async(telegram_id))
 
-    def activate_user(self, telegram_id: int, access_days: int = 30) -> bool:
+    async def activate_user_async(self, telegram_id: int, access_days: int = 30) -> bool:
         """ Активация пользователя с установкой срока доступа """
         try:
             access_expires = datetime.now() + timedelta(days=access_days) if access_days > 0 else None
 
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                UPDATE users SET is_active = 1, access_expires = ? 
-                WHERE telegram_id = ?
-            ''', (access_expires, telegram_id))
+            async with self._get_async_connection() as conn:
+                await conn.execute('''
+                    UPDATE users SET is_active = 1, status = 'active', access_expires = ?
+                    WHERE telegram_id = ?
+                ''', (access_expires, telegram_id))
+                await conn.commit()
 
-            conn.commit()
-            conn.close()
+            await self._refresh_snapshot_async()
             logger.info(f"Пользователь {telegram_id} активирован на {access_days} дней")
             return True
         except Exception as e:
             logger.error(f"Ошибка активации пользователя: {e}")
             return False
 
-    def get_all_users(self) -> List[Dict]:
+    def activate_user(self, telegram_id: int, access_days: int = 30) -> bool:
+        return self._run_sync(self.activate_user_async(telegram_id, access_days))
+
+    async def get_all_users_async(self) -> List[Dict]:
         """ Получение списка всех пользователей """
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-
-                cursor.execute('''
-                    SELECT telegram_id, username, first_name, last_name, role, is_active, 
-                           created_at, last_login, daily_requests_limit, requests_today,
-                           access_expires, resumes_limit, resumes_today, resumes_this_month, resumes_total
-                    FROM users ORDER BY created_at DESC
-                ''')
-
-                users = []
-                for row in cursor.fetchall():
-                    username = row[1] or ""
-                    first_name = row[2] if row[2] and row[2].strip() and row[2] != "Без имени" else ""
-                    last_name = row[3] if row[3] and row[3].strip() else ""
-
-                    if first_name and last_name:
-                        display_name = f"{first_name} {last_name}"
-                    elif first_name:
-                        display_name = first_name
-                    elif last_name:
-                        display_name = last_name
-                    elif username:
-                        display_name = f"@{username}"
-                    else:
-                        display_name = f"Пользователь {row[0]}"
-
-                    user_data = {
-                        'telegram_id': row[0],
-                        'username': username,
-                        'first_name': first_name,
-                        'last_name': last_name,
-                        'display_name': display_name,
-                        'role': row[4],
-                        'is_active': bool(row[5]),
-                        'created_at': row[6],
-                        'last_login': row[7],
-                        'daily_requests_limit': row[8],
-                        'requests_today': row[9],
-                        'access_expires': row[10],
-                        'resumes_limit': row[11],
-                        'resumes_today': row[12],
-                        'resumes_this_month': row[13],
-                        'resumes_total': row[14],
-                        'days_remaining': self._calculate_days_remaining(row[10]) if row[10] else None,
-                        'status': self._determine_user_status(bool(row[5]), row[10])
-                    }
-                    users.append(user_data)
-
-                return users
+            async with self._get_async_connection() as conn:
+                rows = await conn.execute_fetchall(
+                    f'SELECT {USER_COLUMNS_SQL} FROM users ORDER BY created_at DESC', usage_params()
+                )
+            return [self._user_from_row(row) for row in rows]
         except Exception as e:
             logger.error(f"Ошибка получения списка пользователей: {e}")
             return []
 
-    def _determine_user_status(self, is_active: bool, access_expires: str) -> str:
-        """ Определение статуса пользователя """
-        if not is_active:
-            return "deactivated"
+    def get_all_users(self) -> List[Dict]:
+        return self._run_sync(self.get_all_users_async())
 
-        if access_expires:
-            try:
-                expires_date = datetime.fromisoformat(access_expires)
-                if datetime.now() > expires_date:
-                    return "expired"
-            except ValueError:
-                pass
+    async def get_user_stats_async(self) -> Dict[str, int]:
+        """ Сводка по пользователям и использованию (агрегаты в SQL, без выборки строк) """
+        try:
+            async with self._get_async_connection() as conn:
+                cursor = await conn.execute(USER_STATS_SQL)
+                total, active, expired, deactivated, limited, unlimited, admins = await cursor.fetchone()
+                cursor = await conn.execute(USAGE_TOTALS_SQL, usage_params())
+                requests_today, resumes_today, resumes_month, resumes_total = await cursor.fetchone()
+        except Exception as e:
+            logger.error(f"Ошибка получения статистики пользователей: {e}")
+            total = active = expired = deactivated = limited = unlimited = admins = 0
+            requests_today = resumes_today = resumes_month = resumes_total = 0
+
+        return {
+            'total': total, 'active': active, 'expired': expired, 'deactivated': deactivated,
+            'limited': limited, 'unlimited': unlimited, 'admins': admins,
+            'requests_today': requests_today, 'resumes_today': resumes_today,
+            'resumes_this_month': resumes_month, 'resumes_total': resumes_total
+        }
 
-        return "active"
+    async def get_users_page_async(self, status: str, after_id: int = None, before_id: int = None,
+                                   limit: int = 10) -> Tuple[List[Dict], bool, bool]:
+        """ Страница пользователей со статусом status по ключу telegram_id
+
+        after_id - следующая страница (id больше), before_id - предыдущая (id меньше).
+        Возвращает (пользователи, есть_предыдущая, есть_следующая).
+        """
+        backward = before_id is not None
+        params = {**usage_params(), 'status': status, 'limit': limit + 1,
+                  'cursor': before_id if backward else (after_id if after_id is not None else -1)}
+        query = (
+            f"SELECT {USER_COLUMNS_SQL} FROM users "
+            f"WHERE status = :status AND telegram_id {'<' if backward else '>'} :cursor "
+            f"ORDER BY telegram_id {'DESC' if backward else 'ASC'} LIMIT :limit"
+        )
+        try:
+            async with self._get_async_connection() as conn:
+                rows = await conn.execute_fetchall(query, params)
+        except Exception as e:
+            logger.error(f"Ошибка получения страницы пользователей: {e}")
+            return [], False, False
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backward:
+            rows.reverse()
+            return [self._user_from_row(row) for row in rows], has_more, True
+        return [self._user_from_row(row) for row in rows], after_id is not None, has_more
+
+    async def get_top_users_today_async(self, limit: int = 10) -> List[Dict]:
+        """ Самые активные сегодня активные пользователи (по резюме, затем по запросам) """
+        try:
+            async with self._get_async_connection() as conn:
+                rows = await conn.execute_fetchall('''
+                    SELECT users.telegram_id, users.username, usage_daily.requests, usage_daily.resumes
+                    FROM usage_daily JOIN users ON users.telegram_id = usage_daily.telegram_id
+                    WHERE usage_daily.day = :today AND users.status = 'active'
+                    ORDER BY usage_daily.resumes DESC, usage_daily.requests DESC
+                    LIMIT :limit
+                ''', {'today': datetime.now().date().isoformat(), 'limit': limit})
+        except Exception as e:
+            logger.error(f"Ошибка получения активных пользователей: {e}")
+            return []
+        return [
+            {'telegram_id': row[0], 'username': row[1] or "", 'requests_today': row[2], 'resumes_today': row[3]}
+            for row in rows
+        ]
+
+    async def expire_accounts_async(self) -> int:
+        """ Снятие доступа у пользователей с истекшим сроком (одним UPDATE по частичному индексу) """
+        try:
+            async with self._get_async_connection() as conn:
+                cursor = await conn.execute(EXPIRE_ACCOUNTS_SQL, {'now': now_param()})
+                expired = await cursor.fetchall()
+                await conn.commit()
+        except Exception as e:
+            logger.error(f"Ошибка проверки сроков доступа: {e}")
+            return 0
+
+        if expired:
+            if any(role == 'admin' for _, role in expired):
+                await self._refresh_snapshot_async()
+            logger.info(f"⏰ Истек срок доступа: {len(expired)} пользователей")
+        return len(expired)
+
+    def start_expiry_sweeper(self, interval: float):
+        """ Фоновая проверка сроков доступа каждые interval секунд """
+        if self._sweeper_task is None:
+            self._sweeper_task = asyncio.create_task(self._expiry_sweeper(interval))
+
+    async def stop_expiry_sweeper(self):
+        if self._sweeper_task is not None:
+            self._sweeper_task.cancel()
+            await asyncio.gather(self._sweeper_task, return_exceptions=True)
+            self._sweeper_task = None
+
+    async def _expiry_sweeper(self, interval: float):
+        while True:
+            await self.expire_accounts_async()
+            await asyncio.sleep(interval)
 
     def _calculate_days_remaining(self, access_expires) -> int | None:
         """ Расчет оставшихся дней доступа """
@@ -690,256 +899,200 @@ class UserManager:
         expires_date = datetime.fromisoformat(access_expires)
         return max(0, (expires_date - datetime.now()).days)
 
-    def is_user_active(self, telegram_id: int) -> bool:
+    async def is_user_active_async(self, telegram_id: int) -> bool:
         """ Проверка активности пользователя """
-        user = self.get_user(telegram_id)
-        return user and user['is_active'] and (
-                not user['access_expires'] or datetime.now() <= datetime.fromisoformat(user['access_expires'])
-        )
+        user = await self.get_user_async(telegram_id)
+        return user is not None and user['status'] == 'active'
+
+    def is_user_active(self, telegram_id: int) -> bool:
+        return self._run_sync(self.is_user_active_async(telegram_id))
 
     def is_admin(self, telegram_id: int) -> bool:
-        """ Проверка прав администратора """
-        user = self.get_user(telegram_id)
-        return user and user['is_active'] and user['role'] == 'admin'
+        """ Проверка прав администратора (активный пользователь с ролью admin) """
+        return telegram_id in self._admin_ids
 
-    def set_admin_contact(self, contact_info: str) -> bool:
+    async def set_admin_contact_async(self, contact_info: str) -> bool:
         """ Установка контакта администратора для всех пользователей """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                UPDATE users SET admin_contact = ? WHERE role = 'recruiter'
-            ''', (contact_info,))
+            async with self._get_async_connection() as conn:
+                await conn.execute('''
+                    UPDATE users SET admin_contact = ? WHERE role = 'recruiter'
+                ''', (contact_info,))
+                await conn.commit()
 
-            conn.commit()
-            conn.close()
+            await self._refresh_snapshot_async()
             logger.info(f"Установлен контакт администратора: {contact_info}")
             return True
         except Exception as e:
             logger.error(f"Ошибка установки контакта администратора: {e}")
             return False
 
-    def delete_user(self, telegram_id: int) -> bool:
+    def set_admin_contact(self, contact_info: str) -> bool:
+        return self._run_sync(self.set_admin_contact_async(contact_info))
+
+    async def delete_user_async(self, telegram_id: int) -> bool:
         """ Удаление пользователя из базы данных """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('DELETE FROM users WHERE telegram_id = ?', (telegram_id,))
-            conn.commit()
-            conn.close()
+            async with self._get_async_connection() as conn:
+                await conn.execute('DELETE FROM users WHERE telegram_id = ?', (telegram_id,))
+                await conn.execute('DELETE FROM usage_daily WHERE telegram_id = ?', (telegram_id,))
+                await conn.commit()
 
+            await self._refresh_snapshot_async()
             logger.info(f"Пользователь {telegram_id} удален из базы данных")
             return True
         except Exception as e:
             logger.error(f"Ошибка удаления пользователя {telegram_id}: {e}")
             return False
 
-    def save_system_setting(self, key: str, value: str) -> bool:
+    def delete_user(self, telegram_id: int) -> bool:
+        return self._run_sync(self.delete_user_async(telegram_id))
+
+    async def save_system_setting_async(self, key: str, value: str) -> bool:
         """ Сохранение системных настроек """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS system_settings (
-                    key TEXT PRIMARY KEY,
-                    value TEXT,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-
-            cursor.execute('''
-                INSERT OR REPLACE INTO system_settings (key, value) 
-                VALUES (?, ?)
-            ''', (key, value))
-
-            conn.commit()
-            conn.close()
+            async with self._get_async_connection() as conn:
+                await conn.execute('''
+                    INSERT OR REPLACE INTO system_settings (key, value)
+                    VALUES (?, ?)
+                ''', (key, value))
+                await conn.commit()
+            self._settings = {**self._settings, key: value}
             logger.info(f"Сохранена системная настройка: {key} = {value}")
             return True
         except Exception as e:
             logger.error(f"Ошибка сохранения системной настройки: {e}")
             return False
 
-    def get_system_setting(self, key: str, default: str = None) -> str:
-        """ Получение системных настроек """
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS system_settings (
-                    key TEXT PRIMARY KEY,
-                    value TEXT,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-
-            cursor.execute('SELECT value FROM system_settings WHERE key = ?', (key,))
-            result = cursor.fetchone()
-            conn.close()
+    def save_system_setting(self, key: str, value: str) -> bool:
+        return self._run_sync(self.save_system_setting_async(key, value))
 
-            return result[0] if result else default
-        except Exception as e:
-            logger.error(f"Ошибка получения системной настройки: {e}")
-            return default
+    def get_system_setting(self, key: str, default: str = None) -> str:
+        """ Получение системных настроек (из снимка в памяти) """
+        return self._settings.get(key, default)
 
     def can_download_resume(self, telegram_id: int) -> Tuple[bool, str]:
-        """ Проверка возможности скачивания резюме """
-        user = self.get_user(telegram_id)
-        if not user:
-            return False, "Пользователь не найден"
-
-        self._check_monthly_reset(telegram_id)
-
-        user = self.get_user(telegram_id)
-        admin_contact = self.get_admin_contact()
-
-        today = datetime.now().date().isoformat()
-        if user['last_resume_date'] != today:
-            self.reset_daily_resumes(telegram_id)
-            user = self.get_user(telegram_id)
-
-        if user['resumes_limit'] > 0:
-            if user['resumes_today'] >= user['resumes_limit']:
-                return False, f"📊 Дневной лимит резюме исчерпан ({user['resumes_today']}/{user['resumes_limit']})\n\nДля увеличения лимита обратитесь к админу {admin_contact}"
-
-            if user['resumes_this_month'] >= user['resumes_limit']:
-                return False, f"📅 Месячный лимит резюме исчерпан ({user['resumes_this_month']}/{user['resumes_limit']})\n\nДля увеличения лимита обратитесь к админу {admin_contact}"
+        return self._run_sync(self.can_download_resume_async(telegram_id))
 
-        return True, ""
+    async def increment_resume_count_async(self, telegram_id: int) -> bool:
+        """ Увеличение счетчика скачанных резюме (без проверки лимита, см. reserve_resume_async) """
+        try:
+            async with self._get_async_connection() as conn:
+                await conn.execute('''
+                    INSERT INTO usage_daily (telegram_id, day, resumes) VALUES (?, ?, 1)
+                    ON CONFLICT(telegram_id, day) DO UPDATE SET resumes = resumes + 1
+                ''', (telegram_id, datetime.now().date().isoformat()))
+                await conn.commit()
+            logger.info(f"✅ Увеличен счетчик резюме для {telegram_id}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка увеличения счетчика резюме: {e}")
+            return False
 
     def increment_resume_count(self, telegram_id: int) -> bool:
-        """ Увеличение счетчика скачанных резюме """
-        try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                today = datetime.now().date().isoformat()
+        return self._run_sync(self.increment_resume_count_async(telegram_id))
 
-                cursor.execute(
-                    'SELECT resumes_today, resumes_this_month, resumes_total FROM users WHERE telegram_id = ?',
-                    (telegram_id,))
-                current = cursor.fetchone()
-                if current:
-                    logger.info(f"📊 ДО увеличения для {telegram_id}: today={current[0]}, month={current[1]}, total={current[2]}")
+    async def reserve_resume_async(self, telegram_id: int) -> Tuple[Optional[Dict], str]:
+        """ Резервирование одного резюме из лимита (одним INSERT ... ON CONFLICT ... RETURNING)
 
-                cursor.execute('''
-                    UPDATE users 
-                    SET resumes_today = resumes_today + 1,
-                        resumes_this_month = resumes_this_month + 1,
-                        resumes_total = resumes_total + 1,
-                        last_resume_date = ?
-                    WHERE telegram_id = ?
-                ''', (today, telegram_id))
+        Проверка дневного и месячного лимита и увеличение счетчика дня идут
+        одной командой, поэтому одновременные скачивания не могут превысить
+        resumes_limit. Возвращает (резерв, "") или (None, сообщение об отказе).
+        После отправки - commit_resume, при ошибке отправки - release_resume_async.
+        """
+        params = {'telegram_id': telegram_id, **usage_params()}
+        try:
+            async with self._get_async_connection() as conn:
+                cursor = await conn.execute(RESERVE_RESUME_SQL, params)
+                row = await cursor.fetchone()
+                await conn.commit()
 
-                conn.commit()
+                if row:
+                    return {
+                        'telegram_id': telegram_id,
+                        'day': params['today'],
+                        'resumes_today': row[0],
+                        'state': 'reserved'
+                    }, ""
+
+                cursor = await conn.execute(f'''
+                    SELECT resumes_limit, {USAGE_COLUMNS_SQL}
+                    FROM users WHERE telegram_id = :telegram_id
+                ''', params)
+                user_data = await cursor.fetchone()
+        except Exception as e:
+            logger.error(f"❌ Ошибка резервирования резюме для {telegram_id}: {e}")
+            return None, "❌ Ошибка проверки лимита"
 
-                cursor.execute(
-                    'SELECT resumes_today, resumes_this_month, resumes_total FROM users WHERE telegram_id = ?',
-                    (telegram_id,))
-                updated = cursor.fetchone()
-                if updated:
-                    logger.info(f"📊 ПОСЛЕ увеличения для {telegram_id}: today={updated[0]}, month={updated[1]}, total={updated[2]}")
-
-                if current and updated:
-                    if (updated[0] == current[0] + 1 and
-                            updated[1] == current[1] + 1 and
-                            updated[2] == current[2] + 1):
-                        logger.info(f"✅ Увеличен счетчик резюме для {telegram_id}")
-                        return True
-                    else:
-                        logger.warning(f"⚠️ Данные не изменились для {telegram_id}")
-                        return False
-                else:
-                    logger.warning(f"⚠️ Не удалось проверить обновление для {telegram_id}")
-                    return False
+        if not user_data:
+            return None, "Пользователь не найден"
 
-        except Exception as e:
-            logger.error(f"❌ Ошибка увеличения счетчика резюме: {e}")
+        resumes_limit, _, resumes_today, resumes_this_month, _ = user_data
+        admin_contact = self.get_admin_contact()
+        if resumes_today >= resumes_limit:
+            return None, f"📊 Дневной лимит резюме исчерпан ({resumes_today}/{resumes_limit})\n\nДля увеличения лимита обратитесь к админу {admin_contact}"
+        return None, f"📅 Месячный лимит резюме исчерпан ({resumes_this_month}/{resumes_limit})\n\nДля увеличения лимита обратитесь к админу {admin_contact}"
+
+    def commit_resume(self, reservation: Dict):
+        """ Резюме отправлено: резерв становится окончательным (без записи в БД) """
+        if reservation['state'] == 'reserved':
+            reservation['state'] = 'committed'
+            logger.info(f"✅ Резюме засчитано {reservation['telegram_id']}: сегодня={reservation['resumes_today']}")
+
+    async def release_resume_async(self, reservation: Dict) -> bool:
+        """ Отправка не удалась: возврат резерва в корзину того дня, когда он был взят """
+        if reservation['state'] != 'reserved':
             return False
-
-    def reset_daily_resumes(self, telegram_id: int) -> bool:
-        """ Сброс дневного счетчика резюме """
+        reservation['state'] = 'released'
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE users SET resumes_today = 0 
-                    WHERE telegram_id = ?
-                ''', (telegram_id,))
-                conn.commit()
+            async with self._get_async_connection() as conn:
+                await conn.execute(
+                    'UPDATE usage_daily SET resumes = MAX(resumes - 1, 0) WHERE telegram_id = ? AND day = ?',
+                    (reservation['telegram_id'], reservation['day'])
+                )
+                await conn.commit()
                 return True
         except Exception as e:
-            logger.error(f"Ошибка сброса дневных резюме: {e}")
+            logger.error(f"❌ Ошибка возврата резерва резюме для {reservation['telegram_id']}: {e}")
             return False
 
-    def _check_monthly_reset(self, telegram_id: int):
-        """ Проверка и сброс месячного счетчика """
-        user = self.get_user(telegram_id)
-        if not user:
-            return
-
-        current_month = datetime.now().strftime('%Y-%m')
-        last_reset_month = user['monthly_reset_date']
-
-        if last_reset_month != current_month:
-            try:
-                with self._get_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        UPDATE users 
-                        SET resumes_this_month = 0,
-                            monthly_reset_date = ?
-                        WHERE telegram_id = ?
-                    ''', (current_month, telegram_id))
-                    conn.commit()
-            except Exception as e:
-                logger.error(f"Ошибка месячного сброса резюме: {e}")
-
-    def force_monthly_reset_check(self, telegram_id: int):
-        """ Принудительная проверка и сброс месячного счетчика """
-        self._check_monthly_reset(telegram_id)
-
-    async def force_monthly_reset_check_async(self, telegram_id: int):
-        """ Асинхронная принудительная проверка и сброс месячного счетчика """
-        await self._check_monthly_reset_async(telegram_id)
+    def reset_daily_resumes(self, telegram_id: int) -> bool:
+        return self._run_sync(self.reset_daily_resumes_async(telegram_id))
 
-    def update_resumes_limit(self, telegram_id: int, resumes_limit: int) -> bool:
+    async def update_resumes_limit_async(self, telegram_id: int, resumes_limit: int) -> bool:
         """ Обновление лимита резюме """
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE users SET resumes_limit = ? 
+            async with self._get_async_connection() as conn:
+                await conn.execute('''
+                    UPDATE users SET resumes_limit = ?
                     WHERE telegram_id = ?
                 ''', (resumes_limit, telegram_id))
-                conn.commit()
-                logger.info(f"Обновлен лимит резюме пользователя {telegram_id}: {resumes_limit}")
-                return True
+                await conn.commit()
+            logger.info(f"Обновлен лимит резюме пользователя {telegram_id}: {resumes_limit}")
+            return True
         except Exception as e:
             logger.error(f"Ошибка обновления лимита резюме: {e}")
             return False
 
-    def get_resume_stats(self, telegram_id: int) -> Dict[str, Any]:
+    def update_resumes_limit(self, telegram_id: int, resumes_limit: int) -> bool:
+        return self._run_sync(self.update_resumes_limit_async(telegram_id, resumes_limit))
+
+    async def get_resume_stats_async(self, telegram_id: int) -> Dict[str, Any]:
         """ Получение статистики по резюме """
-        user = self.get_user(telegram_id)
+        user = await self.get_user_async(telegram_id)
         if not user:
             return {}
 
-        self.force_daily_reset_check(telegram_id)
-        self._check_monthly_reset(telegram_id)
-        user = self.get_user(telegram_id)
-
         return {
             'resumes_today': user['resumes_today'],
             'resumes_this_month': user['resumes_this_month'],
             'resumes_total': user['resumes_total'],
-            'resumes_limit': user['resumes_limit'],
-            'monthly_reset_date': user['monthly_reset_date']
+            'resumes_limit': user['resumes_limit']
         }
 
+    def get_resume_stats(self, telegram_id: int) -> Dict[str, Any]:
+        return self._run_sync(self.get_resume_stats_async(telegram_id))
+
     async def can_download_resume_async(self, telegram_id: int) -> Tuple[bool, str]:
         """ Асинхронная проверка возможности скачивания резюме """
         try:
@@ -947,12 +1100,6 @@ class UserManager:
             if not user:
                 return False, "❌ Пользователь не найден"
 
-            await self._check_monthly_reset_async(telegram_id)
-
-            today = datetime.now().date().isoformat()
-            if user['last_resume_date'] != today:
-                await self.reset_daily_resumes_async(telegram_id)
-
             if user['resumes_limit'] > 0:
                 if user['resumes_today'] >= user['resumes_limit']:
                     return False, f"📊 Дневной лимит резюме исчерпан ({user['resumes_today']}/{user['resumes_limit']})"
@@ -968,105 +1115,46 @@ class UserManager:
 
     async def is_admin_async(self, telegram_id: int) -> bool:
         """ Асинхронная проверка прав администратора """
-        user = await self.get_user_async(telegram_id)
-        return user and user['is_active'] and user['role'] == 'admin'
-
-    async def _check_monthly_reset_async(self, telegram_id: int):
-        """ Асинхронная проверка и сброс месячного счетчика """
-        user = await self.get_user_async(telegram_id)
-        if not user:
-            return
-
-        current_month = datetime.now().strftime('%Y-%m')
-        last_reset_month = user['monthly_reset_date']
-
-        if last_reset_month != current_month:
-            try:
-                async with self._get_async_connection() as conn:
-                    cursor = await conn.cursor()
-                    await cursor.execute('''
-                           UPDATE users 
-                           SET resumes_this_month = 0,
-                               monthly_reset_date = ?
-                           WHERE telegram_id = ?
-                       ''', (current_month, telegram_id))
-                    await conn.commit()
-            except Exception as e:
-                logger.error(f"❌ Ошибка месячного сброса резюме: {e}")
+        return self.is_admin(telegram_id)
 
     async def reset_daily_resumes_async(self, telegram_id: int) -> bool:
-        """ Асинхронный сброс дневного счетчика резюме """
+        """ Асинхронный сброс счетчика резюме за сегодня """
         try:
             async with self._get_async_connection() as conn:
-                cursor = await conn.cursor()
-                await cursor.execute('''
-                       UPDATE users SET resumes_today = 0 
-                       WHERE telegram_id = ?
-                   ''', (telegram_id,))
+                await conn.execute(
+                    'UPDATE usage_daily SET resumes = 0 WHERE telegram_id = ? AND day = ?',
+                    (telegram_id, datetime.now().date().isoformat())
+                )
                 await conn.commit()
                 return True
         except Exception as e:
             logger.error(f"❌ Ошибка сброса дневных резюме: {e}")
             return False
 
-    def force_daily_reset_check(self, telegram_id: int):
-        """Принудительная проверка и сброс дневного счетчика"""
+    async def update_user_info_async(self, telegram_id: int, username: str = None, first_name: str = None,
+                                     last_name: str = None) -> bool:
+        """ Обновление информации о пользователе (пустые значения не затирают сохраненные) """
         try:
-            user = self.get_user(telegram_id)
-            if not user:
-                return
-
-            today = datetime.now().date().isoformat()
-            last_resume_date = user['last_resume_date']
-
-            if last_resume_date != today:
-                with self._get_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        UPDATE users 
-                        SET resumes_today = 0,
-                            last_resume_date = ?
-                        WHERE telegram_id = ?
-                    ''', (today, telegram_id))
-                    conn.commit()
-                    logger.info(f"✅ Дневной сброс резюме для пользователя {telegram_id}")
-
+            async with self._get_async_connection() as conn:
+                cursor = await conn.execute('''
+                    UPDATE users
+                    SET username = COALESCE(NULLIF(TRIM(?), ''), username),
+                        first_name = COALESCE(NULLIF(TRIM(?), ''), first_name),
+                        last_name = COALESCE(NULLIF(TRIM(?), ''), last_name)
+                    WHERE telegram_id = ?
+                ''', (username, first_name, last_name, telegram_id))
+                await conn.commit()
+                updated = cursor.rowcount > 0
+            if updated:
+                logger.info(f"✅ Обновлена информация пользователя {telegram_id}: username='{username}'")
+            return updated
         except Exception as e:
-            logger.error(f"❌ Ошибка дневного сброса резюме: {e}")
+            logger.error(f"❌ Ошибка обновления информации пользователя {telegram_id}: {e}")
+            return False
 
     def update_user_info(self, telegram_id: int, username: str = None, first_name: str = None,
                          last_name: str = None) -> bool:
-        """ Обновление информации о пользователе """
-        try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-
-                cursor.execute(
-                    'SELECT username, first_name, last_name FROM users WHERE telegram_id = ?',
-                    (telegram_id,)
-                )
-                current_data = cursor.fetchone()
-
-                if current_data:
-                    current_username, current_first_name, current_last_name = current_data
-
-                    new_username = username if username is not None and username.strip() != "" else current_username
-                    new_first_name = first_name if first_name is not None and first_name.strip() != "" else current_first_name
-                    new_last_name = last_name if last_name is not None and last_name.strip() != "" else current_last_name
-
-                    cursor.execute('''
-                                   UPDATE users 
-                                   SET username = ?, first_name = ?, last_name = ?
-                                   WHERE telegram_id = ?
-                               ''', (new_username, new_first_name, new_last_name, telegram_id))
-
-                    conn.commit()
-                    logger.info(f"✅ Обновлена информация пользователя {telegram_id}: username='{new_username}'")
-                    return True
-                return False
-        except Exception as e:
-            logger.error(f"❌ Ошибка обновления информации пользователя {telegram_id}: {e}")
-            return False
+        return self._run_sync(self.update_user_info_async(telegram_id, username, first_name, last_name))
 
     def update_admin_contact_in_db(self):
         """ Обновляет контакт администратора в существующих записях """
@@ -0,0 +1,70 @@
+""" Сравнение резервного поиска: LIKE '%слово%' против триграммного индекса
+
+Запуск: python benchmarks/fallback_search.py [количество_документов]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_indexer import OptimizedPDFIndexer, SUBSTRING_SEARCH_SQL
+
+VOCABULARY = (
+    "опыт продажи клиент отдел команда бюджет рынок аналитика отчеты переговоры закупки "
+    "логистика склад маркетинг подбор персонала адаптация сотрудников руководство проектом "
+    "внедрение CRM тендеры поставщики дистрибуция региональные дилеры обучение наставничество"
+).split()
+
+
+def build_corpus(indexer: OptimizedPDFIndexer, documents: int, words_per_document: int):
+    """ Заполнение pdf_index синтетическими резюме (триггеры заполняют триграммы) """
+    random.seed(42)
+    with sqlite3.connect(indexer.db_path) as conn:
+        rows = []
+        for i in range(documents):
+            words = [random.choice(VOCABULARY) for _ in range(words_per_document)]
+            words[random.randrange(words_per_document)] = f"уникум{i}"
+            rows.append((f"Candidate_{i}.pdf", ' '.join(words), f"Candidate {i}", 0))
+        conn.executemany(
+            "INSERT INTO pdf_index (filename, content, candidate_name, file_size) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        conn.commit()
+
+
+def measure(conn, sql: str, params_list, repeat: int = 3) -> float:
+    """ Среднее время одного запроса в миллисекундах """
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for params in params_list:
+            conn.execute(sql, params).fetchall()
+    return (time.perf_counter() - started) * 1000 / (repeat * len(params_list))
+
+
+def main():
+    documents = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        indexer = OptimizedPDFIndexer(db_path=os.path.join(tmp, 'pdf_index.db'))
+        build_corpus(indexer, documents, words_per_document=2500)
+
+        words = [f"уникум{random.randrange(documents)}" for _ in range(10)] + ['дилеры', 'наставничество']
+        with sqlite3.connect(indexer.db_path) as conn:
+            like_ms = measure(
+                conn,
+                "SELECT filename, candidate_name, content FROM pdf_index WHERE content LIKE ? LIMIT ?",
+                [(f'%{word}%', 20) for word in words]
+            )
+            trigram_ms = measure(conn, SUBSTRING_SEARCH_SQL, [(f'"{word}"', 20) for word in words])
+
+    print(f"📚 Документов: {documents}")
+    print(f"🐢 LIKE '%слово%':      {like_ms:8.2f} мс/запрос")
+    print(f"⚡ Триграммный индекс: {trigram_ms:8.2f} мс/запрос")
+    print(f"📈 Ускорение: x{like_ms / trigram_ms:.1f}")
+
+
+if __name__ == '__main__':
+    main()
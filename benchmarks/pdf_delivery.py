@@ -0,0 +1,105 @@
+""" Отправка больших резюме: оригиналы против сжатых копий
+
+Запуск: python benchmarks/pdf_delivery.py [папка_с_pdf] [скорость_мбит]
+
+Без папки (или если в ней нет больших PDF) используются синтетические файлы
+с несжатыми потоками. Время отправки оценивается по скорости канала; если заданы
+BOT_TOKEN и BENCH_CHAT_ID, файлы реально отправляются в этот чат.
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PyPDF2
+from PyPDF2.generic import DecodedStreamObject, NameObject
+from pdf_optimizer import PDFOptimizer
+
+
+def build_synthetic_pdf(path: str, pages: int = 40, lines_per_page: int = 2000):
+    """ PDF с несжатыми потоками содержимого (так выглядят выгрузки некоторых HR-систем) """
+    writer = PyPDF2.PdfWriter()
+    for page_no in range(pages):
+        writer.add_blank_page(width=595, height=842)
+        page = writer.pages[-1]
+        stream = DecodedStreamObject()
+        operators = [f"BT /F1 8 Tf 20 {800 - i % 90 * 9} Td (Опыт работы, страница {page_no}, строка {i}) Tj ET"
+                     for i in range(lines_per_page)]
+        stream.set_data('\n'.join(operators).encode('latin-1', 'replace'))
+        page[NameObject('/Contents')] = writer._add_object(stream)
+    writer.add_metadata({'/Producer': 'synthetic benchmark', '/Title': 'x' * 10000})
+    with open(path, 'wb') as output:
+        writer.write(output)
+
+
+async def measure_telegram(pairs) -> list:
+    """ Реальная отправка (оригинал, копия) в BENCH_CHAT_ID: секунды на файл """
+    from telegram import Bot
+    bot = Bot(os.environ['BOT_TOKEN'])
+    chat_id = int(os.environ['BENCH_CHAT_ID'])
+    timings = []
+    async with bot:
+        for original, optimized in pairs:
+            row = []
+            for path in (original, optimized):
+                started = time.perf_counter()
+                with open(path, 'rb') as document:
+                    await bot.send_document(chat_id, document, filename=os.path.basename(path),
+                                            read_timeout=120, write_timeout=120, connect_timeout=30)
+                row.append(time.perf_counter() - started)
+            timings.append(tuple(row))
+    return timings
+
+
+def main():
+    folder = sys.argv[1] if len(sys.argv) > 1 else None
+    megabits = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        optimizer = PDFOptimizer(db_path=os.path.join(tmp, 'bench.db'), folder=tmp)
+
+        sources = []
+        if folder:
+            sources = [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+                       if name.lower().endswith('.pdf') and os.path.getsize(os.path.join(folder, name)) >= optimizer.min_size]
+        if not sources:
+            for i in range(3):
+                path = os.path.join(tmp, f"synthetic_{i}.pdf")
+                build_synthetic_pdf(path)
+                sources.append(path)
+
+        pairs = []
+        original_total = optimized_total = 0
+        started = time.perf_counter()
+        for source in sources:
+            target = os.path.join(tmp, f"optimized_{os.path.basename(source)}")
+            method = optimizer.optimize_file(source, target)
+            original_size = os.path.getsize(source)
+            optimized_size = os.path.getsize(target) if method else original_size
+            original_total += original_size
+            optimized_total += optimized_size
+            pairs.append((source, target if method else source))
+            print(f"📄 {os.path.basename(source)}: {original_size / 1024 / 1024:.1f}MB -> "
+                  f"{optimized_size / 1024 / 1024:.1f}MB ({method or 'без изменений'})")
+        optimize_seconds = time.perf_counter() - started
+
+        bytes_per_second = megabits * 1024 * 1024 / 8
+        print(f"\n📚 Файлов: {len(sources)}, сжатие {optimize_seconds:.1f}с "
+              f"({'ghostscript' if optimizer.ghostscript else 'PyPDF2'})")
+        print(f"🗜 Сэкономлено: {(original_total - optimized_total) / 1024 / 1024:.1f}MB "
+              f"({(1 - optimized_total / original_total) * 100:.0f}%)")
+        print(f"🐢 Отправка оригиналов ({megabits:.0f} Мбит/с): {original_total / bytes_per_second / len(sources):6.2f} с/файл")
+        print(f"⚡ Отправка копий      ({megabits:.0f} Мбит/с): {optimized_total / bytes_per_second / len(sources):6.2f} с/файл")
+
+        if os.getenv('BOT_TOKEN') and os.getenv('BENCH_CHAT_ID'):
+            timings = asyncio.run(measure_telegram(pairs))
+            original_avg = sum(t[0] for t in timings) / len(timings)
+            optimized_avg = sum(t[1] for t in timings) / len(timings)
+            print(f"📤 Telegram: оригинал {original_avg:.2f} с/файл, копия {optimized_avg:.2f} с/файл")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,12 @@
-from config import BOT_TOKEN, RESUMES_FOLDER
+from config import BOT_TOKEN, RESUMES_FOLDER, MAX_CONCURRENT_USERS, ACCESS_EXPIRY_SWEEP_INTERVAL
 import os
 import logging
-from pdf_indexer import pdf_indexer
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ConversationHandler
 from telegram.ext import CallbackQueryHandler
-from handlers import (start, handle_message, error_handler, handle_pdf_search_decision, get_my_id, quick_get_id, check_index_status)
-from admin_handlers import (
-    admin_panel, show_users_list, change_requests_limit, change_access_days,
-    reset_counters, handle_resumes_limit_input, show_users_panel, show_limits_panel, show_database_panel, show_settings_panel,
-    clear_search_cache, show_system_stats, deactivate_user_command, activate_user_command, handle_resume_upload, handle_update_interval_input,
-    cancel_upload, handle_logging_level_input, change_resumes_limit, add_user_with_limits, change_admin_panel, handle_new_admin_input,
-    handle_limits_input, handle_deactivate_id_input, handle_activate_id_input, handle_admin_change_confirmation, upload_resumes,
-    handle_new_user_with_limits, delete_user_command, handle_delete_id_input, cancel_operation, change_update_interval, change_logging,
-    AWAITING_LIMITS_INPUT, AWAITING_DEACTIVATE_ID, AWAITING_ACTIVATE_ID, AWAITING_NEW_USER_DATA, AWAITING_DELETE_ID, AWAITING_RESUME_UPLOAD,
-    AWAITING_NEW_ADMIN_CONFIRM, AWAITING_UPDATE_INTERVAL, AWAITING_LOGGING_LEVEL, AWAITING_NEW_ADMIN, AWAITING_RESUMES_LIMIT
-)
+
+# Модули бота импортируются внутри функций: процессы пула поиска (spawn) заново
+# импортируют этот файл как __mp_main__, и верхний уровень не должен создавать
+# синглтоны (база пользователей, индекс PDF, очереди) в каждом процессе.
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -23,17 +15,79 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+async def post_init(application: Application) -> None:
+    """ Запуск фоновых сервисов после инициализации бота """
+    from search_service import search_service
+    from send_queue import outbound
+    from analytics import analytics
+    from broadcast import broadcaster
+    from session_store import search_sessions
+    from pdf_optimizer import pdf_optimizer
+    from auth import user_manager
+
+    search_service.start()
+    outbound.start()
+    analytics.start()
+    user_manager.start_expiry_sweeper(ACCESS_EXPIRY_SWEEP_INTERVAL)
+    broadcaster.start(application.bot)
+    search_sessions.start(application)
+    pdf_optimizer.start()
+
+
+async def post_shutdown(application: Application) -> None:
+    """ Остановка фоновых сервисов """
+    from search_service import search_service
+    from send_queue import outbound
+    from analytics import analytics
+    from broadcast import broadcaster
+    from session_store import search_sessions
+    from pdf_optimizer import pdf_optimizer
+    from auth import user_manager
+
+    await pdf_optimizer.stop()
+    await search_sessions.stop()
+    await broadcaster.stop()
+    await outbound.stop()
+    await analytics.stop()
+    await user_manager.stop_expiry_sweeper()
+    search_service.shutdown()
+
+
 def main():
     """ Основная функция запуска бота """
+    from pdf_indexer import pdf_indexer
+    from update_processor import ChatOrderedUpdateProcessor
+    from persistence import SQLitePersistence
+    from handlers import (start, handle_message, error_handler, handle_pdf_search_decision, get_my_id, quick_get_id, check_index_status)
+    from admin_handlers import (
+        admin_panel, show_users_list, show_users_page, change_requests_limit, change_access_days,
+        reset_counters, handle_resumes_limit_input, show_users_panel, show_limits_panel, show_database_panel, show_settings_panel,
+        clear_search_cache, show_system_stats, deactivate_user_command, activate_user_command, handle_resume_upload, handle_update_interval_input,
+        cancel_upload, handle_logging_level_input, change_resumes_limit, add_user_with_limits, change_admin_panel, handle_new_admin_input,
+        handle_limits_input, handle_deactivate_id_input, handle_activate_id_input, handle_admin_change_confirmation, upload_resumes,
+        handle_new_user_with_limits, delete_user_command, handle_delete_id_input, cancel_operation, change_update_interval, change_logging,
+        AWAITING_LIMITS_INPUT, AWAITING_DEACTIVATE_ID, AWAITING_ACTIVATE_ID, AWAITING_NEW_USER_DATA, AWAITING_DELETE_ID, AWAITING_RESUME_UPLOAD,
+        AWAITING_NEW_ADMIN_CONFIRM, AWAITING_UPDATE_INTERVAL, AWAITING_LOGGING_LEVEL, AWAITING_NEW_ADMIN, AWAITING_RESUMES_LIMIT,
+        broadcast_panel, cancel_broadcast, stop_broadcast_job, handle_broadcast_target, handle_broadcast_text, handle_broadcast_confirmation,
+        AWAITING_BROADCAST_TARGET, AWAITING_BROADCAST_TEXT, AWAITING_BROADCAST_CONFIRM,
+        import_users_command, handle_users_import, export_users, AWAITING_USERS_IMPORT
+    )
 
-    application = Application.builder().token(BOT_TOKEN).read_timeout(30).write_timeout(30).build()
+    application = (
+        Application.builder().token(BOT_TOKEN).read_timeout(30).write_timeout(30)
+        .concurrent_updates(ChatOrderedUpdateProcessor(MAX_CONCURRENT_USERS))
+        .persistence(SQLitePersistence())
+        .post_init(post_init).post_shutdown(post_shutdown).build()
+    )
 
     # === ОБРАБОТЧИКИ CALLBACK QUERIES (должны быть первыми) ===
 
     # Специфичные обработчики callback queries
     callback_patterns = [
         ("show_other_results", handle_pdf_search_decision),
-        ("finish_search", handle_pdf_search_decision)
+        ("finish_search", handle_pdf_search_decision),
+        ("users_page:.+", show_users_page),
+        ("broadcast_stop:\\d+", stop_broadcast_job)
     ]
 
     for pattern, handler in callback_patterns:
@@ -49,6 +103,8 @@ def main():
 
     # ConversationHandler для добавления пользователя
     add_user_conv = ConversationHandler(
+        name='add_user',
+        persistent=True,
         entry_points=[MessageHandler(filters.Regex('^➕ Добавить пользователя$'), add_user_with_limits)],
         states={
             AWAITING_NEW_USER_DATA: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_new_user_with_limits)]
@@ -59,6 +115,8 @@ def main():
 
     # ConversationHandler для удаления пользователя
     delete_user_conv = ConversationHandler(
+        name='delete_user',
+        persistent=True,
         entry_points=[MessageHandler(filters.Regex('^🗑️ Удалить пользователя$'), delete_user_command)],
         states={
             AWAITING_DELETE_ID: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_delete_id_input)]
@@ -67,7 +125,23 @@ def main():
     )
     application.add_handler(delete_user_conv)
 
+    # ConversationHandler для импорта пользователей из CSV
+    import_users_conv = ConversationHandler(
+        name='import_users',
+        persistent=True,
+        entry_points=[MessageHandler(filters.Regex('^📥 Импорт CSV$'), import_users_command)],
+        states={
+            AWAITING_USERS_IMPORT: [
+                MessageHandler(filters.Document.ALL | (filters.TEXT & ~filters.COMMAND), handle_users_import)
+            ]
+        },
+        fallbacks=[CommandHandler('cancel', cancel_operation)]
+    )
+    application.add_handler(import_users_conv)
+
     change_admin_conv = ConversationHandler(
+        name='change_admin',
+        persistent=True,
         entry_points=[MessageHandler(filters.Regex('^👑 Сменить администратора$'), change_admin_panel)],
         states={
             AWAITING_NEW_ADMIN: [
@@ -86,6 +160,8 @@ def main():
 
     # ConversationHandler для загрузки резюме
     resume_upload_conv = ConversationHandler(
+        name='resume_upload',
+        persistent=True,
         entry_points=[MessageHandler(filters.Regex('^📤 Загрузка новых резюме$'), upload_resumes)],
         states={
             AWAITING_RESUME_UPLOAD: [MessageHandler(filters.ATTACHMENT | filters.TEXT, handle_resume_upload)]
@@ -96,6 +172,8 @@ def main():
 
     # ConversationHandler для управления лимитами
     limits_conv_handler = ConversationHandler(
+        name='limits',
+        persistent=True,
         entry_points=[
             MessageHandler(filters.Regex('^🔢 Лимит запросов$'), change_requests_limit),
             MessageHandler(filters.Regex('^📅 Лимит дней$'), change_access_days)
@@ -108,6 +186,8 @@ def main():
     application.add_handler(limits_conv_handler)
 
     resumes_limit_conv = ConversationHandler(
+        name='resumes_limit',
+        persistent=True,
         entry_points=[MessageHandler(filters.Regex('^📄 Лимит резюме$'), change_resumes_limit)],
         states={
             AWAITING_RESUMES_LIMIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_resumes_limit_input)]
@@ -118,6 +198,8 @@ def main():
 
     # ConversationHandler для активации/деактивации пользователей
     user_status_conv_handler = ConversationHandler(
+        name='user_status',
+        persistent=True,
         entry_points=[
             MessageHandler(filters.Regex('^🔒 Деактивировать пользователя$'), deactivate_user_command),
             MessageHandler(filters.Regex('^🔓 Активировать пользователя$'), activate_user_command)
@@ -133,6 +215,8 @@ def main():
 
     # ConversationHandler для настроек системы
     settings_conv_handler = ConversationHandler(
+        name='settings',
+        persistent=True,
         entry_points=[
             MessageHandler(filters.Regex('^🕐 Изменить интервал обновления$'), change_update_interval),
             MessageHandler(filters.Regex('^📊 Логирование$'), change_logging),
@@ -145,6 +229,24 @@ def main():
     )
     application.add_handler(settings_conv_handler)
 
+    # ConversationHandler для рассылки
+    broadcast_input = filters.TEXT & ~filters.COMMAND & ~filters.Regex('^⬅️ Назад в админку$')
+    broadcast_conv = ConversationHandler(
+        name='broadcast',
+        persistent=True,
+        entry_points=[MessageHandler(filters.Regex('^📢 Рассылка$'), broadcast_panel)],
+        states={
+            AWAITING_BROADCAST_TARGET: [MessageHandler(broadcast_input, handle_broadcast_target)],
+            AWAITING_BROADCAST_TEXT: [MessageHandler(broadcast_input, handle_broadcast_text)],
+            AWAITING_BROADCAST_CONFIRM: [MessageHandler(broadcast_input, handle_broadcast_confirmation)]
+        },
+        fallbacks=[
+            CommandHandler('cancel', cancel_broadcast),
+            MessageHandler(filters.Regex('^⬅️ Назад в админку$'), cancel_broadcast)
+        ]
+    )
+    application.add_handler(broadcast_conv)
+
     # === ОБРАБОТЧИКИ АДМИН-ПАНЕЛИ ===
     admin_handlers = [
         ('^⚙️ Панель управления$', admin_panel),
@@ -169,6 +271,7 @@ def main():
         ('^✅ Активные$', show_users_list),
         ('^❌ Деактивированные$', show_users_list),
         ('^⏰ Истек срок$', show_users_list),
+        ('^📤 Экспорт CSV$', export_users),
 
         # Кнопки панели лимитов
         ('^🔢 Лимит запросов$', change_requests_limit),
@@ -229,15 +332,19 @@ def main():
     try:
         stats = pdf_indexer.get_index_stats()
         print(f"✅ Индекс базы: {stats['total_indexed_files']} файлов")
+        if stats['total_failed_files']:
+            print(f"🚫 Неиндексируемых файлов (пропускаются до изменения): {stats['total_failed_files']}")
 
-        pdf_files = [f for f in os.listdir(RESUMES_FOLDER) if f.lower().endswith('.pdf')]
-        if len(pdf_files) > stats['total_indexed_files']:
-            print("🔄 Обновление индекса...")
+        pending_files = pdf_indexer.get_pending_files()
+        if pending_files:
+            print(f"🔄 Обновление индекса ({len(pending_files)} новых или изменённых файлов)...")
             indexed_count = pdf_indexer.index_all_pdfs(max_workers=4, batch_size=200)
             print(f"✅ Проиндексировано {indexed_count} новых PDF файлов")
         else:
             print("✅ Индекс актуален")
 
+        pdf_indexer.refresh_derived_indexes()
+
     except Exception as e:
         print(f"⚠️ Ошибка при проверке индекса: {e}")
         print("🔄 Запускаем полную индексацию...")
@@ -0,0 +1,293 @@
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import aiosqlite
+from telegram.error import Forbidden
+from config import (BROADCAST_RATE, BROADCAST_CHUNK_SIZE, BROADCAST_POLL_INTERVAL, BROADCAST_REMINDER_DAYS,
+                    BROADCAST_REMINDER_INTERVAL)
+from auth import user_manager, now_param
+from search_scheduler import TokenBucket
+from send_queue import outbound, PRIORITY_BULK
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS broadcast_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        target TEXT NOT NULL,
+        text TEXT NOT NULL,
+        created_by INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        status TEXT NOT NULL DEFAULT 'running',
+        total INTEGER NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        finished_at TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS broadcast_recipients (
+        job_id INTEGER NOT NULL,
+        telegram_id INTEGER NOT NULL,
+        param TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        error TEXT,
+        sent_at TIMESTAMP,
+        PRIMARY KEY (job_id, telegram_id)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_pending
+        ON broadcast_recipients (job_id, telegram_id) WHERE status = 'pending';
+    CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_reminders
+        ON broadcast_recipients (telegram_id, param);
+    CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs (status);
+'''
+
+KIND_BROADCAST = 'broadcast'
+KIND_EXPIRY_REMINDER = 'expiry_reminder'
+
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_CANCELLED = 'cancelled'
+
+RECIPIENT_PENDING = 'pending'
+RECIPIENT_SENT = 'sent'
+RECIPIENT_FAILED = 'failed'
+RECIPIENT_BLOCKED = 'blocked'
+
+TARGET_ACTIVE = 'active'
+TARGET_EXPIRING = 'expiring'
+
+EXPIRY_REMINDER_TEXT = (
+    "⏰ Срок вашего доступа к боту истекает {expires}.\n\n"
+    "Для продления обратитесь к администратору: {admin_contact}"
+)
+
+
+def target_filter(target: str) -> Tuple[str, Dict]:
+    """ SQL-условие по users для цели рассылки: 'active' или 'expiring:<дней>' """
+    if target == TARGET_ACTIVE:
+        return "status = 'active'", {}
+    kind, _, days = target.partition(':')
+    if kind == TARGET_EXPIRING and days.isdigit():
+        return (
+            "status = 'active' AND access_expires >= :now AND access_expires < :until",
+            {'now': now_param(), 'until': str(datetime.now() + timedelta(days=int(days)))}
+        )
+    raise ValueError(f"Неизвестная цель рассылки: {target}")
+
+
+def describe_target(target: str) -> str:
+    if target == TARGET_ACTIVE:
+        return "все активные пользователи"
+    return f"доступ истекает в течение {target.partition(':')[2]} дн."
+
+
+class BroadcastManager:
+    """ Рассылки администратора и напоминания об окончании доступа
+
+    Получатели фиксируются при создании задания (INSERT ... SELECT по users),
+    у каждого свой статус доставки, поэтому после перезапуска задание
+    продолжается с неотправленных. Сообщения идут через общую очередь
+    отправки с PRIORITY_BULK и дополнительным лимитом BROADCAST_RATE, так
+    что ответы на поиск и админские сообщения обгоняют рассылку.
+    """
+
+    def __init__(self, db_path: str = user_manager.db_path):
+        self.db_path = db_path
+        self._bot = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._bucket = TokenBucket(BROADCAST_RATE, BROADCAST_CHUNK_SIZE)
+        self._last_reminder_check: Optional[float] = None
+        self.init_database()
+
+    def init_database(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executescript(BROADCAST_SCHEMA_SQL)
+            conn.commit()
+
+    def start(self, bot):
+        if self._task is not None:
+            return
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info("📢 Рассылки запущены")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def count_targets_async(self, target: str) -> int:
+        condition, params = target_filter(target)
+        async with aiosqlite.connect(self.db_path) as conn:
+            cursor = await conn.execute(f"SELECT COUNT(*) FROM users WHERE {condition}", params)
+            return (await cursor.fetchone())[0]
+
+    async def create_job_async(self, text: str, target: str, created_by: int = None,
+                               kind: str = KIND_BROADCAST) -> Tuple[Optional[int], int]:
+        """ Новое задание: получатели выбираются сразу, отправка - в фоне. Возвращает (id, получателей) """
+        condition, params = target_filter(target)
+        if kind == KIND_EXPIRY_REMINDER:
+            # одно напоминание на каждый срок доступа: продленный срок - новое напоминание
+            condition += f'''
+                AND NOT EXISTS (
+                    SELECT 1 FROM broadcast_recipients
+                    JOIN broadcast_jobs ON broadcast_jobs.id = broadcast_recipients.job_id
+                    WHERE broadcast_recipients.telegram_id = users.telegram_id
+                      AND broadcast_recipients.param = users.access_expires
+                      AND broadcast_jobs.kind = '{KIND_EXPIRY_REMINDER}'
+                )
+            '''
+        async with aiosqlite.connect(self.db_path) as conn:
+            await conn.execute("PRAGMA busy_timeout = 5000")
+            cursor = await conn.execute(
+                'INSERT INTO broadcast_jobs (kind, target, text, created_by) VALUES (?, ?, ?, ?)',
+                (kind, target, text, created_by)
+            )
+            job_id = cursor.lastrowid
+            cursor = await conn.execute(f'''
+                INSERT INTO broadcast_recipients (job_id, telegram_id, param)
+                SELECT :job_id, telegram_id, access_expires FROM users WHERE {condition}
+            ''', {'job_id': job_id, **params})
+            total = cursor.rowcount
+            if not total:
+                # некому отправлять - задание не сохраняем (иначе пустые напоминания копились бы каждый час)
+                await conn.rollback()
+                return None, 0
+            await conn.execute('UPDATE broadcast_jobs SET total = ? WHERE id = ?', (total, job_id))
+            await conn.commit()
+
+        logger.info(f"📢 Задание рассылки {job_id} ({kind}, {target}): {total} получателей")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id, total
+
+    async def cancel_job_async(self, job_id: int) -> bool:
+        async with aiosqlite.connect(self.db_path) as conn:
+            cursor = await conn.execute(
+                'UPDATE broadcast_jobs SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ? AND status = ?',
+                (JOB_CANCELLED, job_id, JOB_RUNNING)
+            )
+            await conn.commit()
+            return cursor.rowcount > 0
+
+    async def get_recent_jobs_async(self, limit: int = 5) -> List[Dict]:
+        async with aiosqlite.connect(self.db_path) as conn:
+            rows = await conn.execute_fetchall('''
+                SELECT id, kind, target, status, total, sent, failed, created_at, finished_at
+                FROM broadcast_jobs ORDER BY id DESC LIMIT ?
+            ''', (limit,))
+        keys = ('id', 'kind', 'target', 'status', 'total', 'sent', 'failed', 'created_at', 'finished_at')
+        return [dict(zip(keys, row)) for row in rows]
+
+    async def _run(self):
+        while True:
+            try:
+                if (self._last_reminder_check is None
+                        or time.monotonic() - self._last_reminder_check >= BROADCAST_REMINDER_INTERVAL):
+                    self._last_reminder_check = time.monotonic()
+                    await self.create_job_async(
+                        EXPIRY_REMINDER_TEXT, f"{TARGET_EXPIRING}:{BROADCAST_REMINDER_DAYS}",
+                        kind=KIND_EXPIRY_REMINDER
+                    )
+                job = await self._next_job()
+                if job is not None:
+                    await self._send_chunk(*job)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработки рассылки: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), BROADCAST_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _next_job(self) -> Optional[Tuple[int, str, str, List[Tuple[int, Optional[str]]]]]:
+        """ Самое старое незавершенное задание и следующая пачка его получателей """
+        async with aiosqlite.connect(self.db_path) as conn:
+            await conn.execute("PRAGMA busy_timeout = 5000")
+            while True:
+                cursor = await conn.execute(
+                    'SELECT id, kind, text FROM broadcast_jobs WHERE status = ? ORDER BY id LIMIT 1', (JOB_RUNNING,)
+                )
+                job = await cursor.fetchone()
+                if job is None:
+                    return None
+                recipients = await conn.execute_fetchall('''
+                    SELECT telegram_id, param FROM broadcast_recipients
+                    WHERE job_id = ? AND status = ? ORDER BY telegram_id LIMIT ?
+                ''', (job[0], RECIPIENT_PENDING, BROADCAST_CHUNK_SIZE))
+                if recipients:
+                    return job[0], job[1], job[2], recipients
+                await conn.execute(
+                    'UPDATE broadcast_jobs SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?',
+                    (JOB_DONE, job[0])
+                )
+                await conn.commit()
+                logger.info(f"📢 Задание рассылки {job[0]} завершено")
+
+    async def _send_chunk(self, job_id: int, kind: str, text: str, recipients: List[Tuple[int, Optional[str]]]):
+        """ Пачка получателей параллельно (темп задают BROADCAST_RATE и очередь отправки)
+
+        Результаты записываются и при остановке посреди пачки, чтобы после
+        перезапуска не отправлять повторно уже доставленное.
+        """
+        results: List[Tuple[str, Optional[str], int]] = []
+
+        async def deliver(telegram_id: int, param: Optional[str]):
+            while (delay := self._bucket.take()) > 0:
+                await asyncio.sleep(delay)
+            message = self._render(kind, text, param)
+            try:
+                await outbound.submit(telegram_id, lambda: self._bot.send_message(telegram_id, message),
+                                      priority=PRIORITY_BULK)
+                results.append((RECIPIENT_SENT, None, telegram_id))
+            except Forbidden as e:
+                results.append((RECIPIENT_BLOCKED, str(e), telegram_id))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                results.append((RECIPIENT_FAILED, str(e), telegram_id))
+
+        try:
+            await asyncio.gather(*(deliver(telegram_id, param) for telegram_id, param in recipients))
+        finally:
+            if results:
+                await self._record_results(job_id, results)
+
+    async def _record_results(self, job_id: int, results: List[Tuple[str, Optional[str], int]]):
+        sent = sum(1 for status, _, _ in results if status == RECIPIENT_SENT)
+        async with aiosqlite.connect(self.db_path) as conn:
+            await conn.execute("PRAGMA busy_timeout = 5000")
+            await conn.executemany('''
+                UPDATE broadcast_recipients SET status = ?, error = ?, sent_at = CURRENT_TIMESTAMP
+                WHERE job_id = ? AND telegram_id = ?
+            ''', [(status, error, job_id, telegram_id) for status, error, telegram_id in results])
+            await conn.execute(
+                'UPDATE broadcast_jobs SET sent = sent + ?, failed = failed + ? WHERE id = ?',
+                (sent, len(results) - sent, job_id)
+            )
+            await conn.commit()
+
+    def _render(self, kind: str, text: str, param: Optional[str]) -> str:
+        if kind != KIND_EXPIRY_REMINDER:
+            return text
+        try:
+            expires = datetime.fromisoformat(param).strftime('%d.%m.%Y %H:%M')
+        except (TypeError, ValueError):
+            expires = "скоро"
+        return text.format(expires=expires, admin_contact=user_manager.get_admin_contact())
+
+
+broadcaster = BroadcastManager()
@@ -1,6 +1,5 @@
 import os
 from dotenv import load_dotenv
-from auth import user_manager
 
 load_dotenv()
 
@@ -21,6 +20,98 @@ SEARCH_RESULT_LIMIT = 20
 MAX_SEARCH_QUERY_LENGTH = 1000
 SEARCH_TIMEOUT = 10
 
+# Число шардов индекса (отдельных SQLite файлов); после изменения - /reindex
+PDF_INDEX_SHARDS = 1
+
+# Процессы пула поиска (0 - поиск в потоке процесса бота)
+SEARCH_WORKERS = 0
+
+# Допуск к поиску: одновременные поиски, длина очереди, запас запросов пользователя
+# (SEARCH_CONCURRENCY - начальный лимит, дальше он подстраивается под p95 задержки)
+SEARCH_CONCURRENCY = 5
+SEARCH_CONCURRENCY_MIN = 1
+SEARCH_CONCURRENCY_MAX = 64
+SEARCH_TARGET_P95 = 2.0
+SEARCH_MAX_QUEUE = 50
+SEARCH_QUEUE_TIMEOUT = 60
+SEARCH_USER_BURST = 3
+SEARCH_USER_RATE_PER_MINUTE = 6
+
+# Исходящие сообщения: лимиты Telegram (глобально и на чат), обработчики, повторы
+SEND_GLOBAL_RATE = 30
+SEND_CHAT_RATE = 1
+SEND_CHAT_BURST = 3
+SEND_WORKERS = 8
+SEND_MAX_RETRIES = 3
+
+# Сжатые копии больших PDF для отправки (ghostscript, без него - PyPDF2 без потерь)
+OPTIMIZED_RESUMES_FOLDER = 'data/resumes_optimized/'
+PDF_OPTIMIZE_MIN_SIZE_MB = 5
+PDF_OPTIMIZE_MAX_RATIO = 0.9
+PDF_OPTIMIZE_TIMEOUT = 120
+# фоновое сжатие новых файлов (в потоке, вне обработчиков): период проверки, секунды
+PDF_OPTIMIZE_INTERVAL = 600
+
+# Период фоновой проверки сроков доступа (истекшие переводятся в status = 'expired'), секунды
+ACCESS_EXPIRY_SWEEP_INTERVAL = 60
+
+# Размер страницы списков пользователей в админке (листание кнопками)
+ADMIN_USERS_PAGE_SIZE = 10
+
+# Импорт пользователей из CSV (одна транзакция) и выгрузка в CSV порциями по ключу
+USER_IMPORT_MAX_BYTES = 2 * 1024 * 1024
+USER_IMPORT_MAX_ROWS = 5000
+USER_EXPORT_CHUNK_SIZE = 500
+
+# Рассылки и напоминания об окончании доступа (очередь отправки, приоритет PRIORITY_BULK)
+BROADCAST_RATE = 20
+BROADCAST_CHUNK_SIZE = 30
+BROADCAST_POLL_INTERVAL = 30
+BROADCAST_REMINDER_DAYS = 3
+BROADCAST_REMINDER_INTERVAL = 3600
+
+# Состояние бота между перезапусками: user_data и диалоги ConversationHandler (SQLitePersistence)
+PERSISTENCE_DB_PATH = 'data/bot_state.db'
+PERSISTENCE_UPDATE_INTERVAL = 30
+
+# Сессии поиска ("Показать ещё"): время жизни и период очистки просроченных, секунды
+SEARCH_SESSION_TTL = 1800
+SEARCH_SESSION_SWEEP_INTERVAL = 300
+
+# Журнал событий поиска и отправки резюме (отдельная база) и его свертки по часам/дням
+ANALYTICS_DB_PATH = 'data/analytics.db'
+ANALYTICS_FLUSH_INTERVAL = 5
+ANALYTICS_BATCH_SIZE = 500
+ANALYTICS_MAX_BUFFER = 50000
+ANALYTICS_ROLLUP_INTERVAL = 300
+ANALYTICS_RETENTION_DAYS = 30
+
+MAX_DOCUMENT_CHARS = 300000
+PASSAGE_SIZE = 1500
+PASSAGE_OVERLAP = 300
+PASSAGE_HITS_PER_DOCUMENT = 3
+
+FINGERPRINT_SHINGLE_WORDS = 5
+FINGERPRINT_WINDOW = 4
+FINGERPRINT_MIN_SHARED = 3
+FINGERPRINT_MIN_CONTAINMENT = 0.5
+
+# Режим поиска по снапшоту индекса (mmap, без SQL на горячем пути)
+SEARCH_SNAPSHOT_ENABLED = False
+SEARCH_SNAPSHOT_DIR = 'data/search_snapshot/'
+SEARCH_SNAPSHOT_DELTA_RATIO = 0.1
+# сборка сегмента порциями: не больше стольких позиций (термов) в памяти, порции сливаются на диске
+SEARCH_SNAPSHOT_CHUNK_TOKENS = 2000000
+
+# BM25 по матрице документ-терм
+SCORING_MATRIX_ENABLED = True
+BM25_K1 = 1.2
+BM25_B = 0.75
+# нижняя граница оценки документа с совпадениями - та же, что у построчной _calculate_relevance
+BM25_SCORE_FLOOR = 0.3
+
 
 def get_logging_level():
+    # auth импортируется здесь: config читают и процессы пула поиска, им база пользователей не нужна
+    from auth import user_manager
     return user_manager.get_system_setting('logging_level', 'INFO')
\ No newline at end of file
@@ -61,6 +61,9 @@ def require_admin(func):
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         try:
             if update.callback_query:
+                if not user_manager.is_admin(update.effective_user.id):
+                    await update.callback_query.answer("⛔ Доступно только администраторам.", show_alert=True)
+                    return
                 return await func(update, context, *args, **kwargs)
 
             if update is None or update.effective_user is None:
@@ -0,0 +1,38 @@
+import hashlib
+from typing import List, Set
+from config import FINGERPRINT_SHINGLE_WORDS, FINGERPRINT_WINDOW
+from morphology import tokenize
+
+
+def _hash_shingle(words: List[str]) -> int:
+    """ Стабильный 64-битный хэш k-граммы слов (знаковый, помещается в INTEGER SQLite) """
+    digest = hashlib.blake2b(' '.join(words).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def shingle_hashes(text: str, k: int = FINGERPRINT_SHINGLE_WORDS) -> List[int]:
+    """ Хэши всех k-грамм слов текста по порядку """
+    words = tokenize(text)
+    if len(words) < k:
+        return [_hash_shingle(words)] if words else []
+    return [_hash_shingle(words[i:i + k]) for i in range(len(words) - k + 1)]
+
+
+def winnow(hashes: List[int], window: int = FINGERPRINT_WINDOW) -> Set[int]:
+    """ Winnowing: минимальный хэш из каждого окна из window подряд идущих k-грамм
+
+    Гарантирует, что любое общее совпадение длиной не меньше
+    window + k - 1 слов даст хотя бы один общий отпечаток.
+    """
+    if len(hashes) <= window:
+        return {min(hashes)} if hashes else set()
+
+    selected = set()
+    for start in range(len(hashes) - window + 1):
+        selected.add(min(hashes[start:start + window]))
+    return selected
+
+
+def fingerprint(text: str) -> Set[int]:
+    """ Отпечатки текста для индекса и для поиска """
+    return winnow(shingle_hashes(text))
@@ -8,6 +8,12 @@ from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKe
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram.error import TimedOut
 from pdf_indexer import pdf_indexer
+from pdf_optimizer import pdf_optimizer
+from search_service import search_service
+from search_scheduler import search_scheduler, SearchBusy, SearchRateLimited
+from send_queue import outbound, PRIORITY_SEARCH
+from analytics import analytics
+from session_store import search_sessions
 from config import RESUMES_FOLDER
 from auth import user_manager
 from datetime import datetime
@@ -16,6 +22,9 @@ from keyboards import get_main_keyboard
 
 logger = logging.getLogger(__name__)
 
+# результатов поиска по тексту (ключ объединения одинаковых запросов включает лимит)
+SEARCH_RESULTS_LIMIT = 5
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """ Обработчик команды /start """
@@ -26,19 +35,19 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = user.id
     admin_contact = user_manager.get_admin_contact()
 
-    user_manager.add_user(
+    await user_manager.add_user_async(
         telegram_id=user.id,
         username=user.username,
         first_name=user.first_name,
         last_name=user.last_name
     )
-    user_manager.update_user_info(
+    await user_manager.update_user_info_async(
         telegram_id=user.id,
         username=user.username or "",
         first_name=user.first_name or "",
         last_name=user.last_name or ""
     )
-    user_info = user_manager.get_user(user.id)
+    user_info = await user_manager.get_user_async(user.id)
     can_request, access_message = await user_manager.can_make_request_async(user_id)
     logger.info(f"🔐 Проверка доступа для {user_id}: {can_request} - {access_message}")
     if not can_request:
@@ -95,6 +104,14 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(welcome_text, reply_markup=keyboard)
 
 
+def _collect_index_status() -> tuple:
+    """ Очистка отсутствующих, статистика индекса и обход папки (выполняется в потоке) """
+    missing_count = pdf_indexer.cleanup_missing_files()
+    stats = pdf_indexer.get_index_stats()
+    pdf_count = sum(1 for f in os.listdir(RESUMES_FOLDER) if f.lower().endswith('.pdf'))
+    return missing_count, stats, pdf_count, pdf_indexer.get_pending_files()
+
+
 async def check_index_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """ Проверка статуса индекса """
     if update.message is None:
@@ -106,17 +123,26 @@ async def check_index_status(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     try:
-        stats = pdf_indexer.get_index_stats()
-        pdf_files = [f for f in os.listdir(RESUMES_FOLDER) if f.lower().endswith('.pdf')]
-        missing_count = pdf_indexer.cleanup_missing_files()
+        # обход шардов и папки - в потоке, производные индексы пересобираются в фоне
+        missing_count, stats, pdf_count, pending_files = await asyncio.to_thread(_collect_index_status)
+        if missing_count:
+            pdf_indexer.schedule_derived_refresh()
+
+        failure_labels = {'no_text': 'нет текста (скан)', 'extract_error': 'ошибка чтения PDF'}
+        failures_text = "".join(
+            f"   • {failure_labels.get(kind, kind)}: {count}\n"
+            for kind, count in stats['failures_by_kind'].items()
+        )
 
         await update.message.reply_text(
             f"📊 Статус индексации\n\n"
-            f"📁 Файлов в папке: {len(pdf_files)}\n"
+            f"📁 Файлов в папке: {pdf_count}\n"
             f"📄 В индексе: {stats['total_indexed_files']}\n"
             f"💾 Размер базы: {stats['db_size_mb']:.1f} MB\n"
             f"🧹 Очищено отсутствующих: {missing_count}\n\n"
-            f"🔍 Неиндексированные файлы: {max(0, len(pdf_files) - stats['total_indexed_files'])}"
+            f"🔍 Неиндексированные файлы: {len(pending_files)}\n"
+            f"🚫 Неиндексируемые файлы: {stats['total_failed_files']}\n"
+            f"{failures_text}"
         )
 
     except Exception as e:
@@ -146,26 +172,25 @@ async def get_my_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     user_id = user.id
 
-    user_manager.update_user_info(
+    await user_manager.update_user_info_async(
         telegram_id=user_id,
         username=user.username or "",
         first_name=user.first_name or "",
         last_name=user.last_name or ""
     )
 
-    user_manager.force_monthly_reset_check(user_id)
-    user_info = user_manager.get_user(user_id)
+    user_info = await user_manager.get_user_async(user_id)
 
     if not user_info:
-        user_manager.add_user_by_admin(
+        await user_manager.add_user_by_admin_async(
             telegram_id=user_id,
             username=user.username or "",
             first_name=user.first_name or "",
             last_name=user.last_name or ""
         )
-        user_info = user_manager.get_user(user_id)
+        user_info = await user_manager.get_user_async(user_id)
 
-    resume_stats = user_manager.get_resume_stats(user_id)
+    resume_stats = await user_manager.get_resume_stats_async(user_id)
 
     role_emoji = "👑" if user_info.get('role') == 'admin' else "👤"
     role_text = "Администратор" if user_info.get('role') == 'admin' else "Рекрутер"
@@ -293,15 +318,70 @@ async def handle_pdf_text_search(update: Update, context: ContextTypes.DEFAULT_T
         )
         return
 
-    search_message = await update.message.reply_text(
-        f"🔍 Идет быстрый поиск по базе резюме..."
-    )
+    if search_service.is_running(user_message, limit=SEARCH_RESULTS_LIMIT):
+        # такой же поиск уже выполняется: ждем его результат без слота и без запроса из лимита
+        search_message = await update.message.reply_text(f"🔍 Идет быстрый поиск по базе резюме...")
+        await _run_pdf_search(update, context, user_message, start_time, search_message, None)
+        return
+
+    try:
+        ticket = search_scheduler.admit(user_id, weight=2.0 if user_manager.is_admin(user_id) else 1.0)
+    except SearchRateLimited as e:
+        await update.message.reply_text(
+            f"⏳ Слишком много поисков подряд. Повторите через {e.retry_after:.0f} сек."
+        )
+        return
+    except SearchBusy:
+        await update.message.reply_text("🚦 Сервис поиска перегружен. Попробуйте через минуту.")
+        return
+
+    try:
+        position = search_scheduler.position(ticket)
+        if position:
+            search_message = await update.message.reply_text(
+                f"🕐 Вы в очереди на поиск: позиция {position}"
+            )
+            try:
+                await search_scheduler.wait(ticket)
+            except SearchBusy:
+                await search_message.edit_text("🚦 Сервис поиска перегружен. Попробуйте через минуту.")
+                return
+            await search_message.edit_text(f"🔍 Идет быстрый поиск по базе резюме...")
+        else:
+            search_message = await update.message.reply_text(
+                f"🔍 Идет быстрый поиск по базе резюме..."
+            )
+
+        await _run_pdf_search(update, context, user_message, start_time, search_message, ticket)
+    finally:
+        search_scheduler.release(ticket)
+
+
+async def _run_pdf_search(update: Update, context: ContextTypes.DEFAULT_TYPE, user_message: str, start_time: float,
+                          search_message, ticket) -> None:
+    """ Поиск и отправка результатов
 
+    Слот планировщика (ticket) уже получен и освобождается сразу после поиска; ticket = None -
+    запрос присоединяется к такому же выполняющемуся поиску. Исход поиска передается в
+    адаптивный лимит один раз - слотом, который его выполнял.
+    """
     try:
-        search_results = pdf_indexer.search_indexed_pdf(user_message, limit=5)
+        if ticket is not None and search_service.is_running(user_message, limit=SEARCH_RESULTS_LIMIT):
+            # пока ждали в очереди, такой же поиск уже запущен: слот отдаем следующим
+            search_scheduler.release(ticket, observed=False)
+            ticket = None
+        try:
+            search_results, search_tier = await search_service.search_with_tier(user_message, limit=SEARCH_RESULTS_LIMIT)
+        except Exception:
+            if ticket is not None:
+                search_scheduler.release(ticket, failed=True)
+            raise
+        if ticket is not None:
+            search_scheduler.release(ticket)
 
         logger.info(f"🔍 ИНДЕКСНЫЙ ПОИСК: '{user_message[:50]}...' - найдено: {len(search_results)}")
         search_duration = time.time() - start_time
+        analytics.record_search(update.effective_user.id, search_duration, len(search_results), search_tier)
         logger.info(f"🔍 Поиск '{user_message[:50]}...' занял {search_duration:.2f}сек, найдено: {len(search_results)}")
 
         if not search_results:
@@ -341,7 +421,7 @@ async def handle_pdf_text_search(update: Update, context: ContextTypes.DEFAULT_T
                         f"💡 Найдено {len(other_results)} дополнительных релевантных резюме",
                         reply_markup=reply_markup
                     )
-                    context.user_data['other_search_results'] = other_results
+                    search_sessions.save(context.user_data, other_results)
                 else:
                     await update.message.reply_text(
                         "🔻Для поиска следующего кандидата отправьте текст из резюме.",
@@ -413,24 +493,23 @@ async def handle_pdf_search_decision(update: Update, context: ContextTypes.DEFAU
 
         action = query.data
         if action == "show_other_results":
-            other_results = context.user_data.get('other_search_results', [])
+            other_results = search_sessions.take(context.user_data)
 
             if other_results:
-                sent_count = 0
-                for result in other_results:
-                    try:
-                        success = await safe_send_pdf(
-                            update,
-                            result['file_path'],
-                            f"📄 Дополнительное резюме\n"
-                            f"👤 Кандидат: {result['candidate_name']}",
-                            os.path.basename(result['file_path'])
-                        )
-                        if success:
-                            sent_count += 1
-                            await asyncio.sleep(0.5)
-                    except Exception as e:
-                        logger.error(f"❌ Ошибка отправки дополнительного PDF: {e}")
+                # очередь отправки сама выдерживает лимиты Telegram, паузы не нужны
+                sent = await asyncio.gather(*(
+                    safe_send_pdf(
+                        update,
+                        result['file_path'],
+                        f"📄 Дополнительное резюме\n"
+                        f"👤 Кандидат: {result['candidate_name']}",
+                        os.path.basename(result['file_path'])
+                    )
+                    for result in other_results
+                ), return_exceptions=True)
+                for error in (result for result in sent if isinstance(result, Exception)):
+                    logger.error(f"❌ Ошибка отправки дополнительного PDF: {error}")
+                sent_count = sum(1 for result in sent if result is True)
                 await query.message.reply_text(
                     f"✅ Отправлено {sent_count} дополнительных резюме",
                     reply_markup=get_main_keyboard(update.effective_user.id)
@@ -446,7 +525,7 @@ async def handle_pdf_search_decision(update: Update, context: ContextTypes.DEFAU
                 "🔻Для поиска следующего кандидата отправьте текст из резюме.",
                 reply_markup=get_main_keyboard(update.effective_user.id)
             )
-        context.user_data.pop('other_search_results', None)
+        search_sessions.discard(context.user_data)
 
     except Exception as e:
         logger.error(f"❌ Ошибка в handle_pdf_search_decision: {e}")
@@ -529,41 +608,43 @@ async def error_handler(update: Optional[Update], context: ContextTypes.DEFAULT_
 
 
 async def safe_send_pdf(update: Update, pdf_path: str, caption: str, filename: str, max_retries: int = 2) -> bool:
-    """ Отправка PDF с учетом лимитов """
+    """ Отправка PDF с учетом лимитов (через очередь исходящих сообщений) """
     user_id = update.effective_user.id
 
-    can_download, message = user_manager.can_download_resume(user_id)
-    if not can_download:
-        logger.warning(f"🚫 Лимит резюме для пользователя {user_id}: {message}")
-        await update.message.reply_text(message)
+    if update.callback_query and update.callback_query.message:
+        message = update.callback_query.message
+    elif update.message:
+        message = update.message
+    else:
+        logger.error("❌ Не удалось определить контекст для отправки сообщения")
         return False
 
-    user_before = user_manager.get_user(user_id)
-    stats_before = user_manager.get_resume_stats(user_id)
-    logger.info(f"📥 Пользователь {user_id} скачивает резюме: {filename}")
-    logger.info(f"📊 Статистика до: сегодня={stats_before['resumes_today']}, месяц={stats_before['resumes_this_month']}, всего={stats_before['resumes_total']}")
+    if not os.path.exists(pdf_path):
+        logger.error(f"❌ Файл не найден: {pdf_path}")
+        return False
 
-    for attempt in range(max_retries):
-        try:
-            if update.callback_query and update.callback_query.message:
-                message = update.callback_query.message
-            elif update.message:
-                message = update.message
-            else:
-                logger.error("❌ Не удалось определить контекст для отправки сообщения")
-                return False
+    reservation, limit_message = await user_manager.reserve_resume_async(user_id)
+    if reservation is None:
+        logger.warning(f"🚫 Лимит резюме для пользователя {user_id}: {limit_message}")
+        await message.reply_text(limit_message)
+        return False
 
-            if not os.path.exists(pdf_path):
-                logger.error(f"❌ Файл не найден: {pdf_path}")
-                return False
+    logger.info(f"📥 Пользователь {user_id} скачивает резюме: {filename}")
+    sent = False
+    send_started = time.monotonic()
+    send_bytes = 0
+    try:
+        send_path = pdf_optimizer.delivery_path(pdf_path)
+        send_bytes = os.path.getsize(send_path)
+        file_size = send_bytes / (1024 * 1024)
+        if file_size > 10:
+            await message.reply_text(
+                f"⚠️ Файл большой ({file_size:.1f}MB), отправка может занять время..."
+            )
 
-            file_size = os.path.getsize(pdf_path) / (1024 * 1024)
-            if file_size > 10:
-                await update.message.reply_text(
-                    f"⚠️ Файл слишком большой ({file_size:.1f}MB). Оптимизирую отправку..."
-                )
-            with open(pdf_path, 'rb') as pdf_file:
-                await message.reply_document(
+        async def send_document():
+            with open(send_path, 'rb') as pdf_file:
+                return await message.reply_document(
                     document=pdf_file,
                     filename=filename,
                     caption=caption,
@@ -571,29 +652,21 @@ async def safe_send_pdf(update: Update, pdf_path: str, caption: str, filename: s
                     write_timeout=60,
                     connect_timeout=30
                 )
-                success = user_manager.increment_resume_count(user_id)
-                user_after = user_manager.get_user(user_id)
-                if user_after:
-                    logger.info(
-                        f"✅ Данные после скачивания: сегодня={user_after['resumes_today']}, месяц={user_after['resumes_this_month']}, всего={user_after['resumes_total']}")
-
-                    if (user_after['resumes_today'] == user_before['resumes_today'] + 1 and
-                            user_after['resumes_this_month'] == user_before['resumes_this_month'] + 1 and
-                            user_after['resumes_total'] == user_before['resumes_total'] + 1):
-                        logger.info(f"✅ Счетчик резюме успешно увеличен для {user_id}")
-                        return True
-                    else:
-                        logger.error(f"❌ Данные не изменились для {user_id}")
-                        return False
-                else:
-                    logger.error(f"❌ Не удалось получить обновленные данные для {user_id}")
-                    return False
 
-        except TimedOut:
-            logger.warning(f"⚠️ Таймаут при отправке {filename}, попытка {attempt + 1}/{max_retries}")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(1)
-        except Exception as e:
-            logger.error(f"❌ Ошибка отправки PDF {filename}: {e}")
-            return False
-    return False
\ No newline at end of file
+        await outbound.submit(message.chat_id, send_document, priority=PRIORITY_SEARCH, max_retries=max_retries)
+        sent = True
+    except TimedOut:
+        # send_document не повторяется после таймаута (файл мог дойти) - лимит резюме не списываем
+        logger.warning(f"⚠️ Таймаут при отправке {filename}")
+        return False
+    except Exception as e:
+        logger.error(f"❌ Ошибка отправки PDF {filename}: {e}")
+        return False
+    finally:
+        analytics.record_download(user_id, os.path.basename(pdf_path), send_bytes,
+                                  time.monotonic() - send_started, sent)
+        if not sent:
+            await user_manager.release_resume_async(reservation)
+
+    user_manager.commit_resume(reservation)
+    return True
@@ -1,4 +1,5 @@
-from telegram import ReplyKeyboardMarkup
+from typing import List, Optional
+from telegram import ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton
 from auth import user_manager
 
 
@@ -18,7 +19,7 @@ def get_admin_keyboard() -> ReplyKeyboardMarkup:
             ['📊 Пользователи', '📊 Лимиты'],
             ['📈 Статистика', '📁 Управление PDF базой'],
             ['⚙️ Настройки системы', '👑 Сменить администратора'],
-            ['⬅️ Назад к поиску']
+            ['📢 Рассылка', '⬅️ Назад к поиску']
         ],
         resize_keyboard=True
     )
@@ -43,7 +44,8 @@ def get_users_keyboard() -> ReplyKeyboardMarkup:
             ['🔓 Активировать пользователя', '🔒 Деактивировать пользователя'],
             ['➕ Добавить пользователя', '🗑️ Удалить пользователя'],
             ['✅ Активные', '❌ Деактивированные'],
-            ['⏰ Истек срок', '⬅️ Назад в админку']
+            ['⏰ Истек срок', '📥 Импорт CSV'],
+            ['📤 Экспорт CSV', '⬅️ Назад в админку']
         ],
         resize_keyboard=True
     )
@@ -76,6 +78,37 @@ def get_confirm_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
+def get_broadcast_target_keyboard() -> ReplyKeyboardMarkup:
+    """ Клавиатура выбора получателей рассылки """
+    return ReplyKeyboardMarkup(
+        [
+            ['👥 Всем активным', '⏰ Истекает за 7 дней'],
+            ['⬅️ Назад в админку']
+        ],
+        resize_keyboard=True
+    )
+
+
+def get_broadcast_confirm_keyboard() -> ReplyKeyboardMarkup:
+    """ Клавиатура подтверждения рассылки """
+    return ReplyKeyboardMarkup(
+        [
+            ['✅ Отправить рассылку', '❌ Отменить'],
+            ['⬅️ Назад в админку']
+        ],
+        resize_keyboard=True
+    )
+
+
+def get_broadcast_jobs_keyboard(job_ids: List[int]) -> Optional[InlineKeyboardMarkup]:
+    """ Кнопки остановки идущих рассылок (broadcast_stop:<id>) """
+    if not job_ids:
+        return None
+    return InlineKeyboardMarkup(
+        [[InlineKeyboardButton(f"⛔ Остановить #{job_id}", callback_data=f"broadcast_stop:{job_id}")] for job_id in job_ids]
+    )
+
+
 def get_logging_keyboard() -> ReplyKeyboardMarkup:
     """ Клавиатура настройки логирования """
     return ReplyKeyboardMarkup(
@@ -85,4 +118,15 @@ def get_logging_keyboard() -> ReplyKeyboardMarkup:
             ['⬅️ Назад в админку']
         ],
         resize_keyboard=True
-    )
\ No newline at end of file
+    )
+
+
+def get_users_page_keyboard(status: str, first_id: int, last_id: int,
+                            has_prev: bool, has_next: bool) -> Optional[InlineKeyboardMarkup]:
+    """ Кнопки листания списка пользователей (users_page:<статус>:<prev|next>:<id>) """
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"users_page:{status}:prev:{first_id}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton("Далее ➡️", callback_data=f"users_page:{status}:next:{last_id}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
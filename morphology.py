@@ -0,0 +1,45 @@
+import re
+import threading
+from functools import lru_cache
+from typing import List
+import snowballstemmer
+
+_WORD_RE = re.compile(r'\w+')
+_CYRILLIC_RE = re.compile(r'[а-я]')
+_local = threading.local()
+
+
+def _get_stemmers():
+    """ Стеммеры Snowball отдельно для каждого потока (объекты не потокобезопасны) """
+    if not hasattr(_local, 'russian'):
+        _local.russian = snowballstemmer.stemmer('russian')
+        _local.english = snowballstemmer.stemmer('english')
+    return _local
+
+
+def tokenize(text: str) -> List[str]:
+    """ Разбивка текста на слова в нижнем регистре (ё приводится к е) """
+    if not text:
+        return []
+    return _WORD_RE.findall(text.lower().replace('ё', 'е'))
+
+
+@lru_cache(maxsize=200000)
+def stem_word(word: str) -> str:
+    """ Основа слова: русский Snowball для кириллицы, английский для латиницы """
+    if word.isdigit() or len(word) < 3:
+        return word
+    stemmers = _get_stemmers()
+    if _CYRILLIC_RE.search(word):
+        return stemmers.russian.stemWord(word)
+    return stemmers.english.stemWord(word)
+
+
+def stem_tokens(text: str) -> List[str]:
+    """ Основы всех слов текста в исходном порядке """
+    return [stem_word(word) for word in tokenize(text)]
+
+
+def stem_text(text: str) -> str:
+    """ Текст из основ слов — одинаково при индексации и при поиске """
+    return ' '.join(stem_tokens(text))
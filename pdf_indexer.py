@@ -3,265 +3,292 @@ import os
 import time
 import sqlite3
 import logging
+import zlib
 import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Optional
+from contextlib import closing
+from typing import List, Optional, Tuple
 import pdfplumber
 import PyPDF2
-from config import RESUMES_FOLDER
+from config import (RESUMES_FOLDER, MAX_DOCUMENT_CHARS, PASSAGE_SIZE, PASSAGE_OVERLAP, PASSAGE_HITS_PER_DOCUMENT,
+                    FINGERPRINT_MIN_SHARED, FINGERPRINT_MIN_CONTAINMENT, SEARCH_SNAPSHOT_ENABLED,
+                    SEARCH_SNAPSHOT_DIR, SEARCH_SNAPSHOT_DELTA_RATIO, SCORING_MATRIX_ENABLED,
+                    PDF_INDEX_SHARDS)
 from utils import extract_name_from_filename
+from morphology import stem_text, stem_word, stem_tokens
+from fingerprints import fingerprint
+from scoring import ScoringMatrix, top_k
 import aiosqlite
-from cache_manager import cache_manager
 from cachetools import LRUCache
 import asyncio
+import heapq
+from itertools import zip_longest
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# rowid строки в pdf_index_fts = id документа * PASSAGE_ROWID_STRIDE + номер фрагмента
+PASSAGE_ROWID_STRIDE = 10000
+INDEX_SCHEMA_VERSION = 4
+
+# content_stem - теневая колонка с основами слов (русский/английский Snowball),
+# porter сам по себе не понимает русскую морфологию
+FTS_TABLE_SQL = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS pdf_index_fts 
+    USING fts5(
+        filename, 
+        content, 
+        candidate_name,
+        content_stem,
+        tokenize="porter unicode61"
+    )
+'''
+
+# Триграммный индекс по pdf_index.content (external content) для поиска подстрок
+TRIGRAM_SCHEMA_SQL = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS pdf_index_trigram 
+    USING fts5(content, content='pdf_index', content_rowid='id', tokenize='trigram')
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS pdf_index_trigram_ai AFTER INSERT ON pdf_index BEGIN
+        INSERT INTO pdf_index_trigram(rowid, content) VALUES (new.id, new.content);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS pdf_index_trigram_ad AFTER DELETE ON pdf_index BEGIN
+        INSERT INTO pdf_index_trigram(pdf_index_trigram, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS pdf_index_trigram_au AFTER UPDATE OF content ON pdf_index BEGIN
+        INSERT INTO pdf_index_trigram(pdf_index_trigram, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO pdf_index_trigram(rowid, content) VALUES (new.id, new.content);
+    END
+    '''
+]
+
+# Отпечатки документов (winnowing) для поиска вставленного дословно фрагмента
+FINGERPRINT_SCHEMA_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS pdf_fingerprints (
+        hash INTEGER NOT NULL,
+        doc_id INTEGER NOT NULL,
+        PRIMARY KEY (hash, doc_id)
+    ) WITHOUT ROWID
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_fingerprints_doc ON pdf_fingerprints(doc_id)',
+    '''
+    CREATE TRIGGER IF NOT EXISTS pdf_fingerprints_ad AFTER DELETE ON pdf_index BEGIN
+        DELETE FROM pdf_fingerprints WHERE doc_id = old.id;
+    END
+    '''
+]
+
+INSERT_FINGERPRINT_SQL = 'INSERT OR IGNORE INTO pdf_fingerprints (hash, doc_id) VALUES (?, ?)'
+
+# Служебные значения индекса (в шарде 0): число шардов, под которое разложены документы
+INDEX_META_SQL = 'CREATE TABLE IF NOT EXISTS pdf_index_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+
+# Журнал изменений pdf_index для инкрементального обновления снапшота поиска
+CHANGE_LOG_SCHEMA_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS pdf_index_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT NOT NULL
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS pdf_index_changes_ai AFTER INSERT ON pdf_index BEGIN
+        INSERT INTO pdf_index_changes(filename) VALUES (new.filename);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS pdf_index_changes_ad AFTER DELETE ON pdf_index BEGIN
+        INSERT INTO pdf_index_changes(filename) VALUES (old.filename);
+    END
+    '''
+]
+
+# Без снапшота журнал не нужен - триггеры снимаются, чтобы таблица не росла
+DROP_CHANGE_LOG_SQL = [
+    'DROP TRIGGER IF EXISTS pdf_index_changes_ai',
+    'DROP TRIGGER IF EXISTS pdf_index_changes_ad',
+    'DELETE FROM pdf_index_changes'
+]
+
+SUBSTRING_SEARCH_SQL = '''
+    SELECT filename, candidate_name
+    FROM pdf_index 
+    WHERE id IN (
+        SELECT rowid FROM pdf_index_trigram 
+        WHERE pdf_index_trigram MATCH ? 
+        LIMIT ?
+    )
+'''
+
+INSERT_PASSAGE_SQL = '''
+    INSERT INTO pdf_index_fts 
+    (rowid, filename, content, candidate_name, content_stem) 
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+PHRASE_SEARCH_SQL = '''
+    SELECT rowid, filename, candidate_name, content, content_stem, bm25(pdf_index_fts) as score,
+           snippet(pdf_index_fts, 1, '<b>', '</b>', '...', 32) as snippet
+    FROM pdf_index_fts 
+    WHERE pdf_index_fts MATCH ?
+    ORDER BY rank
+    LIMIT ?
+'''
+
+COMBINATION_SEARCH_SQL = '''
+    SELECT rowid, filename, candidate_name, content_stem
+    FROM pdf_index_fts 
+    WHERE pdf_index_fts MATCH ?
+    ORDER BY rank
+    LIMIT ?
+'''
+
 
 class OptimizedPDFIndexer:
-    def __init__(self, db_path: str = 'data/pdf_index.db', max_cache_size: int = 500):
+    def __init__(self, db_path: str = 'data/pdf_index.db', max_cache_size: int = 500, shards: int = PDF_INDEX_SHARDS,
+                 read_only: bool = False):
+        """ read_only - только поиск (процессы пула): без создания схемы, миграций и записи в шарды """
         self.db_path = db_path
-        self.search_semaphore = asyncio.Semaphore(5)
+        self.read_only = read_only
+        # шард 0 - сам db_path, остальные - соседние файлы <имя>_shard<i>.db
+        base_path = os.path.splitext(db_path)[0]
+        self.shard_paths = [db_path] + [f"{base_path}_shard{i}.db" for i in range(1, max(shards, 1))]
+        self._shard_executor = (
+            ThreadPoolExecutor(max_workers=len(self.shard_paths), thread_name_prefix='pdf-shard')
+            if len(self.shard_paths) > 1 else None
+        )
         self._pdf_texts_cache = LRUCache(maxsize=500)
         self.max_cache_size = max_cache_size
         self._lock = threading.Lock()
-        self.init_index_database()
-        self._setup_database_optimizations()
+        if not read_only:
+            self.init_index_database()
+            self._setup_database_optimizations()
+
+        self.snapshot = None
+        self.snapshot_builder = None
+        if SEARCH_SNAPSHOT_ENABLED:
+            from search_snapshot import SearchSnapshot, SnapshotBuilder
+            self.snapshot = SearchSnapshot(SEARCH_SNAPSHOT_DIR)
+            if not read_only:
+                self.snapshot_builder = SnapshotBuilder(SEARCH_SNAPSHOT_DIR, self.shard_paths, SEARCH_SNAPSHOT_DELTA_RATIO)
+
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._refresh_requested = False
+
+        self.scoring_path = os.path.splitext(self.db_path)[0] + '_scoring.npz'
+        self.scoring = None
+        self._scoring_mtime = None
+        self.reload_scoring_matrix()
 
     async def optimize_database_indexes(self):
         """Создание оптимизированных индексов"""
-        async with aiosqlite.connect(self.db_path) as conn:
-            cursor = await conn.cursor()
-
-            await cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_fts_optimized 
-                ON pdf_index_fts(content, candidate_name, filename)
-            ''')
-
-            await cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_access_stats 
-                ON pdf_index(last_accessed, indexed_at)
-            ''')
-
-            await conn.commit()
-
-    async def search_indexed_pdf_async(self, search_text: str, limit: int = 20):
-        """ Асинхронный поиск с кэшированием """
-        cache_key = cache_manager.generate_key("pdf_search", search_text, limit)
-        cached_results = await cache_manager.get(cache_key)
-        if cached_results:
-            logger.info(f"📦 Результаты из кэша для: {search_text[:50]}...")
-            return cached_results
-
-        async with self.search_semaphore:
-            results = await self._perform_async_search(search_text, limit)
-            await cache_manager.set(cache_key, results, ttl=3600)
-            return results
-
-    async def _perform_async_search(self, search_text: str, limit: int):
-        """ Полнофункциональный асинхронный поиск """
-        try:
-            async with aiosqlite.connect(self.db_path) as conn:
-                conn.row_factory = aiosqlite.Row
+        for db_path in self.shard_paths:
+            async with aiosqlite.connect(db_path) as conn:
                 cursor = await conn.cursor()
 
-                logger.info(f"🔍 Асинхронный поиск: '{search_text[:80]}...'")
-
-                search_normalized = self._normalize_search_text(search_text)
-                key_phrases = self._extract_search_phrases(search_normalized)
-
-                if not key_phrases:
-                    logger.warning("❌ Не удалось извлечь фразы, используем fallback")
-                    return await self._fallback_search_async(search_text, limit)
-
-                results = []
-                seen_filenames = set()
-
-                for phrase in key_phrases[:10]:
-                    phrase_results = await self._search_single_phrase_async(cursor, phrase, limit * 2)
-                    for result in phrase_results:
-                        if result['filename'] not in seen_filenames:
-                            result['search_level'] = 'exact_phrase'
-                            result['matched_phrase'] = phrase
-                            results.append(result)
-                            seen_filenames.add(result['filename'])
+                await cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_fts_optimized 
+                    ON pdf_index_fts(content, candidate_name, filename)
+                ''')
 
-                if len(results) < 3:
-                    combo_results = await self._search_by_word_combinations_async(cursor, key_phrases, limit)
-                    for result in combo_results:
-                        if result['filename'] not in seen_filenames:
-                            result['search_level'] = 'word_combo'
-                            results.append(result)
-                            seen_filenames.add(result['filename'])
+                await cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_access_stats 
+                    ON pdf_index(last_accessed, indexed_at)
+                ''')
 
-                final_results = []
-                for result in results:
-                    final_score = self._calculate_relevance(result, search_normalized, key_phrases)
-                    result['relevance_score'] = final_score
+                await conn.commit()
 
-                    if final_score >= 0.1:
-                        final_results.append(result)
-
-                final_results.sort(key=lambda x: x['relevance_score'], reverse=True)
-                final_results = final_results[:limit]
-
-                logger.info(f"✅ Асинхронный поиск: найдено {len(final_results)} результатов")
-                return final_results
-
-        except Exception as e:
-            logger.error(f"❌ Ошибка асинхронного поиска: {e}")
-            return await self._fallback_search_async(search_text, limit)
-
-    async def _search_single_phrase_async(self, cursor, phrase: str, limit: int) -> List[dict]:
-        """ Асинхронный поиск по одной фразе """
-        try:
-            await cursor.execute('''
-                   SELECT filename, candidate_name, content, 
-                          snippet(pdf_index_fts, 2, '<b>', '</b>', '...', 64) as snippet
-                   FROM pdf_index_fts 
-                   WHERE pdf_index_fts MATCH ?
-                   ORDER BY rank
-                   LIMIT ?
-               ''', (f'"{phrase}"', limit))
-
-            rows = await cursor.fetchall()
-            results = []
-            for row in rows:
-                results.append({
-                    'filename': row['filename'],
-                    'candidate_name': row['candidate_name'],
-                    'file_path': os.path.join(RESUMES_FOLDER, row['filename']),
-                    'relevance_score': 0.8,
-                    'has_exact_match': True,
-                    'content': row['content'],
-                    'matched_phrase': phrase,
-                    'snippet': row['snippet']
-                })
-
-            return results
-        except Exception as e:
-            logger.warning(f"⚠️ Ошибка FTS поиска фразы '{phrase}': {e}")
-            return []
-
-    async def _search_by_word_combinations_async(self, cursor, phrases: List[str], limit: int) -> List[dict]:
-        """ Асинхронный поиск по комбинациям слов """
-        all_words = []
-        for phrase in phrases:
-            words = re.findall(r'\w{4,}', phrase.lower())
-            all_words.extend(words)
-
-        stop_words = {
-            'менеджер', 'продажам', 'работы', 'клиентами', 'проект', 'компании',
-            'организация', 'управление', 'контроль', 'разработка', 'сопровождение'
-        }
-        unique_words = [word for word in set(all_words) if word not in stop_words]
-
-        if len(unique_words) < 2:
-            return []
-
-        logger.info(f"🔍 Асинхронный поиск по комбинациям слов: {unique_words[:5]}")
-
-        try:
-            search_query = ' OR '.join(unique_words[:3])
-            await cursor.execute('''
-                   SELECT filename, candidate_name, content
-                   FROM pdf_index_fts 
-                   WHERE pdf_index_fts MATCH ?
-                   ORDER BY rank
-                   LIMIT ?
-               ''', (search_query, limit * 2))
-
-            rows = await cursor.fetchall()
-            results = []
-            for row in rows:
-                content_lower = row['content'].lower()
-                matched_count = sum(1 for word in unique_words[:3] if word in content_lower)
-
-                if matched_count >= 2:
-                    relevance = min(matched_count / len(unique_words[:3]), 0.6)
-                    results.append({
-                        'filename': row['filename'],
-                        'candidate_name': row['candidate_name'],
-                        'file_path': os.path.join(RESUMES_FOLDER, row['filename']),
-                        'relevance_score': relevance,
-                        'has_exact_match': False,
-                        'matched_words': matched_count
-                    })
+    def _setup_database_optimizations(self):
+        """ Оптимизация SQLite для больших объемов данных """
+        for db_path in self.shard_paths:
+            with sqlite3.connect(db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute("PRAGMA cache_size = -100000")
+                cursor.execute("PRAGMA page_size = 4096")
+                cursor.execute("PRAGMA mmap_size = 268435456")
+                cursor.execute("PRAGMA temp_store = memory")
+                cursor.execute("PRAGMA journal_mode = WAL")
+                cursor.execute("PRAGMA synchronous = NORMAL")
+                conn.commit()
 
-            return results
+    def init_index_database(self):
+        """ Инициализация БД (всех шардов) """
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
 
-        except Exception as e:
-            logger.error(f"❌ Ошибка асинхронного поиска по комбинациям слов: {e}")
-            return []
+        for db_path in self.shard_paths:
+            self._init_shard_database(db_path)
+        self._rebalance_shards()
 
-    async def _fallback_search_async(self, search_text: str, limit: int = 20):
-        """ Асинхронный резервный поиск """
-        try:
-            async with aiosqlite.connect(self.db_path) as conn:
-                conn.row_factory = aiosqlite.Row
-                cursor = await conn.cursor()
+        logger.info(f"✅ База индексации инициализирована (шардов: {len(self.shard_paths)})")
 
-                words = re.findall(r'\b\w{4,}\b', search_text.lower())
-                stop_words = {'опыт', 'работы', 'работа', 'компания', 'проект'}
-                unique_words = [word for word in set(words) if word not in stop_words]
-
-                if not unique_words:
-                    unique_words = words[:3]
-
-                logger.info(f"🔄 Асинхронный fallback поиск по словам: {unique_words}")
-
-                all_results = []
-                for word in unique_words[:3]:
-                    await cursor.execute('''
-                           SELECT filename, candidate_name, content
-                           FROM pdf_index 
-                           WHERE content LIKE ? 
-                           LIMIT ?
-                       ''', (f'%{word}%', limit))
-
-                    rows = await cursor.fetchall()
-                    for row in rows:
-                        all_results.append({
-                            'filename': row['filename'],
-                            'candidate_name': row['candidate_name'],
-                            'file_path': os.path.join(RESUMES_FOLDER, row['filename']),
-                            'relevance_score': 0.3,
-                            'has_exact_match': False,
-                            'matched_word': word
-                        })
-
-                seen_files = set()
-                final_results = []
-                for result in all_results:
-                    if result['filename'] not in seen_files:
-                        seen_files.add(result['filename'])
-                        final_results.append(result)
-
-                final_results = final_results[:limit]
-                logger.info(f"🔄 Асинхронный fallback поиск: найдено {len(final_results)} результатов")
-                return final_results
+    def _rebalance_shards(self):
+        """ Однократный перенос документов в свои шарды после смены PDF_INDEX_SHARDS
 
-        except Exception as e:
-            logger.error(f"❌ Ошибка асинхронного fallback поиска: {e}")
-            return []
+        Число шардов, под которое разложен индекс, хранится в pdf_index_meta
+        шарда 0; при обычной индексации чужие шарды не открываются на запись.
+        Документ переносится вместе с текстом, повторное извлечение из PDF не нужно.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(INDEX_META_SQL)
+            row = conn.execute("SELECT value FROM pdf_index_meta WHERE key = 'shards'").fetchone()
+        if row is not None and int(row[0]) == len(self.shard_paths):
+            return
+
+        moved = 0
+        for db_path in self.shard_paths:
+            with sqlite3.connect(db_path) as conn:
+                cursor = conn.cursor()
+                misplaced = [
+                    (doc_id, filename) for doc_id, filename in cursor.execute("SELECT id, filename FROM pdf_index")
+                    if self._shard_path(filename) != db_path
+                ]
+                failures = [
+                    row for row in cursor.execute(
+                        "SELECT filename, file_mtime, file_size, failure_kind FROM pdf_index_failures"
+                    ).fetchall()
+                    if self._shard_path(row[0]) != db_path
+                ]
+
+                for doc_id, filename in misplaced:
+                    content, candidate_name, file_size = cursor.execute(
+                        "SELECT content, candidate_name, file_size FROM pdf_index WHERE id = ?", (doc_id,)
+                    ).fetchone()
+                    with sqlite3.connect(self._shard_path(filename)) as owner:
+                        owner_cursor = owner.cursor()
+                        if owner_cursor.execute("SELECT 1 FROM pdf_index WHERE filename = ?", (filename,)).fetchone() is None:
+                            self._write_document(owner_cursor, filename, content, candidate_name, file_size)
+                        owner.commit()
+                    self._delete_passages(cursor, doc_id)
+                    cursor.execute('DELETE FROM pdf_index WHERE id = ?', (doc_id,))
+                    moved += 1
+
+                for filename, file_mtime, file_size, failure_kind in failures:
+                    with sqlite3.connect(self._shard_path(filename)) as owner:
+                        owner.execute('''
+                            INSERT OR IGNORE INTO pdf_index_failures (filename, file_mtime, file_size, failure_kind)
+                            VALUES (?, ?, ?, ?)
+                        ''', (filename, file_mtime, file_size, failure_kind))
+                        owner.commit()
+                    cursor.execute('DELETE FROM pdf_index_failures WHERE filename = ?', (filename,))
+                conn.commit()
 
-    def _setup_database_optimizations(self):
-        """ Оптимизация SQLite для больших объемов данных """
         with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA cache_size = -100000")
-            cursor.execute("PRAGMA page_size = 4096")
-            cursor.execute("PRAGMA mmap_size = 268435456")
-            cursor.execute("PRAGMA temp_store = memory")
-            cursor.execute("PRAGMA journal_mode = WAL")
-            cursor.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("INSERT OR REPLACE INTO pdf_index_meta (key, value) VALUES ('shards', ?)",
+                         (str(len(self.shard_paths)),))
             conn.commit()
+        if moved:
+            logger.info(f"🔀 Перераспределение по {len(self.shard_paths)} шардам: перенесено {moved} документов")
 
-    def init_index_database(self):
-        """ Инициализация БД """
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-
-        with sqlite3.connect(self.db_path) as conn:
+    def _init_shard_database(self, db_path: str):
+        """ Схема одного шарда """
+        with sqlite3.connect(db_path) as conn:
             cursor = conn.cursor()
 
             cursor.execute("PRAGMA journal_mode=WAL")
@@ -280,46 +307,190 @@ class OptimizedPDFIndexer:
                 )
             ''')
 
+            cursor.execute(FTS_TABLE_SQL)
+
+            for statement in TRIGRAM_SCHEMA_SQL + FINGERPRINT_SCHEMA_SQL + CHANGE_LOG_SCHEMA_SQL[:1]:
+                cursor.execute(statement)
+
+            for statement in CHANGE_LOG_SCHEMA_SQL[1:] if SEARCH_SNAPSHOT_ENABLED else DROP_CHANGE_LOG_SQL:
+                cursor.execute(statement)
+
             cursor.execute('''
-                        CREATE VIRTUAL TABLE IF NOT EXISTS pdf_index_fts 
-                        USING fts5(
-                            filename, 
-                            content, 
-                            candidate_name,
-                            tokenize="porter unicode61"
-                        )
-                    ''')
+                CREATE TABLE IF NOT EXISTS pdf_index_failures (
+                    filename TEXT PRIMARY KEY,
+                    file_mtime REAL NOT NULL,
+                    file_size INTEGER NOT NULL,
+                    failure_kind TEXT NOT NULL,
+                    failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
 
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_filename ON pdf_index(filename)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_candidate_name ON pdf_index(candidate_name)')
 
+            self._migrate_index_schema(conn)
+
             conn.commit()
 
-        logger.info("✅ База индексации инициализирована")
+    def get_pending_files(self) -> List[str]:
+        """ Файлы, которые нужно (пере)индексировать
 
-    def index_all_pdfs(self, max_workers: int = 2, batch_size: int = 100):
-        """ Параллельная индексация """
+        Файл пропускается, если он уже в индексе или если он ранее не смог
+        проиндексироваться и с тех пор не изменился (те же mtime и размер).
+        """
         pdf_files = [f for f in os.listdir(RESUMES_FOLDER) if f.lower().endswith('.pdf')]
 
-        logger.info(f"📚 Начало индексации {len(pdf_files)} PDF файлов...")
+        existing_files = set()
+        failed_files = {}
+        for db_path in self.shard_paths:
+            with sqlite3.connect(db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT filename FROM pdf_index")
+                existing_files.update(row[0] for row in cursor.fetchall())
+                cursor.execute("SELECT filename, file_mtime, file_size FROM pdf_index_failures")
+                failed_files.update((row[0], (row[1], row[2])) for row in cursor.fetchall())
+
+        pending = []
+        for filename in pdf_files:
+            if filename in existing_files:
+                continue
+            if filename in failed_files and failed_files[filename] == self._file_signature(filename):
+                continue
+            pending.append(filename)
+        return pending
+
+    def _shard_path(self, filename: str) -> str:
+        """ Шард файла: crc32 имени по модулю числа шардов """
+        return self.shard_paths[zlib.crc32(filename.encode('utf-8')) % len(self.shard_paths)]
+
+    def _map_shards(self, func, *args) -> list:
+        """ Вызов func(db_path, *args) для всех шардов параллельно """
+        if self._shard_executor is None:
+            return [func(self.db_path, *args)]
+        return list(self._shard_executor.map(lambda db_path: func(db_path, *args), self.shard_paths))
+
+    def _file_signature(self, filename: str) -> Optional[Tuple[float, int]]:
+        """ Ключ для реестра неиндексируемых файлов: (mtime, размер) """
+        try:
+            stat = os.stat(os.path.join(RESUMES_FOLDER, filename))
+            return stat.st_mtime, stat.st_size
+        except OSError:
+            return None
+
+    def _record_failure(self, filename: str, failure_kind: str):
+        """ Запоминает файл, из которого не удалось извлечь текст """
+        signature = self._file_signature(filename)
+        if signature is None:
+            return
+        try:
+            with sqlite3.connect(self._shard_path(filename)) as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO pdf_index_failures 
+                    (filename, file_mtime, file_size, failure_kind) 
+                    VALUES (?, ?, ?, ?)
+                ''', (filename, signature[0], signature[1], failure_kind))
+                conn.commit()
+            logger.warning(f"🚫 {filename} помечен как неиндексируемый ({failure_kind})")
+        except sqlite3.Error as e:
+            logger.error(f"❌ Не удалось записать ошибку индексации {filename}: {e}")
+
+    def _migrate_index_schema(self, conn):
+        """ Перестроение FTS индекса под текущую схему (PRAGMA user_version) """
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= INDEX_SCHEMA_VERSION:
+            return
+
+        logger.info(f"🔄 Перестроение FTS индекса: схема {version} -> {INDEX_SCHEMA_VERSION}")
+        if version < 2:
+            conn.execute("DROP TABLE IF EXISTS pdf_index_fts")
+            conn.execute(FTS_TABLE_SQL)
+            for doc_id, filename, candidate_name, content in conn.execute(
+                    "SELECT id, filename, candidate_name, content FROM pdf_index"):
+                conn.executemany(INSERT_PASSAGE_SQL, self._passage_rows(doc_id, filename, candidate_name, content))
+        if version < 3:
+            conn.execute("INSERT INTO pdf_index_trigram(pdf_index_trigram) VALUES ('rebuild')")
+        if version < 4:
+            for doc_id, content in conn.execute("SELECT id, content FROM pdf_index"):
+                conn.executemany(INSERT_FINGERPRINT_SQL, self._fingerprint_rows(doc_id, content))
+        conn.execute(f"PRAGMA user_version = {INDEX_SCHEMA_VERSION}")
+        logger.info("✅ FTS индекс перестроен")
+
+    def _split_into_passages(self, text: str) -> List[str]:
+        """ Нарезка текста на перекрывающиеся фрагменты по границам слов """
+        if len(text) <= PASSAGE_SIZE:
+            return [text] if text else []
+
+        passages = []
+        step = PASSAGE_SIZE - PASSAGE_OVERLAP
+        start = 0
+        while start < len(text):
+            end = min(start + PASSAGE_SIZE, len(text))
+            if end < len(text):
+                space = text.rfind(' ', start + step, end)
+                if space != -1:
+                    end = space
+            passages.append(text[start:end].strip())
+            if end >= len(text):
+                break
+            next_start = end - PASSAGE_OVERLAP
+            space = text.find(' ', next_start, end)
+            start = space + 1 if space != -1 else next_start
+        return passages
+
+    def _passage_rows(self, doc_id: int, filename: str, candidate_name: str, text: str) -> List[tuple]:
+        """ Строки pdf_index_fts для документа: (rowid, filename, content, candidate_name, content_stem) """
+        passages = self._split_into_passages(text or "")[:PASSAGE_ROWID_STRIDE]
+        return [
+            (doc_id * PASSAGE_ROWID_STRIDE + passage_no, filename, passage, candidate_name, stem_text(passage))
+            for passage_no, passage in enumerate(passages)
+        ]
 
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT filename FROM pdf_index")
-            existing_files = {row[0] for row in cursor.fetchall()}
+    def _fingerprint_rows(self, doc_id: int, text: str) -> List[tuple]:
+        """ Строки pdf_fingerprints для документа: (hash, doc_id) """
+        return [(fingerprint_hash, doc_id) for fingerprint_hash in fingerprint(text or "")]
+
+    def _write_document(self, cursor, filename: str, content: str, candidate_name: str, file_size: int) -> int:
+        """ Запись документа с фрагментами FTS и отпечатками в шард курсора """
+        cursor.execute('''
+            INSERT INTO pdf_index 
+            (filename, content, candidate_name, file_size) 
+            VALUES (?, ?, ?, ?)
+        ''', (filename, content, candidate_name, file_size))
+        doc_id = cursor.lastrowid
+
+        cursor.executemany(INSERT_PASSAGE_SQL, self._passage_rows(doc_id, filename, candidate_name, content))
+        cursor.executemany(INSERT_FINGERPRINT_SQL, self._fingerprint_rows(doc_id, content))
+        return doc_id
+
+    def _delete_passages(self, cursor, doc_id: int):
+        """ Удаление всех фрагментов документа из FTS """
+        cursor.execute(
+            "DELETE FROM pdf_index_fts WHERE rowid >= ? AND rowid < ?",
+            (doc_id * PASSAGE_ROWID_STRIDE, (doc_id + 1) * PASSAGE_ROWID_STRIDE)
+        )
+
+    def index_all_pdfs(self, max_workers: int = 2, batch_size: int = 100):
+        """ Параллельная индексация """
+        files_to_index = self.get_pending_files()
 
-        files_to_index = [f for f in pdf_files if f not in existing_files]
+        logger.info(f"📚 Начало индексации, новых или изменённых PDF файлов: {len(files_to_index)}")
 
         if not files_to_index:
             logger.info("✅ Все файлы уже проиндексированы")
-            return len(pdf_files)
+            return 0
 
         logger.info(f"📝 Файлов для индексации: {len(files_to_index)}")
 
+        # вперемешку по шардам, чтобы параллельные записи шли в разные файлы
+        by_shard = {}
+        for filename in files_to_index:
+            by_shard.setdefault(self._shard_path(filename), []).append(filename)
+        files_to_index = [filename for group in zip_longest(*by_shard.values()) for filename in group if filename]
+
         indexed_count = 0
         total_files = len(files_to_index)
 
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        with ThreadPoolExecutor(max_workers=max(max_workers, len(self.shard_paths))) as executor:
             batches = [files_to_index[i:i + batch_size]
                        for i in range(0, len(files_to_index), batch_size)]
 
@@ -352,6 +523,8 @@ class OptimizedPDFIndexer:
                 logger.info(f"✅ Батч {batch_num}: индексировано {batch_indexed}/{len(batch)} файлов")
 
         logger.info(f"🎉 Итог: индексировано {indexed_count} файлов")
+        if indexed_count:
+            self.refresh_derived_indexes()
         return indexed_count
 
     def _index_single_pdf(self, filename: str) -> bool:
@@ -363,27 +536,28 @@ class OptimizedPDFIndexer:
                 if not os.path.exists(filepath):
                     return False
 
-                text = self.extract_text_from_pdf(filepath, use_cache=False)
+                text, failure_kind = self._extract_text(filepath)
                 if not text:
+                    self._record_failure(filename, failure_kind)
                     return False
 
-                text_clean = self._clean_text(text[:20000])
+                text_clean = self._clean_text(text)
                 candidate_name = extract_name_from_filename(filename)
                 file_size = os.path.getsize(filepath)
 
-                with sqlite3.connect(self.db_path) as conn:
+                # пишется только свой шард; копии в чужих шардах убирает _rebalance_shards при смене их числа
+                with sqlite3.connect(self._shard_path(filename)) as conn:
                     cursor = conn.cursor()
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO pdf_index 
-                        (filename, content, candidate_name, file_size) 
-                        VALUES (?, ?, ?, ?)
-                    ''', (filename, text_clean, candidate_name, file_size))
-
-                    cursor.execute('''
-                                INSERT OR REPLACE INTO pdf_index_fts 
-                                (filename, content, candidate_name) 
-                                VALUES (?, ?, ?)
-                            ''', (filename, text_clean, candidate_name))
+                    cursor.execute('SELECT id FROM pdf_index WHERE filename = ?', (filename,))
+                    previous = cursor.fetchone()
+                    if previous:
+                        self._delete_passages(cursor, previous[0])
+                        # явный DELETE, чтобы сработали триггеры триграммного индекса
+                        cursor.execute('DELETE FROM pdf_index WHERE id = ?', (previous[0],))
+
+                    self._write_document(cursor, filename, text_clean, candidate_name, file_size)
+
+                    cursor.execute('DELETE FROM pdf_index_failures WHERE filename = ?', (filename,))
 
                     conn.commit()
                     return True
@@ -403,87 +577,326 @@ class OptimizedPDFIndexer:
         return False
 
     def search_indexed_pdf(self, search_text: str, limit: int = 20):
-        """ Основной поиск по индексу """
+        """ Основной поиск по индексу (параллельно по всем шардам) """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
+            logger.info(f"🔍 Поиск: '{search_text[:80]}...'")
 
-                logger.info(f"🔍 Поиск: '{search_text[:80]}...'")
+            search_normalized = self._normalize_search_text(search_text)
 
-                search_normalized = self._normalize_search_text(search_text)
-                key_phrases = self._extract_search_phrases(search_normalized)
+            snapshot_results = self._search_snapshot(search_normalized, limit)
+            if snapshot_results:
+                logger.info(f"✅ Поиск по снапшоту: найдено {len(snapshot_results)} результатов")
+                return snapshot_results
 
-                if not key_phrases:
-                    logger.warning("❌ Не удалось извлечь фразы, используем fallback")
-                    return self._fallback_search(search_text, limit)
+            query_fingerprints = fingerprint(search_normalized)
+            fingerprint_results = []
+            for shard_results in self._map_shards(self._search_shard_fingerprints, query_fingerprints, limit):
+                fingerprint_results.extend(shard_results)
+            if fingerprint_results:
+                fingerprint_results = self._top_results(fingerprint_results, limit)
+                logger.info(f"✅ Поиск по отпечаткам: найдено {len(fingerprint_results)} результатов")
+                return fingerprint_results
 
-                results = []
-                seen_filenames = set()
+            key_phrases = self._extract_search_phrases(search_normalized)
 
-                for phrase in key_phrases[:10]:
-                    phrase_results = self._search_single_phrase(cursor, phrase, limit * 2)
-                    for result in phrase_results:
-                        if result['filename'] not in seen_filenames:
-                            result['search_level'] = 'exact_phrase'
-                            result['matched_phrase'] = phrase
-                            results.append(result)
-                            seen_filenames.add(result['filename'])
+            if not key_phrases:
+                logger.warning("❌ Не удалось извлечь фразы, используем fallback")
+                return self._fallback_search(search_text, limit)
 
-                if len(results) < 3:
-                    combo_results = self._search_by_word_combinations(cursor, key_phrases, limit)
-                    for result in combo_results:
-                        if result['filename'] not in seen_filenames:
-                            result['search_level'] = 'word_combo'
-                            results.append(result)
-                            seen_filenames.add(result['filename'])
+            merged = {}
+            for shard_merged in self._map_shards(self._search_shard_phrases, key_phrases, limit):
+                merged.update(shard_merged)
 
-                final_results = []
-                for result in results:
-                    final_score = self._calculate_relevance(result, search_normalized, key_phrases)
-                    result['relevance_score'] = final_score
+            if len(merged) < 3:
+                for combo_results in self._map_shards(self._search_shard_combinations, key_phrases, limit):
+                    self._merge_results(merged, combo_results, 'word_combo')
 
-                    if final_score >= 0.1:
-                        final_results.append(result)
+            final_results = self._rank_results(list(merged.values()), search_normalized, key_phrases, limit)
 
-                final_results.sort(key=lambda x: x['relevance_score'], reverse=True)
-                final_results = final_results[:limit]
-
-                logger.info(f"✅ Найдено: {len(final_results)} результатов")
-                return final_results
+            logger.info(f"✅ Найдено: {len(final_results)} результатов")
+            return final_results
 
         except Exception as e:
             logger.error(f"❌ Ошибка поиска: {e}")
             return self._fallback_search(search_text, limit)
 
-    def _search_single_phrase(self, cursor, phrase: str, limit: int) -> List[dict]:
-        """ Поиск по одной фразе """
+    def _shard_connection(self, db_path: str) -> sqlite3.Connection:
+        """ Соединение с шардом для чтения (строки как sqlite3.Row) """
+        if self.read_only:
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        else:
+            conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _search_shard_fingerprints(self, db_path: str, query_fingerprints, limit: int) -> List[dict]:
+        """ Поиск по отпечаткам в одном шарде """
+        with closing(self._shard_connection(db_path)) as conn:
+            rows = conn.execute(*self._fingerprint_query(query_fingerprints, limit)).fetchall()
+        return self._fingerprint_results(rows, len(query_fingerprints))
+
+    def _search_shard_phrases(self, db_path: str, key_phrases: List[str], limit: int) -> dict:
+        """ Поиск ключевых фраз в одном шарде """
+        merged = {}
+        with closing(self._shard_connection(db_path)) as conn:
+            cursor = conn.cursor()
+            for phrase in key_phrases[:10]:
+                phrase_results = self._search_single_phrase(cursor, phrase, limit * 2)
+                self._merge_results(merged, phrase_results, 'exact_phrase')
+        return merged
+
+    def _search_shard_combinations(self, db_path: str, key_phrases: List[str], limit: int) -> List[dict]:
+        """ Поиск по комбинациям слов в одном шарде """
+        with closing(self._shard_connection(db_path)) as conn:
+            return self._search_by_word_combinations(conn.cursor(), key_phrases, limit)
+
+    def _top_results(self, results: List[dict], limit: int) -> List[dict]:
+        """ Слияние результатов шардов: top-k по релевантности """
+        return heapq.nlargest(limit, results, key=lambda result: result['relevance_score'])
+
+    def _search_snapshot(self, search_normalized: str, limit: int) -> List[dict]:
+        """ Поиск по mmap-снапшоту: фразы и комбинации слов без обращения к SQLite
+
+        Пустой результат - снапшот выключен, не готов или ничего не нашел;
+        тогда работает обычный поиск по FTS.
+        """
+        if self.snapshot is None or not self.snapshot.is_ready():
+            return []
+
+        key_phrases = self._extract_search_phrases(search_normalized)
+        if not key_phrases:
+            return []
+
         try:
-            cursor.execute('''
-                SELECT filename, candidate_name, content, snippet(pdf_index_fts, 2, '<b>', '</b>', '...', 64) as snippet
-                FROM pdf_index_fts 
-                WHERE pdf_index_fts MATCH ?
-                ORDER BY rank
-                LIMIT ?
-            ''', (f'"{phrase}"', limit))
+            documents = {}
+            for phrase in key_phrases[:10]:
+                terms = stem_tokens(phrase)
+                if not terms:
+                    continue
+                for filename, (candidate_name, count) in self.snapshot.phrase_matches(terms).items():
+                    document = documents.setdefault(filename, {
+                        'candidate_name': candidate_name, 'phrases': [], 'occurrences': 0
+                    })
+                    document['phrases'].append(phrase)
+                    document['occurrences'] += count
 
             results = []
-            for row in cursor.fetchall():
+            for filename, document in documents.items():
+                # та же формула, что и в _calculate_relevance
+                score = sum(min(len(phrase) / 100, 0.5) for phrase in document['phrases'][:3])
+                score += 0.2 if len(document['phrases']) >= 2 else 0.1
                 results.append({
+                    'filename': filename,
+                    'candidate_name': document['candidate_name'],
+                    'file_path': os.path.join(RESUMES_FOLDER, filename),
+                    'relevance_score': min(score, 1.0),
+                    'has_exact_match': True,
+                    'matched_phrase': document['phrases'][0],
+                    'search_level': 'exact_phrase',
+                    'occurrences': document['occurrences']
+                })
+
+            if len(results) < 3:
+                words = self._combination_words(key_phrases)[:3]
+                if len(words) >= 2:
+                    matched = {}
+                    for word in words:
+                        for filename, candidate_name in self.snapshot.term_matches(stem_word(word)).items():
+                            matched.setdefault(filename, [candidate_name, 0])[1] += 1
+                    for filename, (candidate_name, matched_count) in matched.items():
+                        if matched_count >= 2 and filename not in documents:
+                            results.append({
+                                'filename': filename,
+                                'candidate_name': candidate_name,
+                                'file_path': os.path.join(RESUMES_FOLDER, filename),
+                                'relevance_score': min(matched_count / len(words), 0.6),
+                                'has_exact_match': False,
+                                'matched_words': matched_count,
+                                'search_level': 'word_combo'
+                            })
+
+            results = [result for result in results if result['relevance_score'] >= 0.1]
+            return heapq.nlargest(limit, results, key=lambda result: result['relevance_score'])
+
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка поиска по снапшоту, используем FTS: {e}")
+            return []
+
+    def refresh_derived_indexes(self):
+        """ Обновление снапшота и матрицы оценок после записи в индекс (сжатие PDF - фоновая задача pdf_optimizer) """
+        if self.snapshot_builder is not None:
+            try:
+                self.snapshot_builder.refresh()
+            except Exception as e:
+                logger.error(f"❌ Ошибка обновления снапшота поиска: {e}")
+
+        if SCORING_MATRIX_ENABLED:
+            try:
+                scoring = ScoringMatrix.build(self.shard_paths, self.scoring)
+                if scoring is not self.scoring:
+                    scoring.save(self.scoring_path)
+                    self.scoring = scoring
+                    self._scoring_mtime = os.stat(self.scoring_path).st_mtime_ns
+                    logger.info(f"📐 Матрица оценок обновлена: {len(scoring.filenames)} документов, {scoring.nnz} элементов")
+            except Exception as e:
+                logger.error(f"❌ Ошибка обновления матрицы оценок: {e}")
+
+    def schedule_derived_refresh(self):
+        """ Обновление производных индексов в фоне из цикла событий (сама сборка - в потоке)
+
+        Вызовы во время идущего обновления склеиваются в один повторный проход.
+        """
+        self._refresh_requested = True
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(self._run_derived_refresh())
+
+    async def _run_derived_refresh(self):
+        while self._refresh_requested:
+            self._refresh_requested = False
+            await asyncio.to_thread(self.refresh_derived_indexes)
+
+    def reload_scoring_matrix(self):
+        """ Подхват матрицы оценок, сохраненной другим процессом (по mtime файла) """
+        if not SCORING_MATRIX_ENABLED:
+            return
+        try:
+            mtime = os.stat(self.scoring_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._scoring_mtime:
+            self.scoring = ScoringMatrix.load(self.scoring_path)
+            self._scoring_mtime = mtime
+
+    def _rank_results(self, results: List[dict], search_normalized: str, key_phrases: List[str],
+                      limit: int) -> List[dict]:
+        """ Оценка кандидатов (BM25 по матрице, без матрицы - _calculate_relevance для всех) и выбор top-k """
+        scoring = self.scoring
+        scores = None
+        if scoring is not None and results:
+            try:
+                query_terms = stem_tokens(' '.join(key_phrases))
+                scores = scoring.score([result['filename'] for result in results], query_terms)
+                # документы, проиндексированные после построения матрицы, - тот же BM25 по их тексту
+                for i in np.flatnonzero(np.isnan(scores)).tolist():
+                    scores[i] = scoring.score_text(results[i].get('content', ''), query_terms)
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка векторной оценки, используем построчную: {e}")
+                scores = None
+
+        for i, result in enumerate(results):
+            if scores is None:
+                result['relevance_score'] = self._calculate_relevance(result, search_normalized, key_phrases)
+            else:
+                result['relevance_score'] = float(scores[i])
+
+        relevant = [result for result in results if result['relevance_score'] >= 0.1]
+        order = top_k(np.array([result['relevance_score'] for result in relevant], dtype=np.float64), limit)
+        return [relevant[i] for i in order.tolist()]
+
+    def _search_single_phrase(self, cursor, phrase: str, limit: int) -> List[dict]:
+        """ Поиск по одной фразе """
+        try:
+            cursor.execute(PHRASE_SEARCH_SQL, (self._phrase_match_query(phrase), limit * PASSAGE_HITS_PER_DOCUMENT))
+            return self._aggregate_passage_hits(cursor.fetchall(), phrase, limit)
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка FTS поиска фразы '{phrase}': {e}")
+            return []
+
+    def _fingerprint_query(self, query_fingerprints, limit: int) -> tuple:
+        """ SQL поиска документов с наибольшим числом общих отпечатков """
+        hashes = list(query_fingerprints) or [0]
+        placeholders = ','.join('?' for _ in hashes)
+        sql = f'''
+            SELECT p.filename, p.candidate_name, f.shared
+            FROM (
+                SELECT doc_id, COUNT(*) AS shared
+                FROM pdf_fingerprints 
+                WHERE hash IN ({placeholders})
+                GROUP BY doc_id
+                ORDER BY shared DESC
+                LIMIT ?
+            ) f
+            JOIN pdf_index p ON p.id = f.doc_id
+            ORDER BY f.shared DESC
+        '''
+        return sql, (*hashes, limit)
+
+    def _fingerprint_results(self, rows, total_fingerprints: int) -> List[dict]:
+        """ Документы, содержащие вставленный фрагмент почти целиком """
+        results = []
+        for row in rows:
+            containment = row['shared'] / total_fingerprints if total_fingerprints else 0.0
+            if row['shared'] < FINGERPRINT_MIN_SHARED or containment < FINGERPRINT_MIN_CONTAINMENT:
+                continue
+            results.append({
+                'filename': row['filename'],
+                'candidate_name': row['candidate_name'],
+                'file_path': os.path.join(RESUMES_FOLDER, row['filename']),
+                'relevance_score': min(containment, 1.0),
+                'has_exact_match': True,
+                'search_level': 'fingerprint',
+                'shared_fingerprints': row['shared']
+            })
+        return results
+
+    def _aggregate_passage_hits(self, rows, phrase: str, limit: int) -> List[dict]:
+        """ Сведение найденных фрагментов к документам (top-k по лучшему фрагменту) """
+        documents = {}
+        for row in rows:
+            doc_id = row['rowid'] // PASSAGE_ROWID_STRIDE
+            document = documents.get(doc_id)
+            if document is None:
+                documents[doc_id] = {
                     'filename': row['filename'],
                     'candidate_name': row['candidate_name'],
                     'file_path': os.path.join(RESUMES_FOLDER, row['filename']),
                     'relevance_score': 0.8,
                     'has_exact_match': True,
                     'content': row['content'],
+                    'content_stem': row['content_stem'],
                     'matched_phrase': phrase,
-                    'snippet': row['snippet']
-                })
-
-            return results
-        except Exception as e:
-            logger.warning(f"⚠️ Ошибка FTS поиска фразы '{phrase}': {e}")
-            return []
+                    'snippet': row['snippet'],
+                    'passage_hits': 1,
+                    'bm25': row['score']
+                }
+            else:
+                if document['passage_hits'] < PASSAGE_HITS_PER_DOCUMENT:
+                    document['content'] += ' ' + row['content']
+                    document['content_stem'] += ' ' + row['content_stem']
+                document['passage_hits'] += 1
+
+        # bm25() в FTS5 отрицательный: чем меньше, тем релевантнее
+        return heapq.nsmallest(
+            limit, documents.values(),
+            key=lambda doc: doc['bm25'] / (1 + 0.1 * (doc['passage_hits'] - 1))
+        )
+
+    def _quote_fts(self, text: str) -> str:
+        """ Экранирование строки для FTS5 MATCH """
+        return '"' + text.replace('"', '""') + '"'
+
+    def _phrase_match_query(self, phrase: str) -> str:
+        """ Фраза как есть или в виде основ слов (русская морфология) """
+        query = f'content : {self._quote_fts(phrase)}'
+        stemmed = stem_text(phrase)
+        if stemmed:
+            query += f' OR content_stem : {self._quote_fts(stemmed)}'
+        return query
+
+    def _combination_match_query(self, words: List[str]) -> str:
+        """ Любое из слов по основам """
+        return 'content_stem : (' + ' OR '.join(self._quote_fts(stem_word(word)) for word in words) + ')'
+
+    def _merge_results(self, merged: dict, results: List[dict], search_level: str):
+        """ Объединение результатов разных запросов по документам """
+        for result in results:
+            existing = merged.get(result['filename'])
+            if existing is None:
+                result['search_level'] = search_level
+                merged[result['filename']] = result
+            elif result.get('content') and result['content'] not in existing.get('content', ''):
+                existing['content'] = existing.get('content', '') + ' ' + result['content']
+                existing['content_stem'] = existing.get('content_stem', '') + ' ' + result.get('content_stem', '')
 
     def _calculate_relevance(self, result: dict, search_text: str, key_phrases: List[str]) -> float:
         """ Расчет релевантности """
@@ -493,8 +906,12 @@ class OptimizedPDFIndexer:
                 return result['relevance_score']
 
             total_score = 0.0
+            content_stem = result.get('content_stem', '')
 
-            matched_phrases = [phrase for phrase in key_phrases if phrase.lower() in content]
+            matched_phrases = [
+                phrase for phrase in key_phrases
+                if phrase.lower() in content or (content_stem and stem_text(phrase) in content_stem)
+            ]
             for phrase in matched_phrases[:3]:
                 phrase_score = min(len(phrase) / 100, 0.5)
                 total_score += phrase_score
@@ -562,104 +979,127 @@ class OptimizedPDFIndexer:
 
     def _search_by_word_combinations(self, cursor, phrases: List[str], limit: int) -> List[dict]:
         """ Поиск по комбинациям слов """
-        all_words = []
-        for phrase in phrases:
-            words = re.findall(r'\w{4,}', phrase.lower())
-            all_words.extend(words)
-
-        stop_words = {
-            'менеджер', 'продажам', 'работы', 'клиентами', 'проект', 'компании',
-            'организация', 'управление', 'контроль', 'разработка', 'сопровождение'
-        }
-        unique_words = [word for word in set(all_words) if word not in stop_words]
-
+        unique_words = self._combination_words(phrases)
         if len(unique_words) < 2:
             return []
 
         logger.info(f"🔍 Поиск по комбинациям слов: {unique_words[:5]}")
 
         try:
-            search_query = ' OR '.join(unique_words[:3])
-            cursor.execute('''
-                        SELECT filename, candidate_name, content
-                        FROM pdf_index_fts 
-                        WHERE pdf_index_fts MATCH ?
-                        ORDER BY rank
-                        LIMIT ?
-                    ''', (search_query, limit * 2))
-
-            results = []
-            for row in cursor.fetchall():
-                content_lower = row['content'].lower()
-                matched_count = sum(1 for word in unique_words[:3] if word in content_lower)
-
-                if matched_count >= 2:
-                    relevance = min(matched_count / len(unique_words[:3]), 0.6)
-                    results.append({
-                        'filename': row['filename'],
-                        'candidate_name': row['candidate_name'],
-                        'file_path': os.path.join(RESUMES_FOLDER, row['filename']),
-                        'relevance_score': relevance,
-                        'has_exact_match': False,
-                        'matched_words': matched_count
-                    })
-
-            return results
+            search_query = self._combination_match_query(unique_words[:3])
+            cursor.execute(COMBINATION_SEARCH_SQL, (search_query, limit * 2 * PASSAGE_HITS_PER_DOCUMENT))
+            return self._aggregate_combination_hits(cursor.fetchall(), unique_words[:3])
 
         except Exception as e:
             logger.error(f"❌ Ошибка поиска по комбинациям слов: {e}")
             return []
 
+    def _combination_words(self, phrases: List[str]) -> List[str]:
+        """ Значимые слова из фраз для поиска по комбинациям """
+        all_words = []
+        for phrase in phrases:
+            words = re.findall(r'\w{4,}', phrase.lower())
+            all_words.extend(words)
+
+        stop_words = {
+            'менеджер', 'продажам', 'работы', 'клиентами', 'проект', 'компании',
+            'организация', 'управление', 'контроль', 'разработка', 'сопровождение'
+        }
+        return [word for word in set(all_words) if word not in stop_words]
+
+    def _aggregate_combination_hits(self, rows, words: List[str]) -> List[dict]:
+        """ Подсчет совпавших слов по всем найденным фрагментам документа """
+        word_stems = {word: stem_word(word) for word in words}
+        documents = {}
+        for row in rows:
+            doc_id = row['rowid'] // PASSAGE_ROWID_STRIDE
+            document = documents.setdefault(doc_id, {
+                'filename': row['filename'],
+                'candidate_name': row['candidate_name'],
+                'passages': []
+            })
+            document['passages'].append(row['content_stem'])
+
+        documents = list(documents.values())
+        counts = None
+        if self.scoring is not None and documents:
+            counts = self.scoring.matched_counts([document['filename'] for document in documents],
+                                                 list(word_stems.values()))
+
+        results = []
+        for i, document in enumerate(documents):
+            if counts is not None and counts[i] >= 0:
+                matched_count = int(counts[i])
+            else:
+                passage_stems = set(' '.join(document['passages']).split())
+                matched_count = sum(1 for stem in word_stems.values() if stem in passage_stems)
+            if matched_count >= 2:
+                results.append({
+                    'filename': document['filename'],
+                    'candidate_name': document['candidate_name'],
+                    'file_path': os.path.join(RESUMES_FOLDER, document['filename']),
+                    'relevance_score': min(matched_count / len(words), 0.6),
+                    'has_exact_match': False,
+                    'matched_words': matched_count
+                })
+        return results
+
     def _fallback_search(self, search_text: str, limit: int = 20):
         """ Резервный поиск по отдельным словам """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
+            unique_words = self._fallback_words(search_text)
+            logger.info(f"🔄 Fallback поиск по словам: {unique_words}")
 
-                words = re.findall(r'\b\w{4,}\b', search_text.lower())
-                stop_words = {'опыт', 'работы', 'работа', 'компания', 'проект'}
-                unique_words = [word for word in set(words) if word not in stop_words]
-
-                if not unique_words:
-                    unique_words = words[:3]
-
-                logger.info(f"🔄 Fallback поиск по словам: {unique_words}")
-
-                all_results = []
-                for word in unique_words[:3]:
-                    cursor.execute('''
-                        SELECT filename, candidate_name, content
-                        FROM pdf_index 
-                        WHERE content LIKE ? 
-                        LIMIT ?
-                    ''', (f'%{word}%', limit))
-
-                    for row in cursor.fetchall():
-                        all_results.append({
-                            'filename': row['filename'],
-                            'candidate_name': row['candidate_name'],
-                            'file_path': os.path.join(RESUMES_FOLDER, row['filename']),
-                            'relevance_score': 0.3,
-                            'has_exact_match': False,
-                            'matched_word': word
-                        })
-
-                seen_files = set()
-                final_results = []
-                for result in all_results:
-                    if result['filename'] not in seen_files:
-                        seen_files.add(result['filename'])
-                        final_results.append(result)
-
-                final_results = final_results[:limit]
-                logger.info(f"🔄 Fallback поиск: найдено {len(final_results)} результатов")
-                return final_results
+            final_results = self._dedupe_results(self._map_shards(self._fallback_shard, unique_words, limit), limit)
+            logger.info(f"🔄 Fallback поиск: найдено {len(final_results)} результатов")
+            return final_results
 
         except Exception as e:
             logger.error(f"❌ Ошибка fallback поиска: {e}")
             return []
 
+    def _fallback_shard(self, db_path: str, unique_words: List[str], limit: int) -> List[dict]:
+        """ Резервный поиск по подстроке в одном шарде """
+        with closing(self._shard_connection(db_path)) as conn:
+            cursor = conn.cursor()
+            all_results = []
+            for word in unique_words[:3]:
+                cursor.execute(SUBSTRING_SEARCH_SQL, (self._quote_fts(word), limit))
+                all_results.extend(self._fallback_rows(cursor.fetchall(), word))
+            return all_results
+
+    def _fallback_words(self, search_text: str) -> List[str]:
+        """ Слова для резервного поиска """
+        words = re.findall(r'\b\w{4,}\b', search_text.lower())
+        stop_words = {'опыт', 'работы', 'работа', 'компания', 'проект'}
+        unique_words = [word for word in set(words) if word not in stop_words]
+
+        if not unique_words:
+            unique_words = words[:3]
+        return unique_words
+
+    def _fallback_rows(self, rows, word: str) -> List[dict]:
+        """ Результаты резервного поиска из строк SQL """
+        return [{
+            'filename': row['filename'],
+            'candidate_name': row['candidate_name'],
+            'file_path': os.path.join(RESUMES_FOLDER, row['filename']),
+            'relevance_score': 0.3,
+            'has_exact_match': False,
+            'matched_word': word
+        } for row in rows]
+
+    def _dedupe_results(self, shard_results: List[List[dict]], limit: int) -> List[dict]:
+        """ Объединение результатов шардов без повторов файлов """
+        seen_files = set()
+        final_results = []
+        for results in shard_results:
+            for result in results:
+                if result['filename'] not in seen_files:
+                    seen_files.add(result['filename'])
+                    final_results.append(result)
+        return final_results[:limit]
+
     def _normalize_search_text(self, text: str) -> str:
         """ Нормализация текста """
         if not text:
@@ -672,53 +1112,85 @@ class OptimizedPDFIndexer:
         if not text:
             return ""
         text = ' '.join(text.split())
-        return text[:20000]
+        return text[:MAX_DOCUMENT_CHARS]
 
     def _get_existing_filenames(self):
         """ Получение списка проиндексированных файлов """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT filename FROM pdf_index")
-        existing_files = {row[0] for row in cursor.fetchall()}
-        conn.close()
+        existing_files = set()
+        for db_path in self.shard_paths:
+            conn = sqlite3.connect(db_path)
+            cursor = conn.cursor()
+            cursor.execute("SELECT filename FROM pdf_index")
+            existing_files.update(row[0] for row in cursor.fetchall())
+            conn.close()
         return existing_files
 
     def get_index_stats(self):
-        """ Статистика индекса """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM pdf_index")
-            total_files = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM pdf_index_fts")
-            total_fts_files = cursor.fetchone()[0]
-            cursor.execute("SELECT SUM(file_size) FROM pdf_index")
-            total_size = cursor.fetchone()[0] or 0
-            db_file_size = os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+        """ Статистика индекса (сумма по шардам) """
+        total_files = total_passages = total_size = db_file_size = 0
+        failures_by_kind = {}
+        for db_path in self.shard_paths:
+            with sqlite3.connect(db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT COUNT(*) FROM pdf_index")
+                total_files += cursor.fetchone()[0]
+                cursor.execute("SELECT COUNT(*) FROM pdf_index_fts")
+                total_passages += cursor.fetchone()[0]
+                cursor.execute("SELECT SUM(file_size) FROM pdf_index")
+                total_size += cursor.fetchone()[0] or 0
+                cursor.execute("SELECT failure_kind, COUNT(*) FROM pdf_index_failures GROUP BY failure_kind")
+                for kind, count in cursor.fetchall():
+                    failures_by_kind[kind] = failures_by_kind.get(kind, 0) + count
+            db_file_size += os.path.getsize(db_path) if os.path.exists(db_path) else 0
 
         return {
             'total_indexed_files': total_files,
-            'total_fts_files': total_fts_files,
+            'total_passages': total_passages,
+            'total_failed_files': sum(failures_by_kind.values()),
+            'failures_by_kind': failures_by_kind,
             'total_size_mb': total_size / (1024 * 1024),
-            'db_size_mb': db_file_size / (1024 * 1024)
+            'db_size_mb': db_file_size / (1024 * 1024),
+            'shards': len(self.shard_paths)
         }
 
     def cleanup_missing_files(self) -> int:
-        """ Очистка отсутствующих файлов """
+        """ Очистка отсутствующих файлов во всех шардах
+
+        Производные индексы не пересобираются: при ненулевом результате
+        вызывающий запускает schedule_derived_refresh() или refresh_derived_indexes().
+        """
+        total_deleted = sum(self._map_shards(self._cleanup_shard))
+        if not total_deleted:
+            logger.info("✅ Отсутствующие файлы не найдены")
+            return 0
+
+        logger.info(f"✅ Удалено {total_deleted} отсутствующих файлов")
+        return total_deleted
+
+    def _cleanup_shard(self, db_path: str) -> int:
+        """ Очистка отсутствующих файлов в одном шарде """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with sqlite3.connect(db_path) as conn:
                 cursor = conn.cursor()
 
-                cursor.execute("SELECT filename FROM pdf_index")
-                indexed_files = [row[0] for row in cursor.fetchall()]
+                cursor.execute("SELECT filename FROM pdf_index_failures")
+                for (filename,) in cursor.fetchall():
+                    if not os.path.exists(os.path.join(RESUMES_FOLDER, filename)):
+                        cursor.execute("DELETE FROM pdf_index_failures WHERE filename = ?", (filename,))
+                conn.commit()
+
+                cursor.execute("SELECT id, filename FROM pdf_index")
+                indexed_files = cursor.fetchall()
 
                 missing_files = []
-                for filename in indexed_files:
+                missing_ids = []
+                for doc_id, filename in indexed_files:
                     filepath = os.path.join(RESUMES_FOLDER, filename)
                     if not os.path.exists(filepath):
                         missing_files.append(filename)
+                        missing_ids.append(doc_id)
 
                 if not missing_files:
-                    logger.info("✅ Отсутствующие файлы не найдены")
                     return 0
 
                 batch_size = 100
@@ -728,13 +1200,11 @@ class OptimizedPDFIndexer:
                     batch = missing_files[i:i + batch_size]
                     placeholders = ','.join('?' for _ in batch)
 
-                    cursor.execute(
-                        f"DELETE FROM pdf_index WHERE filename IN ({placeholders})",
-                        batch
-                    )
+                    for doc_id in missing_ids[i:i + batch_size]:
+                        self._delete_passages(cursor, doc_id)
 
                     cursor.execute(
-                        f"DELETE FROM pdf_index_fts WHERE filename IN ({placeholders})",
+                        f"DELETE FROM pdf_index WHERE filename IN ({placeholders})",
                         batch
                     )
 
@@ -742,7 +1212,6 @@ class OptimizedPDFIndexer:
                     total_deleted += deleted_count
                     conn.commit()
 
-                logger.info(f"✅ Удалено {total_deleted} отсутствующих файлов")
                 return total_deleted
 
         except Exception as e:
@@ -756,6 +1225,20 @@ class OptimizedPDFIndexer:
         if use_cache and cache_key in self._pdf_texts_cache:
             return self._pdf_texts_cache[cache_key]
 
+        result, _ = self._extract_text(pdf_path)
+        if use_cache and result:
+            if len(self._pdf_texts_cache) >= self.max_cache_size:
+                oldest_key = next(iter(self._pdf_texts_cache))
+                del self._pdf_texts_cache[oldest_key]
+            self._pdf_texts_cache[cache_key] = result
+
+        return result
+
+    def _extract_text(self, pdf_path: str) -> Tuple[Optional[str], Optional[str]]:
+        """ Извлечение текста с указанием причины неудачи
+
+        Возвращает (текст, None) или (None, 'extract_error' | 'no_text').
+        """
         text = ""
         filename = os.path.basename(pdf_path)
 
@@ -779,16 +1262,11 @@ class OptimizedPDFIndexer:
 
             except Exception as e2:
                 logger.error(f"❌ Ошибка при извлечении текста из {filename}: {e2}")
-                return None
+                return None, 'extract_error'
 
-        result = text.strip() if text.strip() else None
-        if use_cache and result:
-            if len(self._pdf_texts_cache) >= self.max_cache_size:
-                oldest_key = next(iter(self._pdf_texts_cache))
-                del self._pdf_texts_cache[oldest_key]
-            self._pdf_texts_cache[cache_key] = result
-
-        return result
+        if not text.strip():
+            return None, 'no_text'
+        return text.strip(), None
 
     def clear_cache(self):
         """ Очистка кэша """
@@ -799,16 +1277,25 @@ class OptimizedPDFIndexer:
     def optimize_database(self):
         """ Оптимизация базы данных для производительности """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("PRAGMA optimize")
-                cursor.execute("VACUUM")
-                conn.commit()
+            for db_path in self.shard_paths:
+                with sqlite3.connect(db_path) as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("PRAGMA optimize")
+                    cursor.execute("VACUUM")
+                    conn.commit()
             logger.info("✅ База данных оптимизирована")
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка оптимизации БД: {e}")
             return False
 
+def __getattr__(name):
+    """ Синглтон индексатора создается при первом обращении (from pdf_indexer import pdf_indexer)
 
-pdf_indexer = OptimizedPDFIndexer()
\ No newline at end of file
+    Процессы пула поиска импортируют модуль ради класса и открывают свой
+    индексатор только для чтения - схема и миграции шардов в них не запускаются.
+    """
+    if name == 'pdf_indexer':
+        globals()['pdf_indexer'] = OptimizedPDFIndexer()
+        return globals()['pdf_indexer']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
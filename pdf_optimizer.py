@@ -0,0 +1,271 @@
+import os
+import shutil
+import asyncio
+import sqlite3
+import logging
+import subprocess
+import aiosqlite
+from typing import Dict, Optional, Tuple
+import PyPDF2
+from PyPDF2.generic import StreamObject
+from config import (RESUMES_FOLDER, PDF_INDEX_DB_PATH, OPTIMIZED_RESUMES_FOLDER, PDF_OPTIMIZE_MIN_SIZE_MB,
+                    PDF_OPTIMIZE_MAX_RATIO, PDF_OPTIMIZE_TIMEOUT, PDF_OPTIMIZE_INTERVAL)
+
+logger = logging.getLogger(__name__)
+
+OPTIMIZED_SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS pdf_optimized (
+        filename TEXT PRIMARY KEY,
+        original_mtime REAL NOT NULL,
+        original_size INTEGER NOT NULL,
+        optimized_size INTEGER,
+        ratio REAL,
+        method TEXT NOT NULL,
+        optimized_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# method = 'none': сжатие не дало выигрыша, отправляется оригинал (повторно не пробуем до изменения файла)
+METHOD_NONE = 'none'
+
+# метаданные страниц (XMP, данные приложения-редактора), которые не нужны в копии для отправки
+PAGE_METADATA_KEYS = ('/Metadata', '/PieceInfo')
+
+GHOSTSCRIPT_ARGS = [
+    '-sDEVICE=pdfwrite', '-dCompatibilityLevel=1.5', '-dPDFSETTINGS=/ebook',
+    '-dNOPAUSE', '-dQUIET', '-dBATCH', '-dSAFER',
+    '-dDetectDuplicateImages=true', '-dCompressFonts=true',
+    '-dDownsampleColorImages=true', '-dColorImageResolution=150',
+    '-dDownsampleGrayImages=true', '-dGrayImageResolution=150',
+    '-dDownsampleMonoImages=true', '-dMonoImageResolution=300',
+]
+
+
+class PDFOptimizer:
+    """ Сжатые копии больших резюме для отправки в Telegram
+
+    Копии лежат в OPTIMIZED_RESUMES_FOLDER под тем же именем, в таблице
+    pdf_optimized - размеры и сигнатура оригинала (mtime, размер):
+    если оригинал изменился, копия не используется до пересжатия.
+    Сжатие идет фоновой задачей в потоке (раз в PDF_OPTIMIZE_INTERVAL
+    и по schedule() после загрузки), обработчики его не ждут. Для отправки
+    сигнатуры сжатых копий держатся в памяти (_delivery) и заменяются
+    целиком после каждой записи в таблицу - delivery_path не ходит в базу.
+    """
+
+    def __init__(self, db_path: str = PDF_INDEX_DB_PATH, folder: str = OPTIMIZED_RESUMES_FOLDER,
+                 min_size_mb: float = PDF_OPTIMIZE_MIN_SIZE_MB, max_ratio: float = PDF_OPTIMIZE_MAX_RATIO):
+        self.db_path = db_path
+        self.folder = folder
+        self.min_size = int(min_size_mb * 1024 * 1024)
+        self.max_ratio = max_ratio
+        self.ghostscript = shutil.which('gs')
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._delivery: Dict[str, Tuple[float, int]] = {}
+        self.init_database()
+
+    def init_database(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(OPTIMIZED_SCHEMA_SQL)
+            conn.commit()
+            self._load_delivery(conn)
+
+    def _load_delivery(self, conn: sqlite3.Connection):
+        """ Сигнатуры оригиналов, у которых есть сжатая копия (новый словарь - читатели видят старый или новый) """
+        self._delivery = {
+            row[0]: (row[1], row[2])
+            for row in conn.execute(
+                "SELECT filename, original_mtime, original_size FROM pdf_optimized WHERE method != ?", (METHOD_NONE,)
+            )
+        }
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"🗜 Фоновое сжатие PDF: проверка раз в {PDF_OPTIMIZE_INTERVAL} сек")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def schedule(self):
+        """ Внеочередная проверка (после загрузки файла); вызовы до ее начала склеиваются """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await asyncio.to_thread(self.optimize_pending)
+            except Exception as e:
+                logger.error(f"❌ Ошибка сжатия PDF: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), PDF_OPTIMIZE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def optimize_file(self, source: str, target: str) -> Optional[str]:
+        """ Сжатие source в target; метод ('ghostscript' / 'pypdf2') или None при ошибке """
+        temp_path = f"{target}.tmp"
+        try:
+            method = 'ghostscript' if self.ghostscript else 'pypdf2'
+            if self.ghostscript:
+                self._optimize_ghostscript(source, temp_path)
+            else:
+                self._optimize_pypdf2(source, temp_path)
+            if not self._same_page_count(source, temp_path):
+                logger.warning(f"⚠️ Сжатая копия {os.path.basename(source)} повреждена, используем оригинал")
+                return None
+            os.replace(temp_path, target)
+            return method
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сжать {os.path.basename(source)}: {e}")
+            return None
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _optimize_ghostscript(self, source: str, target: str):
+        """ Пересборка через pdfwrite: сжатие потоков, даунсемплинг изображений, дедупликация
+
+        pdfwrite переносит DocInfo и XMP оригинала, поэтому результат копируется
+        постранично без метаданных (потоки при копировании не пережимаются).
+        """
+        gs_output = f"{target}.gs"
+        try:
+            subprocess.run(
+                [self.ghostscript, *GHOSTSCRIPT_ARGS, f'-sOutputFile={gs_output}', source],
+                check=True, timeout=PDF_OPTIMIZE_TIMEOUT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+            )
+            with open(target, 'wb') as output:
+                self._copy_pages(PyPDF2.PdfReader(gs_output)).write(output)
+        finally:
+            if os.path.exists(gs_output):
+                os.remove(gs_output)
+
+    def _optimize_pypdf2(self, source: str, target: str):
+        """ Без потерь: несжатые потоки (содержимое, изображения) - во Flate, без метаданных документа """
+        writer = self._copy_pages(PyPDF2.PdfReader(source))
+        # замена на месте: ссылки IndirectObject указывают на номер объекта, а не на сам объект
+        for number, obj in enumerate(writer._objects):
+            if isinstance(obj, StreamObject) and '/Filter' not in obj:
+                writer._objects[number] = obj.flate_encode()
+        with open(target, 'wb') as output:
+            writer.write(output)
+
+    def _copy_pages(self, reader: PyPDF2.PdfReader) -> PyPDF2.PdfWriter:
+        """ Новый документ из страниц reader: без DocInfo и XMP документа и страниц """
+        writer = PyPDF2.PdfWriter()
+        for page in reader.pages:
+            for key in PAGE_METADATA_KEYS:
+                if key in page:
+                    del page[key]
+            writer.add_page(page)
+        return writer
+
+    def _same_page_count(self, source: str, target: str) -> bool:
+        return len(PyPDF2.PdfReader(target).pages) == len(PyPDF2.PdfReader(source).pages)
+
+    def _signature(self, path: str) -> Optional[Tuple[float, int]]:
+        try:
+            stat = os.stat(path)
+            return stat.st_mtime, stat.st_size
+        except OSError:
+            return None
+
+    def optimize_pending(self) -> int:
+        """ Сжатие новых и изменённых больших файлов, удаление копий исчезнувших """
+        os.makedirs(self.folder, exist_ok=True)
+        with sqlite3.connect(self.db_path) as conn:
+            records = {
+                row[0]: (row[1], row[2])
+                for row in conn.execute("SELECT filename, original_mtime, original_size FROM pdf_optimized")
+            }
+
+        large_files = {}
+        for entry in os.scandir(RESUMES_FOLDER):
+            if entry.name.lower().endswith('.pdf') and entry.is_file():
+                stat = entry.stat()
+                if stat.st_size >= self.min_size:
+                    large_files[entry.name] = (stat.st_mtime, stat.st_size)
+
+        stale = [filename for filename in records if filename not in large_files]
+        pending = [filename for filename, signature in large_files.items() if records.get(filename) != signature]
+        if not stale and not pending:
+            return 0
+
+        optimized = 0
+        saved = 0
+        rows = []
+        for filename in pending:
+            mtime, size = large_files[filename]
+            target = os.path.join(self.folder, filename)
+            method = self.optimize_file(os.path.join(RESUMES_FOLDER, filename), target)
+            optimized_size = os.path.getsize(target) if method else None
+            if method is None or optimized_size > size * self.max_ratio:
+                # выигрыш мал - храним только отметку, чтобы не пересжимать при каждом запуске
+                if os.path.exists(target):
+                    os.remove(target)
+                rows.append((filename, mtime, size, None, None, METHOD_NONE))
+                continue
+            optimized += 1
+            saved += size - optimized_size
+            rows.append((filename, mtime, size, optimized_size, optimized_size / size, method))
+
+        for filename in stale:
+            target = os.path.join(self.folder, filename)
+            if os.path.exists(target):
+                os.remove(target)
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany("DELETE FROM pdf_optimized WHERE filename = ?", [(filename,) for filename in stale])
+            conn.executemany('''
+                INSERT OR REPLACE INTO pdf_optimized
+                (filename, original_mtime, original_size, optimized_size, ratio, method)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+            self._load_delivery(conn)
+
+        logger.info(f"🗜 Сжато PDF: {optimized} из {len(pending)}, сэкономлено {saved / 1024 / 1024:.1f}MB, "
+                    f"удалено устаревших копий: {len(stale)}")
+        return optimized
+
+    def delivery_path(self, pdf_path: str) -> str:
+        """ Файл для отправки: сжатая копия, если она актуальна, иначе оригинал (без запроса к базе) """
+        filename = os.path.basename(pdf_path)
+        signature = self._delivery.get(filename)
+        if signature is None or self._signature(pdf_path) != signature:
+            return pdf_path
+        optimized_path = os.path.join(self.folder, filename)
+        return optimized_path if os.path.exists(optimized_path) else pdf_path
+
+    async def get_stats_async(self) -> dict:
+        async with aiosqlite.connect(self.db_path) as conn:
+            cursor = await conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(original_size), 0), COALESCE(SUM(optimized_size), 0) "
+                "FROM pdf_optimized WHERE method != ?", (METHOD_NONE,)
+            )
+            files, original_bytes, optimized_bytes = await cursor.fetchone()
+        return {'files': files, 'original_bytes': original_bytes, 'optimized_bytes': optimized_bytes,
+                'saved_bytes': original_bytes - optimized_bytes}
+
+
+def __getattr__(name):
+    """ Синглтон создается при первом обращении (from pdf_optimizer import pdf_optimizer)
+
+    Импорт ради класса (бенчмарки, отдельные скрипты) не создает базу и таблицу
+    pdf_optimized в текущей папке.
+    """
+    if name == 'pdf_optimizer':
+        globals()['pdf_optimizer'] = PDFOptimizer()
+        return globals()['pdf_optimizer']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
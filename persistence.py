@@ -0,0 +1,176 @@
+import os
+import json
+import asyncio
+import logging
+import sqlite3
+from typing import Dict, Optional, Tuple
+import aiosqlite
+from telegram.ext import BasePersistence, PersistenceInput
+from config import PERSISTENCE_DB_PATH, PERSISTENCE_UPDATE_INTERVAL
+from session_store import search_sessions
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS user_data (
+        user_id INTEGER PRIMARY KEY,
+        data TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS conversations (
+        name TEXT NOT NULL,
+        conversation_key TEXT NOT NULL,
+        state TEXT NOT NULL,
+        PRIMARY KEY (name, conversation_key)
+    ) WITHOUT ROWID;
+'''
+
+
+class SQLitePersistence(BasePersistence[Dict, Dict, Dict]):
+    """ Persistence PTB в SQLite: user_data и состояния ConversationHandler
+
+    PTB вызывает update_* раз в update_interval для всех изменившихся
+    пользователей и диалогов; изменения копятся в памяти и записываются
+    одной транзакцией на весь такой проход. Неизменившиеся user_data
+    (та же JSON-строка, что записана в прошлый раз) не пишутся.
+    chat_data, bot_data и callback_data не хранятся.
+    """
+
+    def __init__(self, db_path: str = PERSISTENCE_DB_PATH, update_interval: float = PERSISTENCE_UPDATE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.db_path = db_path
+        self._written: Dict[int, int] = {}
+        self._pending_users: Dict[int, Optional[str]] = {}
+        self._pending_conversations: Dict[Tuple[str, str], Optional[str]] = {}
+        self._write_task: Optional[asyncio.Task] = None
+        self.init_database()
+
+    def init_database(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(PERSISTENCE_SCHEMA_SQL)
+            conn.commit()
+
+    async def get_user_data(self) -> Dict[int, Dict]:
+        """ Загрузка user_data при старте; просроченные сессии поиска отбрасываются """
+        async with aiosqlite.connect(self.db_path) as conn:
+            rows = await conn.execute_fetchall('SELECT user_id, data FROM user_data')
+
+        users = {user_id: json.loads(data) for user_id, data in rows}
+        for user_id in search_sessions.evict(users):
+            if not users[user_id]:
+                del users[user_id]
+                self._pending_users[user_id] = None
+        self._written = {user_id: hash(data) for user_id, data in rows if user_id in users}
+        if self._pending_users:
+            await self._write()
+
+        logger.info(f"💾 Загружены данные {len(users)} пользователей из {self.db_path}")
+        return users
+
+    async def get_conversations(self, name: str) -> Dict[Tuple, object]:
+        async with aiosqlite.connect(self.db_path) as conn:
+            rows = await conn.execute_fetchall(
+                'SELECT conversation_key, state FROM conversations WHERE name = ?', (name,)
+            )
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def update_user_data(self, user_id: int, data: Dict) -> None:
+        serialized = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        if self._written.get(user_id) == hash(serialized):
+            self._pending_users.pop(user_id, None)
+            return
+        self._pending_users[user_id] = serialized
+        await self._write()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._pending_users[user_id] = None
+        await self._write()
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]) -> None:
+        state = None if new_state is None else json.dumps(new_state)
+        self._pending_conversations[(name, json.dumps(list(key)))] = state
+        await self._write()
+
+    async def _write(self):
+        """ Общая запись: вызовы одного прохода update_persistence попадают в одну транзакцию """
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_pending())
+        await asyncio.shield(self._write_task)
+
+    async def _write_pending(self):
+        while self._pending_users or self._pending_conversations:
+            users, self._pending_users = self._pending_users, {}
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            try:
+                async with aiosqlite.connect(self.db_path) as conn:
+                    await conn.execute("PRAGMA synchronous=NORMAL")
+                    await conn.executemany(
+                        'INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)',
+                        [(user_id, data) for user_id, data in users.items() if data is not None]
+                    )
+                    await conn.executemany(
+                        'DELETE FROM user_data WHERE user_id = ?',
+                        [(user_id,) for user_id, data in users.items() if data is None]
+                    )
+                    await conn.executemany(
+                        'INSERT OR REPLACE INTO conversations (name, conversation_key, state) VALUES (?, ?, ?)',
+                        [(name, key, state) for (name, key), state in conversations.items() if state is not None]
+                    )
+                    await conn.executemany(
+                        'DELETE FROM conversations WHERE name = ? AND conversation_key = ?',
+                        [(name, key) for (name, key), state in conversations.items() if state is None]
+                    )
+                    await conn.commit()
+            except Exception:
+                # вернуть в очередь, не затирая более свежие изменения; повтор - на следующем проходе
+                self._pending_users = {**users, **self._pending_users}
+                self._pending_conversations = {**conversations, **self._pending_conversations}
+                raise
+
+            for user_id, data in users.items():
+                if data is None:
+                    self._written.pop(user_id, None)
+                else:
+                    self._written[user_id] = hash(data)
+
+    async def flush(self) -> None:
+        """ Вызывается PTB при остановке после последнего update_persistence """
+        if self._pending_users or self._pending_conversations:
+            await self._write()
+        logger.info("💾 Данные сессий сохранены")
+
+    # chat_data, bot_data и callback_data не хранятся (store_data выше)
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        return {}
+
+    async def get_bot_data(self) -> Dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: Dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict) -> None:
+        pass
@@ -0,0 +1,259 @@
+import os
+import sqlite3
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from config import BM25_K1, BM25_B, BM25_SCORE_FLOOR
+from morphology import stem_tokens
+
+logger = logging.getLogger(__name__)
+
+# ключ документа в матрице: (номер шарда << SHARD_KEY_SHIFT) | id в pdf_index
+SHARD_KEY_SHIFT = 40
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """ Индексы k лучших оценок по убыванию (argpartition + сортировка только k элементов) """
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if scores.size <= k:
+        candidates = np.arange(scores.size)
+    else:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+class ScoringMatrix:
+    """ Разреженная CSR матрица документ-терм (частоты основ слов) для BM25
+
+    Строка - документ pdf_index, столбец - основа слова. Кандидатов поиска
+    оценивает одной векторной операцией вместо подстрочных проверок в Python.
+    """
+
+    def __init__(self, doc_ids: np.ndarray, filenames: List[str], terms: List[str],
+                 indptr: np.ndarray, indices: np.ndarray, data: np.ndarray):
+        self.doc_ids = doc_ids.astype(np.int64)
+        self.filenames = list(filenames)
+        self.terms = list(terms)
+        self.indptr = indptr.astype(np.int64)
+        self.indices = indices.astype(np.int32)
+        self.data = data.astype(np.uint16)
+
+        self.term_columns: Dict[str, int] = {term: column for column, term in enumerate(self.terms)}
+        self.row_of: Dict[str, int] = {filename: row for row, filename in enumerate(self.filenames)}
+
+        row_lengths = np.diff(self.indptr)
+        self.doc_lengths = np.bincount(
+            np.repeat(np.arange(len(self.filenames)), row_lengths),
+            weights=self.data, minlength=len(self.filenames)
+        )
+        self.avg_length = float(self.doc_lengths.mean()) if len(self.filenames) else 0.0
+
+        document_frequency = np.bincount(self.indices, minlength=len(self.terms))
+        total = len(self.filenames)
+        self.idf = np.log(1 + (total - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    @property
+    def nnz(self) -> int:
+        return int(self.indices.size)
+
+    def _gather(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Все ненулевые элементы выбранных строк: (номер кандидата, столбец, частота) """
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        owner = np.repeat(np.arange(rows.size), lengths)
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        positions = np.arange(int(lengths.sum())) + offsets
+        return owner, self.indices[positions], self.data[positions]
+
+    def _rows(self, filenames: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """ Строки матрицы для файлов и маска тех, что есть в матрице """
+        rows = np.array([self.row_of.get(filename, -1) for filename in filenames], dtype=np.int64)
+        known = rows >= 0
+        return rows[known], known
+
+    def _query_columns(self, query_terms: Iterable[str]) -> np.ndarray:
+        return np.array(sorted({self.term_columns[term] for term in query_terms if term in self.term_columns}),
+                        dtype=np.int64)
+
+    def score(self, filenames: List[str], query_terms: List[str]) -> np.ndarray:
+        """ BM25 кандидатов в шкале построчной оценки; NaN - документа нет в матрице
+
+        Документ без терминов запроса - 0, иначе BM25_SCORE_FLOOR + доля до 1.0:
+        BM25 делится на сумму idf терминов запроса (оценка документа средней длины,
+        где каждый термин встречается один раз; термины вне словаря - с наибольшим idf),
+        поэтому частичное совпадение длинного запроса не падает ниже порога отбора.
+        """
+        scores = np.full(len(filenames), np.nan)
+        rows, known = self._rows(filenames)
+        columns = self._query_columns(query_terms)
+        if columns.size == 0 or rows.size == 0:
+            scores[known] = 0.0
+            return scores
+
+        in_query = np.zeros(len(self.terms), dtype=bool)
+        in_query[columns] = True
+        owner, matched_columns, frequency = self._gather(rows)
+        mask = in_query[matched_columns]
+        owner, matched_columns = owner[mask], matched_columns[mask]
+        frequency = frequency[mask].astype(np.float64)
+
+        length_norm = 1 - BM25_B + BM25_B * self.doc_lengths[rows][owner] / max(self.avg_length, 1.0)
+        contribution = self.idf[matched_columns] * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+        raw = np.bincount(owner, weights=contribution, minlength=rows.size)
+
+        reference = self._reference(query_terms, columns)
+        if reference <= 0:
+            scores[known] = 0.0
+            return scores
+        matched = np.bincount(owner, minlength=rows.size) > 0
+        scores[known] = np.where(
+            matched, BM25_SCORE_FLOOR + (1 - BM25_SCORE_FLOOR) * np.minimum(raw / reference, 1.0), 0.0
+        )
+        return scores
+
+    def _unseen_idf(self) -> float:
+        """ idf термина, которого нет ни в одном документе матрицы """
+        return float(np.log(1 + (len(self.filenames) + 0.5) / 0.5))
+
+    def _reference(self, query_terms: Iterable[str], columns: np.ndarray) -> float:
+        unseen = len({term for term in query_terms if term not in self.term_columns})
+        return float(self.idf[columns].sum()) + unseen * self._unseen_idf()
+
+    def score_text(self, content: str, query_terms: List[str]) -> float:
+        """ Оценка документа, которого еще нет в матрице, по его тексту (idf и средняя длина - матрицы) """
+        counts = Counter(stem_tokens(content or ""))
+        reference = self._reference(query_terms, self._query_columns(query_terms))
+        matched = [term for term in set(query_terms) if term in counts]
+        if reference <= 0 or not matched:
+            return 0.0
+
+        length_norm = 1 - BM25_B + BM25_B * sum(min(count, 65535) for count in counts.values()) / max(self.avg_length, 1.0)
+        raw = 0.0
+        for term in matched:
+            column = self.term_columns.get(term)
+            idf = float(self.idf[column]) if column is not None else self._unseen_idf()
+            frequency = min(counts[term], 65535)
+            raw += idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+        return BM25_SCORE_FLOOR + (1 - BM25_SCORE_FLOOR) * min(raw / reference, 1.0)
+
+    def matched_counts(self, filenames: List[str], query_terms: List[str]) -> np.ndarray:
+        """ Сколько разных терминов запроса есть в каждом документе; -1 - документа нет в матрице """
+        counts = np.full(len(filenames), -1, dtype=np.int64)
+        rows, known = self._rows(filenames)
+        columns = self._query_columns(query_terms)
+        if columns.size == 0 or rows.size == 0:
+            counts[known] = 0
+            return counts
+
+        in_query = np.zeros(len(self.terms), dtype=bool)
+        in_query[columns] = True
+        owner, matched_columns, _ = self._gather(rows)
+        counts[known] = np.bincount(owner[in_query[matched_columns]], minlength=rows.size)
+        return counts
+
+    @classmethod
+    def _document_rows(cls, documents, terms: List[str], term_columns: Dict[str, int]):
+        """ Строки CSR для новых документов (словарь дополняется на месте) """
+        doc_ids, filenames, lengths, index_chunks, data_chunks = [], [], [], [], []
+        for doc_id, filename, content in documents:
+            counts = Counter(stem_tokens(content or ""))
+            for term in counts:
+                if term not in term_columns:
+                    term_columns[term] = len(terms)
+                    terms.append(term)
+            doc_ids.append(doc_id)
+            filenames.append(filename)
+            lengths.append(len(counts))
+            index_chunks.append(np.fromiter((term_columns[term] for term in counts), dtype=np.int32, count=len(counts)))
+            data_chunks.append(np.minimum(np.fromiter(counts.values(), dtype=np.int64, count=len(counts)), 65535))
+        return doc_ids, filenames, lengths, index_chunks, data_chunks
+
+    @classmethod
+    def build(cls, db_paths: List[str], previous: Optional['ScoringMatrix'] = None) -> 'ScoringMatrix':
+        """ Построение по pdf_index всех шардов; при наличии previous пересчитываются только изменённые документы
+
+        Ключ документа - (номер шарда << 40) | id. Переиндексированный файл
+        получает новый id, поэтому сравнения ключей достаточно.
+        """
+        current = {}
+        for shard_no, db_path in enumerate(db_paths):
+            with sqlite3.connect(db_path) as conn:
+                for doc_id, filename in conn.execute('SELECT id, filename FROM pdf_index'):
+                    current[(shard_no << SHARD_KEY_SHIFT) | doc_id] = filename
+
+        if previous is not None:
+            keep = np.isin(previous.doc_ids, np.fromiter(current, dtype=np.int64, count=len(current)))
+            new_keys = sorted(set(current) - set(previous.doc_ids.tolist()))
+            if keep.all() and not new_keys:
+                return previous
+            terms = list(previous.terms)
+            term_columns = dict(previous.term_columns)
+        else:
+            new_keys = sorted(current)
+            terms, term_columns = [], {}
+
+        def new_documents():
+            by_shard = {}
+            for key in new_keys:
+                by_shard.setdefault(key >> SHARD_KEY_SHIFT, []).append(key & ((1 << SHARD_KEY_SHIFT) - 1))
+            for shard_no, doc_ids in by_shard.items():
+                with sqlite3.connect(db_paths[shard_no]) as conn:
+                    for i in range(0, len(doc_ids), 500):
+                        batch = doc_ids[i:i + 500]
+                        placeholders = ','.join('?' for _ in batch)
+                        for doc_id, filename, content in conn.execute(
+                                f'SELECT id, filename, content FROM pdf_index WHERE id IN ({placeholders})', batch):
+                            yield (shard_no << SHARD_KEY_SHIFT) | doc_id, filename, content
+
+        doc_ids, filenames, lengths, index_chunks, data_chunks = cls._document_rows(
+            new_documents(), terms, term_columns
+        )
+
+        if previous is not None:
+            kept_rows = np.flatnonzero(keep)
+            _, kept_indices, kept_data = previous._gather(kept_rows)
+            kept_lengths = previous.indptr[kept_rows + 1] - previous.indptr[kept_rows]
+            doc_ids = previous.doc_ids[kept_rows].tolist() + doc_ids
+            filenames = [previous.filenames[row] for row in kept_rows.tolist()] + filenames
+            lengths = kept_lengths.tolist() + lengths
+            index_chunks.insert(0, kept_indices)
+            data_chunks.insert(0, kept_data)
+
+        indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(lengths)
+        indices = np.concatenate(index_chunks) if index_chunks else np.empty(0, dtype=np.int32)
+        data = np.concatenate(data_chunks) if data_chunks else np.empty(0, dtype=np.uint16)
+
+        return cls(np.array(doc_ids, dtype=np.int64), filenames, terms, indptr, indices, data)
+
+    def save(self, path: str):
+        """ Атомарное сохранение в .npz """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as handle:
+            np.savez(
+                handle,
+                doc_ids=self.doc_ids,
+                filenames=np.array(self.filenames, dtype=str),
+                terms=np.array(self.terms, dtype=str),
+                indptr=self.indptr,
+                indices=self.indices,
+                data=self.data
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['ScoringMatrix']:
+        """ Загрузка сохраненной матрицы (None, если файла нет или он поврежден) """
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as stored:
+                return cls(
+                    stored['doc_ids'], stored['filenames'].tolist(), stored['terms'].tolist(),
+                    stored['indptr'], stored['indices'], stored['data']
+                )
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️ Не удалось загрузить матрицу оценок {path}: {e}")
+            return None
@@ -0,0 +1,206 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+from config import (SEARCH_CONCURRENCY, SEARCH_CONCURRENCY_MIN, SEARCH_CONCURRENCY_MAX, SEARCH_TARGET_P95,
+                    SEARCH_MAX_QUEUE, SEARCH_USER_BURST, SEARCH_USER_RATE_PER_MINUTE, SEARCH_QUEUE_TIMEOUT)
+from adaptive_limit import AIMDLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class SearchRateLimited(Exception):
+    """ Пользователь исчерпал запас запросов (token bucket) """
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class SearchBusy(Exception):
+    """ Очередь поиска переполнена или ожидание слишком долгое """
+
+
+class TokenBucket:
+    """ Запас запросов пользователя: burst штук, пополнение rate в секунду """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """ 0 - токен взят, иначе сколько секунд ждать следующего """
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def delay(self) -> float:
+        """ Сколько секунд до появления токена (без списания) """
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.burst
+
+
+class SearchTicket:
+    """ Заявка на поиск: место в очереди или выданный слот """
+
+    def __init__(self, user_id: Optional[int], tag: float, seq: int):
+        self.user_id = user_id
+        self.tag = tag
+        self.seq = seq
+        self.started = asyncio.get_running_loop().create_future()
+        self.started_at: Optional[float] = None
+        self.cancelled = False
+        self.released = False
+
+    def __lt__(self, other: 'SearchTicket') -> bool:
+        return (self.tag, self.seq) < (other.tag, other.seq)
+
+    @property
+    def is_running(self) -> bool:
+        return self.started.done()
+
+
+class SearchScheduler:
+    """ Допуск к поиску: token bucket на пользователя + справедливая очередь между пользователями
+
+    Очередь - start-time fair queuing: заявка получает метку
+    max(виртуальное время, конец предыдущей заявки пользователя) + 1/вес,
+    поэтому пользователь с пачкой запросов не отодвигает остальных.
+    Число одновременных поисков задает AIMDLimiter по наблюдаемой задержке.
+    """
+
+    def __init__(self, capacity: int = SEARCH_CONCURRENCY, max_queue: int = SEARCH_MAX_QUEUE,
+                 rate_per_minute: float = SEARCH_USER_RATE_PER_MINUTE, burst: int = SEARCH_USER_BURST):
+        self.limiter = AIMDLimiter(
+            initial=capacity,
+            minimum=min(SEARCH_CONCURRENCY_MIN, capacity),
+            maximum=max(SEARCH_CONCURRENCY_MAX, capacity),
+            target_p95=SEARCH_TARGET_P95
+        )
+        self.max_queue = max_queue
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.running = 0
+        self._queue: List[SearchTicket] = []
+        self._queued = 0
+        self._virtual_time = 0.0
+        self._last_finish: Dict[int, float] = {}
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._seq = itertools.count()
+
+    @property
+    def capacity(self) -> int:
+        return self.limiter.limit
+
+    def admit(self, user_id: Optional[int], weight: float = 1.0) -> SearchTicket:
+        """ Заявка на поиск; SearchRateLimited / SearchBusy - отказ без постановки в очередь
+
+        user_id = None - внутренний поиск без лимита запросов.
+        """
+        if self._queued >= self.max_queue:
+            raise SearchBusy()
+        if user_id is not None:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+            retry_after = bucket.take()
+            if retry_after:
+                raise SearchRateLimited(retry_after)
+
+        tag = max(self._virtual_time, self._last_finish.get(user_id, 0.0))
+        self._last_finish[user_id] = tag + 1 / weight
+        ticket = SearchTicket(user_id, tag, next(self._seq))
+        heapq.heappush(self._queue, ticket)
+        self._queued += 1
+        self._dispatch()
+        self._cleanup_idle()
+        return ticket
+
+    def position(self, ticket: SearchTicket) -> int:
+        """ Место в очереди (0 - поиск уже выполняется) """
+        if ticket.is_running:
+            return 0
+        return 1 + sum(1 for other in self._queue if not other.cancelled and other < ticket)
+
+    async def wait(self, ticket: SearchTicket, timeout: float = SEARCH_QUEUE_TIMEOUT):
+        """ Ожидание слота; SearchBusy, если очередь не подошла за timeout """
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.started), timeout)
+        except asyncio.TimeoutError:
+            raise SearchBusy()
+
+    @asynccontextmanager
+    async def slot(self):
+        """ Слот для внутреннего поиска (без пользователя и token bucket) """
+        ticket = self.admit(None)
+        failed = False
+        try:
+            await self.wait(ticket)
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(ticket, failed=failed)
+
+    def release(self, ticket: SearchTicket, failed: bool = False, observed: bool = True):
+        """ Освобождение слота или отмена заявки из очереди (вызывать всегда, в finally)
+
+        observed = False - слот не выполнял свой поиск (присоединился к такому же),
+        задержка и ошибка в адаптивный лимит не передаются.
+        """
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.is_running:
+            self.running -= 1
+            if observed:
+                self.limiter.on_finish(time.monotonic() - ticket.started_at, failed=failed)
+        else:
+            ticket.cancelled = True
+            self._queued -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """ Выдача свободных слотов заявкам с наименьшей меткой """
+        while self.running < self.capacity and self._queue:
+            ticket = heapq.heappop(self._queue)
+            if ticket.cancelled:
+                continue
+            self._queued -= 1
+            self.running += 1
+            self._virtual_time = max(self._virtual_time, ticket.tag)
+            ticket.started_at = time.monotonic()
+            self.limiter.on_start(self.running)
+            ticket.started.set_result(True)
+
+    def _cleanup_idle(self):
+        """ Забываем пользователей с полным запасом и без заявок в очереди """
+        if len(self._buckets) < 1000:
+            return
+        for user_id in [uid for uid, bucket in self._buckets.items() if bucket.is_full()]:
+            if self._last_finish.get(user_id, 0.0) <= self._virtual_time:
+                del self._buckets[user_id]
+                self._last_finish.pop(user_id, None)
+
+    def get_stats(self) -> dict:
+        return {'running': self.running, 'queued': self._queued, **self.limiter.get_stats()}
+
+
+search_scheduler = SearchScheduler()
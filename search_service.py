@@ -0,0 +1,115 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+from config import SEARCH_WORKERS, PDF_SEARCH_TIMEOUT
+from single_flight import SingleFlight, normalize_query
+
+logger = logging.getLogger(__name__)
+
+# уровни обслуживания поиска: присоединен к такому же выполняющемуся, пул процессов, поток
+TIER_SHARED = 'shared'
+TIER_POOL = 'pool'
+TIER_THREAD = 'thread'
+
+# поля результата, которые нужны только для ранжирования и не передаются обратно в бот
+HEAVY_RESULT_FIELDS = ('content', 'content_stem')
+
+
+# индексатор процесса пула: только чтение шардов, снапшота и матрицы оценок
+_worker_indexer = None
+
+
+def _init_worker():
+    """ Прогрев процесса: свои соединения, матрица оценок и кэши; схему и миграции ведет процесс бота """
+    global _worker_indexer
+    from pdf_indexer import OptimizedPDFIndexer
+    _worker_indexer = OptimizedPDFIndexer(read_only=True)
+    logger.info(f"🔧 Поисковый процесс {os.getpid()} готов")
+
+
+def _search(search_text: str, limit: int) -> List[dict]:
+    """ Поиск внутри процесса пула (или в потоке при SEARCH_WORKERS = 0) """
+    if _worker_indexer is not None:
+        indexer = _worker_indexer
+    else:
+        from pdf_indexer import pdf_indexer as indexer
+    indexer.reload_scoring_matrix()
+    results = indexer.search_indexed_pdf(search_text, limit=limit)
+    return [
+        {key: value for key, value in result.items() if key not in HEAVY_RESULT_FIELDS}
+        for result in results
+    ]
+
+
+class SearchService:
+    """ Пул поисковых процессов: ранжирование не конкурирует с циклом событий бота за GIL """
+
+    def __init__(self, workers: int = SEARCH_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._single_flight = SingleFlight('search_service')
+
+    def start(self):
+        """ Запуск пула (spawn - без копирования потоков и соединений родителя) """
+        if self.workers <= 0 or self._executor is not None:
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+        for _ in range(self.workers):
+            self._executor.submit(os.getpid)
+        logger.info(f"🚀 Запущен пул поиска: {self.workers} процессов")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("🛑 Пул поиска остановлен")
+
+    async def search(self, search_text: str, limit: int = 20) -> List[dict]:
+        """ Поиск; одинаковые одновременные запросы выполняются один раз """
+        results, _ = await self.search_with_tier(search_text, limit)
+        return results
+
+    def is_running(self, search_text: str, limit: int = 20) -> bool:
+        """ Выполняется ли такой же поиск (новый вызов присоединится к нему без своего поиска) """
+        return self._single_flight.is_running((normalize_query(search_text), limit))
+
+    async def search_with_tier(self, search_text: str, limit: int = 20) -> Tuple[List[dict], str]:
+        """ Поиск и уровень, который его обслужил (для журнала аналитики) """
+        key = (normalize_query(search_text), limit)
+        if self._single_flight.is_running(key):
+            tier = TIER_SHARED
+        else:
+            tier = TIER_POOL if self._executor is not None else TIER_THREAD
+        results = await self._single_flight.do(key, lambda: self._run_search(search_text, limit))
+        return results, tier
+
+    async def _run_search(self, search_text: str, limit: int) -> List[dict]:
+        """ Поиск в пуле процессов; без пула - в потоке, чтобы не блокировать цикл событий """
+        loop = asyncio.get_running_loop()
+        if self._executor is None:
+            return await asyncio.wait_for(
+                loop.run_in_executor(None, _search, search_text, limit), PDF_SEARCH_TIMEOUT
+            )
+
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, _search, search_text, limit), PDF_SEARCH_TIMEOUT
+            )
+        except BrokenProcessPool:
+            logger.error("❌ Пул поиска аварийно завершился, перезапуск")
+            self._executor = None
+            self.start()
+            return await asyncio.wait_for(
+                loop.run_in_executor(None, _search, search_text, limit), PDF_SEARCH_TIMEOUT
+            )
+
+
+search_service = SearchService()
@@ -0,0 +1,479 @@
+import os
+import json
+import mmap
+import time
+import heapq
+import shutil
+import struct
+import sqlite3
+import logging
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from config import SEARCH_SNAPSHOT_CHUNK_TOKENS
+from morphology import stem_tokens
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAGIC = b'RSNP'
+SEGMENT_VERSION = 1
+# magic, версия, число термов, число документов, число позиций, 6 смещений секций
+SEGMENT_HEADER = struct.Struct('<4sIIIQ6Q')
+MANIFEST_NAME = 'manifest.json'
+# замененный сегмент закрывается не раньше, чем через столько секунд (дочитывают начатые поиски)
+SEGMENT_CLOSE_DELAY = 60
+
+CHANGES_SQL = 'SELECT seq, filename FROM pdf_index_changes WHERE seq > ? ORDER BY seq'
+
+
+def _align(handle, alignment: int = 8) -> int:
+    """ Выравнивание позиции записи """
+    position = handle.tell()
+    padding = (-position) % alignment
+    if padding:
+        handle.write(b'\0' * padding)
+    return position + padding
+
+
+def _write_run(directory: str, run_no: int, vocabulary: Dict[str, int], term_chunks, doc_chunks,
+               position_chunks) -> str:
+    """ Порция документов на диск: термы по алфавиту, их postings отсортированы по (doc, позиция)
+
+    Внутри порции документы и позиции уже идут по возрастанию, поэтому
+    достаточно устойчивой сортировки по номеру терма.
+    """
+    terms = sorted(vocabulary)
+    remap = np.empty(len(vocabulary), dtype=np.uint32)
+    for term_id, term in enumerate(terms):
+        remap[vocabulary[term]] = term_id
+
+    term_ids = remap[np.concatenate(term_chunks)]
+    order = np.argsort(term_ids, kind='stable')
+    run_path = os.path.join(directory, f'run-{run_no}')
+    os.makedirs(run_path)
+    np.save(os.path.join(run_path, 'docs.npy'), np.concatenate(doc_chunks)[order])
+    np.save(os.path.join(run_path, 'positions.npy'), np.concatenate(position_chunks)[order])
+    np.save(os.path.join(run_path, 'counts.npy'), np.bincount(term_ids, minlength=len(terms)).astype(np.uint64))
+    with open(os.path.join(run_path, 'terms.json'), 'w', encoding='utf-8') as handle:
+        json.dump(terms, handle, ensure_ascii=False)
+    return run_path
+
+
+class _Run:
+    """ Чтение порции при слиянии: текущий терм и его postings (массивы - mmap) """
+
+    def __init__(self, run_path: str):
+        with open(os.path.join(run_path, 'terms.json'), encoding='utf-8') as handle:
+            self.terms = json.load(handle)
+        counts = np.load(os.path.join(run_path, 'counts.npy'))
+        self.starts = np.zeros(len(counts) + 1, dtype=np.int64)
+        self.starts[1:] = np.cumsum(counts)
+        self.docs = np.load(os.path.join(run_path, 'docs.npy'), mmap_mode='r')
+        self.positions = np.load(os.path.join(run_path, 'positions.npy'), mmap_mode='r')
+        self.index = 0
+
+    def postings(self) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.starts[self.index], self.starts[self.index + 1]
+        return self.docs[start:end], self.positions[start:end]
+
+
+def write_segment(path: str, documents: Iterable[Tuple[str, str, str]],
+                  chunk_tokens: int = SEARCH_SNAPSHOT_CHUNK_TOKENS) -> int:
+    """ Запись сегмента: отсортированный словарь термов + массивы doc/позиций
+
+    documents - (filename, candidate_name, content). Возвращает число документов.
+    Документы разбираются порциями по chunk_tokens позиций; каждая порция
+    сортируется и пишется на диск, затем порции сливаются по термам -
+    в памяти одна порция, а не все позиции корпуса.
+    """
+    doc_table = []
+    directory = os.path.dirname(path) or '.'
+    with tempfile.TemporaryDirectory(prefix='segment-', dir=directory) as work_dir:
+        run_paths = []
+        vocabulary: Dict[str, int] = {}
+        term_chunks, doc_chunks, position_chunks = [], [], []
+        chunk_size = 0
+
+        for filename, candidate_name, content in documents:
+            doc_no = len(doc_table)
+            doc_table.append([filename, candidate_name])
+            tokens = stem_tokens(content or "")
+            if not tokens:
+                continue
+            term_chunks.append(np.fromiter(
+                (vocabulary.setdefault(token, len(vocabulary)) for token in tokens),
+                dtype=np.uint32, count=len(tokens)
+            ))
+            doc_chunks.append(np.full(len(tokens), doc_no, dtype=np.uint32))
+            position_chunks.append(np.arange(len(tokens), dtype=np.uint32))
+            chunk_size += len(tokens)
+            if chunk_size >= chunk_tokens:
+                run_paths.append(_write_run(work_dir, len(run_paths), vocabulary, term_chunks, doc_chunks,
+                                            position_chunks))
+                vocabulary, term_chunks, doc_chunks, position_chunks, chunk_size = {}, [], [], [], 0
+        if term_chunks:
+            run_paths.append(_write_run(work_dir, len(run_paths), vocabulary, term_chunks, doc_chunks,
+                                        position_chunks))
+        del vocabulary, term_chunks, doc_chunks, position_chunks
+
+        n_terms, n_postings = _merge_runs(work_dir, [_Run(run_path) for run_path in run_paths])
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as handle:
+            handle.write(b'\0' * SEGMENT_HEADER.size)
+            offsets = []
+            for section in ('term_offsets', 'terms', 'posting_offsets', 'docs', 'positions'):
+                offsets.append(_align(handle))
+                with open(os.path.join(work_dir, section), 'rb') as source:
+                    shutil.copyfileobj(source, handle, 1024 * 1024)
+            offsets.append(_align(handle))
+            handle.write(json.dumps(doc_table, ensure_ascii=False).encode('utf-8'))
+            handle.seek(0)
+            handle.write(SEGMENT_HEADER.pack(
+                SEGMENT_MAGIC, SEGMENT_VERSION, n_terms, len(doc_table), n_postings, *offsets
+            ))
+            handle.flush()
+            os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+    return len(doc_table)
+
+
+def _merge_runs(work_dir: str, runs: List[_Run]) -> Tuple[int, int]:
+    """ Слияние порций по термам в файлы секций сегмента; возвращает (число термов, число позиций)
+
+    Номера документов порций растут, поэтому postings терма - это просто
+    postings из порций по порядку.
+    """
+    heap = [(run.terms[0], run_no) for run_no, run in enumerate(runs) if run.terms]
+    heapq.heapify(heap)
+    n_terms = n_postings = term_bytes = 0
+
+    files = {name: open(os.path.join(work_dir, name), 'wb')
+             for name in ('term_offsets', 'terms', 'posting_offsets', 'docs', 'positions')}
+    try:
+        files['term_offsets'].write(struct.pack('<Q', 0))
+        files['posting_offsets'].write(struct.pack('<Q', 0))
+        while heap:
+            term = heap[0][0]
+            while heap and heap[0][0] == term:
+                _, run_no = heapq.heappop(heap)
+                run = runs[run_no]
+                docs, positions = run.postings()
+                files['docs'].write(docs.astype('<u4').tobytes())
+                files['positions'].write(positions.astype('<u4').tobytes())
+                n_postings += len(docs)
+                run.index += 1
+                if run.index < len(run.terms):
+                    heapq.heappush(heap, (run.terms[run.index], run_no))
+
+            encoded = term.encode('utf-8')
+            files['terms'].write(encoded)
+            term_bytes += len(encoded)
+            files['term_offsets'].write(struct.pack('<Q', term_bytes))
+            files['posting_offsets'].write(struct.pack('<Q', n_postings))
+            n_terms += 1
+    finally:
+        for handle in files.values():
+            handle.close()
+    return n_terms, n_postings
+
+
+class SnapshotSegment:
+    """ Сегмент снапшота, отображенный в память (страницы общие для всех процессов) """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as handle:
+            stat = os.fstat(handle.fileno())
+            # сегмент с тем же именем может быть пересобран (rebuild без манифеста) - сверяем и файл
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n_terms, n_docs, n_postings, *offsets = SEGMENT_HEADER.unpack_from(self._buffer, 0)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            raise ValueError(f"Неизвестный формат сегмента: {path}")
+
+        self.n_terms = n_terms
+        self._term_offsets = np.frombuffer(self._buffer, dtype='<u8', count=n_terms + 1, offset=offsets[0])
+        self._term_blob_offset = offsets[1]
+        self._posting_offsets = np.frombuffer(self._buffer, dtype='<u8', count=n_terms + 1, offset=offsets[2])
+        if n_postings:
+            self._docs = np.frombuffer(self._buffer, dtype='<u4', count=n_postings, offset=offsets[3])
+            self._positions = np.frombuffer(self._buffer, dtype='<u4', count=n_postings, offset=offsets[4])
+        else:
+            self._docs = self._positions = np.empty(0, dtype='<u4')
+        self.documents: List[List[str]] = json.loads(self._buffer[offsets[5]:].decode('utf-8'))
+
+    def close(self):
+        """ Освобождение отображения; если массивы сегмента еще где-то читаются - его освободит GC """
+        self._term_offsets = self._posting_offsets = self._docs = self._positions = None
+        try:
+            self._buffer.close()
+        except BufferError:
+            pass
+
+    def _term_bytes(self, term_id: int) -> bytes:
+        start = self._term_blob_offset + int(self._term_offsets[term_id])
+        end = self._term_blob_offset + int(self._term_offsets[term_id + 1])
+        return self._buffer[start:end]
+
+    def _find_term(self, term: str) -> Optional[int]:
+        """ Двоичный поиск по отсортированному словарю прямо в mmap """
+        target = term.encode('utf-8')
+        low, high = 0, self.n_terms
+        while low < high:
+            middle = (low + high) // 2
+            if self._term_bytes(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.n_terms and self._term_bytes(low) == target:
+            return low
+        return None
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """ Документы и позиции терма (отсортированы по doc, pos) """
+        term_id = self._find_term(term)
+        if term_id is None:
+            return None
+        start, end = int(self._posting_offsets[term_id]), int(self._posting_offsets[term_id + 1])
+        return self._docs[start:end], self._positions[start:end]
+
+    def term_docs(self, term: str) -> np.ndarray:
+        """ Документы, содержащие терм """
+        postings = self.postings(term)
+        if postings is None:
+            return np.empty(0, dtype=np.uint32)
+        return np.unique(postings[0])
+
+    def phrase_docs(self, terms: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """ Документы с фразой (термы подряд) и число вхождений """
+        keys = None
+        for offset, term in enumerate(terms):
+            postings = self.postings(term)
+            if postings is None:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+            docs, positions = postings
+            # ключ (doc, позиция начала фразы) в одном int64
+            term_keys = (docs.astype(np.int64) << 32) + positions.astype(np.int64) - offset
+            keys = term_keys if keys is None else np.intersect1d(keys, term_keys, assume_unique=True)
+            if keys.size == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        if keys is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.unique(keys >> 32, return_counts=True)
+
+
+class SearchSnapshot:
+    """ Только-чтение: базовый сегмент + дельта, описанные manifest.json """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._segments: List[Tuple[SnapshotSegment, Set[str]]] = []
+        self._retired: List[Tuple[float, SnapshotSegment]] = []
+        self._manifest_mtime = None
+        self._last_check = 0.0
+
+    def _open_segment(self, name: str) -> SnapshotSegment:
+        """ Уже открытый сегмент, если файл не менялся (базовый переживает смену дельты), иначе новый """
+        path = os.path.join(self.directory, name)
+        stat = os.stat(path)
+        for segment, _ in self._segments:
+            if segment.path == path and segment.identity == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+                return segment
+        return SnapshotSegment(path)
+
+    def _replace_segments(self, segments: List[Tuple[SnapshotSegment, Set[str]]], now: float):
+        """ Подмена набора сегментов; вышедшие из него закрываются после SEGMENT_CLOSE_DELAY """
+        kept = {id(segment) for segment, _ in segments}
+        self._retired.extend((now, segment) for segment, _ in self._segments if id(segment) not in kept)
+        self._segments = segments
+
+    def _close_retired(self, now: float):
+        still_open = []
+        for retired_at, segment in self._retired:
+            if now - retired_at >= SEGMENT_CLOSE_DELAY:
+                segment.close()
+            else:
+                still_open.append((retired_at, segment))
+        self._retired = still_open
+
+    def _reload_if_changed(self):
+        """ Перечитывает manifest не чаще раза в секунду """
+        now = time.monotonic()
+        if now - self._last_check < 1.0:
+            return
+        with self._lock:
+            self._last_check = now
+            self._close_retired(now)
+            manifest_path = os.path.join(self.directory, MANIFEST_NAME)
+            try:
+                mtime = os.stat(manifest_path).st_mtime_ns
+            except FileNotFoundError:
+                self._replace_segments([], now)
+                self._manifest_mtime = None
+                return
+            if mtime == self._manifest_mtime:
+                return
+
+            try:
+                with open(manifest_path, encoding='utf-8') as handle:
+                    manifest = json.load(handle)
+                segments = [(self._open_segment(manifest['base']), set(manifest['tombstones']))]
+                if manifest.get('delta'):
+                    segments.append((self._open_segment(manifest['delta']), set()))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"⚠️ Не удалось загрузить снапшот поиска: {e}")
+                return
+
+            self._replace_segments(segments, now)
+            self._manifest_mtime = mtime
+            logger.info(f"📦 Загружен снапшот поиска (поколение {manifest.get('generation')})")
+
+    def is_ready(self) -> bool:
+        self._reload_if_changed()
+        return bool(self._segments)
+
+    def phrase_matches(self, terms: List[str]) -> Dict[str, Tuple[str, int]]:
+        """ filename -> (candidate_name, число вхождений фразы) """
+        self._reload_if_changed()
+        matches = {}
+        for segment, tombstones in self._segments:
+            docs, counts = segment.phrase_docs(terms)
+            for doc_no, count in zip(docs.tolist(), counts.tolist()):
+                filename, candidate_name = segment.documents[doc_no]
+                if filename not in tombstones:
+                    matches[filename] = (candidate_name, count)
+        return matches
+
+    def term_matches(self, term: str) -> Dict[str, str]:
+        """ filename -> candidate_name для документов с термом """
+        self._reload_if_changed()
+        matches = {}
+        for segment, tombstones in self._segments:
+            for doc_no in segment.term_docs(term).tolist():
+                filename, candidate_name = segment.documents[doc_no]
+                if filename not in tombstones:
+                    matches[filename] = candidate_name
+        return matches
+
+
+class SnapshotBuilder:
+    """ Построение и инкрементальное обновление снапшота по журналу pdf_index_changes """
+
+    def __init__(self, directory: str, db_paths: List[str], delta_ratio: float = 0.1):
+        self.directory = directory
+        self.db_paths = db_paths
+        self.delta_ratio = delta_ratio
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def _load_manifest(self) -> Optional[dict]:
+        try:
+            with open(self._manifest_path(), encoding='utf-8') as handle:
+                manifest = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        if set(manifest.get('seq', {})) != set(self.db_paths):
+            return None
+        return manifest
+
+    def _save_manifest(self, manifest: dict):
+        tmp_path = self._manifest_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump(manifest, handle, ensure_ascii=False)
+        os.replace(tmp_path, self._manifest_path())
+
+        referenced = {manifest['base'], manifest.get('delta')}
+        for name in os.listdir(self.directory):
+            if name.endswith('.seg') and name not in referenced:
+                os.remove(os.path.join(self.directory, name))
+
+        for db_path, seq in manifest['seq'].items():
+            with sqlite3.connect(db_path) as conn:
+                conn.execute('DELETE FROM pdf_index_changes WHERE seq <= ?', (seq,))
+                conn.commit()
+
+    def _current_seq(self) -> Dict[str, int]:
+        seq = {}
+        for db_path in self.db_paths:
+            with sqlite3.connect(db_path) as conn:
+                seq[db_path] = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM pdf_index_changes').fetchone()[0]
+        return seq
+
+    def _documents(self, filenames: Optional[Set[str]] = None):
+        """ Документы из всех баз индекса (все или только указанные) """
+        for db_path in self.db_paths:
+            with sqlite3.connect(db_path) as conn:
+                if filenames is None:
+                    yield from conn.execute('SELECT filename, candidate_name, content FROM pdf_index')
+                    continue
+                names = list(filenames)
+                for i in range(0, len(names), 500):
+                    batch = names[i:i + 500]
+                    placeholders = ','.join('?' for _ in batch)
+                    yield from conn.execute(
+                        f'SELECT filename, candidate_name, content FROM pdf_index WHERE filename IN ({placeholders})',
+                        batch
+                    )
+
+    def rebuild(self, generation: int = 0) -> dict:
+        """ Полная пересборка базового сегмента """
+        seq = self._current_seq()
+        base_name = f'base-{generation}.seg'
+        base_docs = write_segment(os.path.join(self.directory, base_name), self._documents())
+        manifest = {
+            'generation': generation,
+            'base': base_name,
+            'base_docs': base_docs,
+            'delta': None,
+            'delta_files': [],
+            'tombstones': [],
+            'seq': seq
+        }
+        self._save_manifest(manifest)
+        logger.info(f"📦 Снапшот поиска пересобран: {base_docs} документов")
+        return manifest
+
+    def refresh(self) -> str:
+        """ Обновление после записи в индекс: 'full', 'delta' или 'noop' """
+        with self._lock:
+            manifest = self._load_manifest()
+            if manifest is None:
+                self.rebuild()
+                return 'full'
+
+            new_seq = {}
+            changed = set()
+            for db_path in self.db_paths:
+                with sqlite3.connect(db_path) as conn:
+                    rows = conn.execute(CHANGES_SQL, (manifest['seq'][db_path],)).fetchall()
+                new_seq[db_path] = rows[-1][0] if rows else manifest['seq'][db_path]
+                changed.update(filename for _, filename in rows)
+
+            if not changed:
+                return 'noop'
+
+            generation = manifest['generation'] + 1
+            delta_files = set(manifest['delta_files']) | changed
+            if len(delta_files) > self.delta_ratio * max(manifest['base_docs'], 1):
+                self.rebuild(generation)
+                return 'full'
+
+            delta_name = f'delta-{generation}.seg'
+            write_segment(os.path.join(self.directory, delta_name), self._documents(delta_files))
+            manifest.update({
+                'generation': generation,
+                'delta': delta_name,
+                'delta_files': sorted(delta_files),
+                'tombstones': sorted(set(manifest['tombstones']) | changed),
+                'seq': new_seq
+            })
+            self._save_manifest(manifest)
+            logger.info(f"📦 Снапшот поиска обновлен: {len(changed)} изменённых документов")
+            return 'delta'
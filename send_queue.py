@@ -0,0 +1,232 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from telegram.error import RetryAfter, TimedOut
+from config import (SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_WORKERS, SEND_MAX_RETRIES)
+from search_scheduler import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_SEARCH = 0
+PRIORITY_ADMIN = 1
+PRIORITY_BULK = 2
+
+
+class OutboundJob:
+    """ Отправка в Telegram: фабрика корутины (вызывается заново при повторе) и ожидающий результат """
+
+    def __init__(self, chat_id: int, factory: Callable[[], Awaitable[Any]], priority: int, seq: int,
+                 max_retries: int, idempotent: bool):
+        self.chat_id = chat_id
+        self.factory = factory
+        self.priority = priority
+        self.seq = seq
+        self.max_retries = max_retries
+        self.idempotent = idempotent
+        self.attempts = 0
+        self.future = asyncio.get_running_loop().create_future()
+
+    def __lt__(self, other: 'OutboundJob') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundDispatcher:
+    """ Единая очередь исходящих сообщений с учетом лимитов Telegram
+
+    - глобальный token bucket (SEND_GLOBAL_RATE в секунду) и отдельный на каждый чат;
+    - приоритеты: результаты поиска > админские > массовые рассылки;
+    - разные чаты отправляются параллельно, один чат - строго по очереди;
+    - RetryAfter приостанавливает чат на указанное время: задание возвращается в очередь
+      на свое место, обработчик тем временем отправляет в другие чаты;
+    - TimedOut повторяется (с нарастающей паузой чата) только для idempotent-заданий:
+      запрос мог дойти до Telegram, и повтор send_document/send_message даст дубль.
+    """
+
+    def __init__(self, workers: int = SEND_WORKERS):
+        self.workers = workers
+        self._queue: List[OutboundJob] = []
+        self._seq = itertools.count()
+        self._condition: Optional[asyncio.Condition] = None
+        self._tasks: List[asyncio.Task] = []
+        self._global = TokenBucket(SEND_GLOBAL_RATE, SEND_GLOBAL_RATE)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._chat_blocked_until: Dict[int, float] = {}
+        self._busy_chats: Set[int] = set()
+        self._last_cleanup = 0.0
+        self.sent = 0
+        self.flood_waits = 0
+
+    def start(self):
+        if self._tasks:
+            return
+        self._condition = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"📤 Очередь отправки запущена ({self.workers} обработчиков)")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job in self._queue:
+            if not job.future.done():
+                job.future.cancel()
+        self._queue = []
+
+    async def submit(self, chat_id: int, factory: Callable[[], Awaitable[Any]],
+                     priority: int = PRIORITY_SEARCH, max_retries: int = SEND_MAX_RETRIES,
+                     idempotent: bool = False) -> Any:
+        """ Поставить отправку в очередь и дождаться результата (исключение пробрасывается)
+
+        max_retries - число попыток; idempotent = True разрешает повтор после TimedOut
+        (повторная отправка не создаст дубль, например edit_message_text).
+        """
+        self.start()
+        job = OutboundJob(chat_id, factory, priority, next(self._seq), max_retries, idempotent)
+        await self._enqueue(job)
+        return await job.future
+
+    async def _enqueue(self, job: OutboundJob):
+        async with self._condition:
+            heapq.heappush(self._queue, job)
+            self._condition.notify()
+
+    def _block_chat(self, chat_id: int, seconds: float):
+        """ Пауза отправки в чат (более длинная пауза не сокращается) """
+        until = time.monotonic() + seconds
+        self._chat_blocked_until[chat_id] = max(self._chat_blocked_until.get(chat_id, 0.0), until)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(SEND_CHAT_RATE, SEND_CHAT_BURST)
+        return bucket
+
+    def _pick(self) -> tuple:
+        """ Самое приоритетное задание, которое можно отправить сейчас, или время ожидания
+
+        Задания снимаются с кучи по приоритету до первого отправляемого; пропущенные
+        (чат занят или на паузе) возвращаются в кучу. Пока пуст глобальный запас,
+        куча не просматривается.
+        """
+        if not self._queue:
+            return None, None
+        global_delay = self._global.delay()
+        if global_delay > 0:
+            return None, global_delay
+
+        now = time.monotonic()
+        wait = None
+        picked = None
+        skipped = []
+        unavailable = set()
+        while self._queue:
+            job = heapq.heappop(self._queue)
+            if job.future.done():
+                # отправитель перестал ждать (отмена) - задание снимается
+                continue
+            if job.chat_id in unavailable or job.chat_id in self._busy_chats:
+                skipped.append(job)
+                continue
+            delay = max(self._chat_blocked_until.get(job.chat_id, 0.0) - now,
+                        self._chat_bucket(job.chat_id).delay())
+            if delay <= 0:
+                picked = job
+                break
+            unavailable.add(job.chat_id)
+            skipped.append(job)
+            wait = delay if wait is None else min(wait, delay)
+        for job in skipped:
+            heapq.heappush(self._queue, job)
+        return picked, wait
+
+    async def _next_job(self) -> OutboundJob:
+        async with self._condition:
+            while True:
+                job, wait = self._pick()
+                if job is not None:
+                    self._busy_chats.add(job.chat_id)
+                    self._chat_bucket(job.chat_id).take()
+                    self._global.take()
+                    return job
+                try:
+                    await asyncio.wait_for(self._condition.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _worker(self):
+        while True:
+            job = await self._next_job()
+            try:
+                await self._send(job)
+            finally:
+                async with self._condition:
+                    self._busy_chats.discard(job.chat_id)
+                    self._forget_idle_chats()
+                    self._condition.notify_all()
+
+    async def _send(self, job: OutboundJob):
+        """ Одна попытка отправки; повтор - через очередь, обработчик не ждет паузу чата """
+        if job.future.done():
+            return
+        job.attempts += 1
+        try:
+            result = await job.factory()
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            seconds = retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+            self.flood_waits += 1
+            self._block_chat(job.chat_id, seconds)
+            logger.warning(f"⏳ Flood control для чата {job.chat_id}: пауза {seconds:.0f}с")
+            await self._retry_or_fail(job, e)
+        except TimedOut as e:
+            if not job.idempotent:
+                # запрос мог быть доставлен - повтор отправил бы сообщение/файл второй раз
+                self._fail(job, e)
+                return
+            delay = 2 ** (job.attempts - 1)
+            if job.attempts < job.max_retries:
+                logger.warning(f"⚠️ Таймаут отправки в чат {job.chat_id}, повтор через {delay}с "
+                               f"({job.attempts}/{job.max_retries})")
+                self._block_chat(job.chat_id, delay)
+            await self._retry_or_fail(job, e)
+        except Exception as e:
+            self._fail(job, e)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+
+    async def _retry_or_fail(self, job: OutboundJob, error: Exception):
+        """ Возврат задания в очередь (seq прежний - порядок чата сохраняется) или ошибка отправителю """
+        if job.attempts < job.max_retries and not job.future.done():
+            await self._enqueue(job)
+        else:
+            self._fail(job, error)
+
+    def _fail(self, job: OutboundJob, error: Exception):
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    def _forget_idle_chats(self):
+        """ Забываем чаты без очереди, с полным запасом и без паузы (не чаще раза в минуту - обход всей очереди) """
+        now = time.monotonic()
+        if len(self._chat_buckets) < 1000 or now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        queued = {job.chat_id for job in self._queue} | self._busy_chats
+        for chat_id in [cid for cid, bucket in self._chat_buckets.items() if cid not in queued and bucket.is_full()]:
+            if self._chat_blocked_until.get(chat_id, 0.0) <= now:
+                del self._chat_buckets[chat_id]
+                self._chat_blocked_until.pop(chat_id, None)
+
+    def get_stats(self) -> dict:
+        return {'queued': len(self._queue), 'sending': len(self._busy_chats),
+                'sent': self.sent, 'flood_waits': self.flood_waits}
+
+
+outbound = OutboundDispatcher()
@@ -0,0 +1,104 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, List, MutableMapping, Optional
+from config import RESUMES_FOLDER, SEARCH_SESSION_TTL, SEARCH_SESSION_SWEEP_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = 'search_session'
+
+
+class SearchSessionStore:
+    """ Компактные сессии поиска в context.user_data
+
+    Сессия - только идентификаторы документов (имя файла в RESUMES_FOLDER),
+    оценки и имена кандидатов, без текста резюме; живет SEARCH_SESSION_TTL
+    секунд. Хранится в user_data, поэтому сохраняется в SQLitePersistence
+    и переживает перезапуск; фоновая задача удаляет просроченные сессии,
+    чтобы память не росла за счет пользователей, не нажавших кнопку.
+    """
+
+    def __init__(self, ttl: int = SEARCH_SESSION_TTL):
+        self.ttl = ttl
+        self._application = None
+        self._task: Optional[asyncio.Task] = None
+
+    def save(self, user_data: MutableMapping, results: List[Dict]):
+        """ Запомнить результаты поиска (вместо полных словарей - [файл, оценка, кандидат]) """
+        user_data[SESSION_KEY] = {
+            'expires': time.time() + self.ttl,
+            'docs': [
+                [os.path.relpath(result['file_path'], RESUMES_FOLDER),
+                 round(float(result.get('relevance_score', 0)), 4),
+                 result.get('candidate_name') or '']
+                for result in results
+            ]
+        }
+
+    def take(self, user_data: MutableMapping) -> List[Dict]:
+        """ Забрать результаты сессии; просроченная сессия считается пустой """
+        session = user_data.pop(SESSION_KEY, None)
+        if not session or self._is_expired(session, time.time()):
+            return []
+        return [
+            {'file_path': os.path.join(RESUMES_FOLDER, filename), 'relevance_score': score,
+             'candidate_name': candidate_name}
+            for filename, score, candidate_name in session['docs']
+        ]
+
+    def discard(self, user_data: MutableMapping):
+        user_data.pop(SESSION_KEY, None)
+
+    def _is_expired(self, session: Dict, now: float) -> bool:
+        return session.get('expires', 0) <= now
+
+    def evict(self, users: MutableMapping) -> List[int]:
+        """ Удаление просроченных сессий; возвращает id пользователей, чьи данные изменились """
+        now = time.time()
+        evicted = []
+        for user_id, user_data in list(users.items()):
+            session = user_data.get(SESSION_KEY)
+            if session is not None and self._is_expired(session, now):
+                del user_data[SESSION_KEY]
+                evicted.append(user_id)
+        return evicted
+
+    def start(self, application):
+        if self._task is not None:
+            return
+        self._application = application
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"🗂️ Сессии поиска: хранение {self.ttl} сек")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(SEARCH_SESSION_SWEEP_INTERVAL)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"❌ Ошибка очистки сессий поиска: {e}")
+
+    def sweep(self) -> int:
+        """ Очистка user_data приложения: пустые записи удаляются и из памяти, и из persistence """
+        application = self._application
+        evicted = self.evict(application.user_data)
+        for user_id in evicted:
+            if application.user_data.get(user_id):
+                application.mark_data_for_update_persistence(user_ids=user_id)
+            else:
+                application.drop_user_data(user_id)
+        if evicted:
+            logger.info(f"🧹 Удалено просроченных сессий поиска: {len(evicted)}")
+        return len(evicted)
+
+
+search_sessions = SearchSessionStore()
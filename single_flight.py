@@ -0,0 +1,50 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    """ Ключ запроса: регистр и пробелы не различаются """
+    return ' '.join((text or "").lower().replace('ё', 'е').split())
+
+
+class SingleFlight:
+    """ Объединение одинаковых запросов, выполняющихся одновременно
+
+    Первый вызов запускает задачу, остальные с тем же ключом ждут её
+    результат. Задача не привязана к первому вызывающему: его отмена
+    не отменяет поиск для остальных. Результат общий - не изменять на месте.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+            self.started += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"🔗 {self.name}: запрос присоединен к уже выполняющемуся")
+        return await asyncio.shield(task)
+
+    def is_running(self, key: Hashable) -> bool:
+        """ Есть ли выполняющаяся задача с этим ключом (следующий do() к ней присоединится) """
+        return key in self._inflight
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> dict:
+        return {'in_flight': len(self._inflight), 'started': self.started, 'coalesced': self.coalesced}
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """ Параллельная обработка обновлений разных чатов, строго по порядку внутри одного чата
+
+    Семафор PTB (max_pending_updates) ограничивает число принятых в работу
+    обновлений, собственный семафор - число одновременно выполняемых.
+    Блокировка чата берется до глобального семафора, поэтому очередь одного
+    чата не занимает слоты остальных пользователей. Состояние
+    ConversationHandler остается согласованным: обновления одного чата
+    не обгоняют друг друга.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: Optional[int] = None):
+        super().__init__(max_pending_updates or max_concurrent_updates * 10)
+        self.max_running_updates = max_concurrent_updates
+        self._running = asyncio.Semaphore(max_concurrent_updates)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_waiters: Dict[int, int] = {}
+
+    @staticmethod
+    def _ordering_key(update: object) -> Optional[int]:
+        """ Чат обновления (или пользователь, если чата нет) """
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._ordering_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        lock = self._chat_locks.get(key)
+        if lock is None:
+            lock = self._chat_locks[key] = asyncio.Lock()
+        self._chat_waiters[key] = self._chat_waiters.get(key, 0) + 1
+        try:
+            # asyncio.Lock будит ожидающих в порядке очереди - порядок обновлений сохраняется
+            async with lock:
+                async with self._running:
+                    await coroutine
+        finally:
+            self._chat_waiters[key] -= 1
+            if not self._chat_waiters[key]:
+                del self._chat_waiters[key]
+                del self._chat_locks[key]
+
+    @property
+    def active_chats(self) -> int:
+        """ Чаты с обновлениями в работе или в очереди """
+        return len(self._chat_locks)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
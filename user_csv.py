@@ -0,0 +1,139 @@
+import csv
+import io
+import os
+import tempfile
+import logging
+from typing import Dict, List, Tuple
+from auth import user_manager
+from config import USER_IMPORT_MAX_ROWS, USER_EXPORT_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Колонки импорта: обязателен только telegram_id, остальные берут значения по умолчанию
+# (порядок колонок для файла без заголовка - как в ручном добавлении: ID, запросы, дни, резюме)
+IMPORT_DEFAULTS = {
+    'daily_requests_limit': 10,
+    'access_days': 30,
+    'resumes_limit': 0,
+    'username': '',
+    'first_name': '',
+    'last_name': '',
+}
+IMPORT_INT_COLUMNS = ('daily_requests_limit', 'access_days', 'resumes_limit')
+IMPORT_COLUMNS = ('telegram_id',) + tuple(IMPORT_DEFAULTS)
+
+EXPORT_COLUMNS = (
+    'telegram_id', 'username', 'first_name', 'last_name', 'role', 'status',
+    'daily_requests_limit', 'resumes_limit', 'access_expires', 'created_at', 'last_login',
+    'requests_today', 'resumes_today', 'resumes_this_month', 'resumes_total',
+)
+
+
+def _decode(data: bytes) -> str:
+    """ CSV из Excel бывает в UTF-8 с BOM или в cp1251 """
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return data.decode('cp1251')
+
+
+def parse_users_csv(data: bytes) -> Tuple[List[Dict], List[str]]:
+    """ Разбор и проверка CSV для импорта
+
+    Возвращает (корректные записи, ошибки по строкам). Строки с ошибками и
+    повторы telegram_id в файле пропускаются, остальные можно импортировать.
+    """
+    text = _decode(data)
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+
+    reader = csv.reader(io.StringIO(text), dialect)
+    header = next(reader, None)
+    if header is None:
+        return [], ["Файл пустой"]
+
+    columns = [column.strip().lower() for column in header]
+    if 'telegram_id' not in columns:
+        # файл без заголовка: колонки по порядку IMPORT_COLUMNS
+        columns = list(IMPORT_COLUMNS[:len(header)])
+        reader = csv.reader(io.StringIO(text), dialect)
+
+    unknown = [column for column in columns if column not in IMPORT_COLUMNS]
+    if unknown:
+        return [], [f"Неизвестные колонки: {', '.join(unknown)}"]
+
+    records, errors, seen = [], [], set()
+    for row in reader:
+        line = reader.line_num
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(records) + len(errors) >= USER_IMPORT_MAX_ROWS:
+            errors.append(f"Строка {line}: превышен лимит {USER_IMPORT_MAX_ROWS} строк, остаток файла пропущен")
+            break
+        if len(row) > len(columns):
+            errors.append(f"Строка {line}: лишние значения")
+            continue
+
+        values = dict(zip(columns, (cell.strip() for cell in row)))
+        record = dict(IMPORT_DEFAULTS)
+        try:
+            record['telegram_id'] = int(values.get('telegram_id', ''))
+            if record['telegram_id'] <= 0:
+                raise ValueError
+        except ValueError:
+            errors.append(f"Строка {line}: некорректный telegram_id '{values.get('telegram_id', '')}'")
+            continue
+
+        bad_column = None
+        for column in IMPORT_INT_COLUMNS:
+            if values.get(column):
+                try:
+                    record[column] = int(values[column])
+                except ValueError:
+                    record[column] = -1
+                if record[column] < 0:
+                    bad_column = column
+                    break
+        if bad_column:
+            errors.append(f"Строка {line}: {bad_column} должно быть целым числом ≥ 0")
+            continue
+
+        if record['telegram_id'] in seen:
+            errors.append(f"Строка {line}: telegram_id {record['telegram_id']} повторяется")
+            continue
+        seen.add(record['telegram_id'])
+
+        for column in ('username', 'first_name', 'last_name'):
+            if values.get(column):
+                record[column] = values[column].lstrip('@') if column == 'username' else values[column]
+        records.append(record)
+
+    return records, errors
+
+
+async def export_users_csv() -> Tuple[str, int]:
+    """ Выгрузка пользователей и использования во временный CSV порциями
+
+    Возвращает (путь к файлу, число строк); файл удаляет вызывающий.
+    """
+    fd, path = tempfile.mkstemp(prefix='users_', suffix='.csv')
+    count = 0
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8-sig', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(EXPORT_COLUMNS)
+            async for users in user_manager.iter_users_async(USER_EXPORT_CHUNK_SIZE):
+                writer.writerows([_export_value(user[column]) for column in EXPORT_COLUMNS] for user in users)
+                count += len(users)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    logger.info(f"📤 Экспорт пользователей: {count} строк")
+    return path, count
+
+
+def _export_value(value):
+    return '' if value is None else value